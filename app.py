@@ -1,495 +1,176 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, current_app
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, login_required, current_user
-from flask_migrate import Migrate
-from werkzeug.security import check_password_hash
-from datetime import datetime
+from flask import Flask, render_template
+from sqlalchemy.orm import joinedload
 import os
-from dotenv import load_dotenv
-import random
-from functools import wraps
-from models import db, User, Unit, Incident, Zone, Center
-from routes.auth import auth
-from routes.incidents import incidents
-from routes.units import units
-from routes.users import users
-from routes.database_admin import database_admin
-from routes.water_quality import water_quality
-from routes.documentation import documentation
-from routes.landing import landing
-from extensions import cache  # Import cache from extensions
-from utils.incident_utils import get_user_incident_counts  # Import from new utils module
-from routes.spark_agent_routes import spark_agent
-from routes.main_dashboard import main_dashboard
-from routes.departement import departement  # Add this import
-from routes.centers import centers
-from routes.bilan_routes import bilan_bp
-from routes.infrastructures import infrastructures_bp
-from flask.cli import with_appcontext
-import click
-from utils.url_endpoints import *  # Import all URL endpoints
-from utils.permissions import PermissionManager, Permission, UserRole
-
-# Load environment variables
-load_dotenv()
-
-# Logging configuration
-import logging
-logging.basicConfig(level=logging.DEBUG, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler('ona_debug.log'),
-                        logging.StreamHandler()
-                    ])
-
-# Initialize Flask app
-app = Flask(__name__, static_folder='static')
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///OnaDB.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize cache with app after creating the app
-cache.init_app(app)
-
-# Initialize extensions
-db.init_app(app)
-migrate = Migrate(app, db)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
-login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
-login_manager.login_message_category = 'warning'
-
-# Register blueprints
-app.register_blueprint(auth)
-app.register_blueprint(incidents)
-app.register_blueprint(units)
-app.register_blueprint(users)
-app.register_blueprint(database_admin)
-app.register_blueprint(water_quality)
-app.register_blueprint(documentation)
-app.register_blueprint(landing)
-app.register_blueprint(spark_agent)
-app.register_blueprint(main_dashboard)
-app.register_blueprint(departement)
-app.register_blueprint(centers)
-app.register_blueprint(bilan_bp)
-app.register_blueprint(infrastructures_bp)
-
-@app.cli.command("init-db")
-@with_appcontext
-def init_db_command():
-    """Initialize the database.
-    
-    This method provides two initialization strategies:
-    1. Standard SQLAlchemy table creation
-    2. Optional custom initialization script
+from models import db, User
+from extensions import cache, login_manager
+from utils.permissions import UserRole
+from utils.uploads import StreamingUploadRequest
+from utils.logging_config import configure_logging
+from utils.query_stats import init_query_stats
+from utils.sqlite_settings import init_sqlite
+from utils.profiling import init_profiling
+from utils.metrics import init_metrics
+
+# Blueprints, as (module, attribute) pairs, imported when an application is created
+BLUEPRINTS = (
+    ('routes.auth', 'auth'),
+    ('routes.incidents', 'incidents'),
+    ('routes.units', 'units'),
+    ('routes.users', 'users'),
+    ('routes.database_admin', 'database_admin'),
+    ('routes.water_quality', 'water_quality'),
+    ('routes.documentation', 'documentation'),
+    ('routes.landing', 'landing'),
+    ('routes.spark_agent_routes', 'spark_agent'),
+    ('routes.main_dashboard', 'main_dashboard'),
+    ('routes.departement', 'departement'),
+    ('routes.centers', 'centers'),
+    ('routes.bilan_routes', 'bilan_bp'),
+    ('routes.infrastructures', 'infrastructures_bp'),
+    ('routes.profiling', 'profiling'),
+    ('routes.metrics', 'metrics'),
+)
+
+def create_app(config=None):
     """
-    # Standard table creation
-    db.create_all()
-    click.echo('Created database tables.')
-    
-    # Optional: Run custom initialization script if available
-    try:
-        from scripts.init_db import init_database
-        init_database()
-        click.echo('Ran custom database initialization script.')
-    except ImportError:
-        click.echo('No custom initialization script found.')
-
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    Create and configure the application.
 
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not UserRole.has_permission(current_user.role, 'can_view_all_incidents'):
-            flash('Vous devez être administrateur pour accéder à cette page.', 'danger')
-            return redirect(url_for('incidents.list'))
-        return f(*args, **kwargs)
-    return decorated_function
+    Nothing is read from the environment and no blueprint is imported until
+    this is called, so importing this module stays cheap. The heavy
+    dependencies (reportlab, Pillow, requests, openpyxl, numpy) are only imported by
+    the views that use them, on first use.
 
-def unit_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Exempt certain roles from unit requirement
-        if current_user.role in [UserRole.EMPLOYEUR_ZONE, UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
-            return f(*args, **kwargs)
-        
-        # Check if user has a unit
-        if not current_user.unit_id:
-            flash('Vous devez sélectionner une unité avant de continuer.', 'warning')
-            return redirect(url_for('select_unit'))
-        
-        return f(*args, **kwargs)
-    return decorated_function
+    Args:
+        config (dict): Settings applied over the environment defaults,
+                       e.g. {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'}
 
-@app.route('/invalidate_incident_cache', methods=['POST'])
-@login_required
-def invalidate_incident_cache():
-    """
-    Endpoint to manually invalidate incident count cache.
-    Useful after creating, updating, or deleting incidents.
+    Returns:
+        Flask: The application
     """
-    if current_user.role not in [UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
-        flash('Unauthorized to invalidate cache', 'error')
-        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
-    
-    # Clear all keys starting with 'incident_counts_'
-    cache.delete_memoized(get_user_incident_counts)
-    
-    flash('Incident count cache has been invalidated', 'success')
-    return jsonify({'status': 'success', 'message': 'Cache invalidated'}), 200
-
-@app.route('/services')
-@login_required
-def services():
-    return render_template('services.html')
-
-@app.route('/exploitation')
-@login_required
-def exploitation():
-    return render_template('departement/exploitation.html')
-
-@app.route('/departements')
-@login_required
-def departements():
-    return render_template('departement/departement.html')
-
-REUSE_SECTIONS = {
-    'introduction': 'departement/reuse/introduction.html',
-    'regulations': 'departement/reuse/regulations.html',
-    'methods': 'departement/reuse/methods.html',
-    'case-studies': 'departement/reuse/case_studies.html',
-    'documentation': 'departement/reuse/documentation.html'
-}
-
-@app.route('/departements/reuse')
-@login_required
-def reuse():
-    return redirect(url_for('reuse_section', section='introduction'))
-
-@app.route('/departements/reuse/<section>')
-@login_required
-def reuse_section(section):
-    if section not in REUSE_SECTIONS:
-        flash('Section non trouvée.', 'danger')
-        return redirect(url_for('reuse_section', section='introduction'))
-    
-    template = REUSE_SECTIONS[section]
-    return render_template(template, active_page=section)
-
-@app.route('/departements/reuse/rapports')
-@login_required
-def rapports():
-    
-    # Get the count of incidents (you can modify this based on your needs)
-    incident_counts = get_user_incident_counts(current_user)
-    incidents_count = incident_counts['total_incidents']
-    return render_template('departement/rapports.html', incidents_count=incidents_count)
-
-
-@app.route('/zones')
-@login_required
-def list_zones():
-    zones = Zone.query.all()
-    return render_template('admin/zones.html', zones=zones)
-
-@app.route('/centers')
-@login_required
-def list_centers():
-    # If user is admin, show all centers
-    if current_user.role == UserRole.ADMIN:
-        centers = Center.query.all()
-        zones = Zone.query.all()
-    # If user is Unit Officer, show only centers in their unit
-    elif current_user.assigned_unit:
-        centers = Center.query.filter_by(unit_id=current_user.assigned_unit.id).all()
-        zones = []
-    else:
-        centers = []
-        zones = []
-    return render_template('admin/centers.html', centers=centers, zones=zones)
-
-@app.route('/zones/create', methods=['POST'])
-@login_required
-def create_zone():
-    if current_user.role != UserRole.ADMIN:
-        flash('Accès non autorisé.', 'danger')
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    try:
-        zone = Zone(
-            code=request.form['code'],
-            name=request.form['name'],
-            description=request.form['description'],
-            address=request.form['address'],
-            phone=request.form['phone'],
-            email=request.form['email']
-        )
-        db.session.add(zone)
-        db.session.commit()
-        flash('Zone créée avec succès.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Erreur lors de la création de la zone: {str(e)}', 'danger')
-    
-    return redirect(url_for('list_zones'))
-
-@app.route('/zones/edit/<int:id>', methods=['POST'])
-@login_required
-def edit_zone(id):
-    if current_user.role != UserRole.ADMIN:
-        flash('Accès non autorisé.', 'danger')
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    zone = Zone.query.get_or_404(id)
-    try:
-        zone.code = request.form['code']
-        zone.name = request.form['name']
-        zone.description = request.form['description']
-        zone.address = request.form['address']
-        zone.phone = request.form['phone']
-        zone.email = request.form['email']
-        db.session.commit()
-        flash('Zone mise à jour avec succès.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Erreur lors de la mise à jour de la zone: {str(e)}', 'danger')
-    
-    return redirect(url_for('main_dashboard.dashboard'))
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    # Logging configuration: background writer, rotation and levels from the environment
+    configure_logging()
+
+    # Initialize Flask app
+    app = Flask(__name__, static_folder='static')
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///OnaDB.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Upload limits: whole request body and each uploaded file, both enforced while streaming
+    app.request_class = StreamingUploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))
+    app.config['UPLOAD_MAX_FILE_SIZE'] = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 10 * 1024 * 1024))
+
+    # Uploaded files, outside the static folder (defaults to instance/uploads, see utils.blob_store)
+    app.config['UPLOAD_DIR'] = os.getenv('UPLOAD_DIR')
+
+    # Uploaded file delivery offloaded to the front proxy (see utils.file_serving):
+    # X-Sendfile for Apache/lighttpd, X-Accel-Redirect to an internal nginx location
+    app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+    app.config['X_ACCEL_REDIRECT_PREFIX'] = os.getenv('X_ACCEL_REDIRECT_PREFIX')
+
+    # SQLite write-ahead logging, so that reads never wait for a write (see utils.sqlite_settings)
+    app.config['SQLITE_WAL'] = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+
+    # Database backups written by 'flask backup-db' (defaults to instance/backups)
+    app.config['BACKUP_DIR'] = os.getenv('BACKUP_DIR')
+    app.config['BACKUP_RETENTION'] = int(os.getenv('BACKUP_RETENTION', 7))
+
+    # SQL statement timings (see utils.query_stats): statements above the threshold
+    # are persisted to slow_queries, the latest QUERY_LOG_SIZE ones are kept in memory
+    app.config['QUERY_STATS_ENABLED'] = os.getenv('QUERY_STATS_ENABLED', 'true').lower() == 'true'
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 100))
+    app.config['QUERY_LOG_SIZE'] = int(os.getenv('QUERY_LOG_SIZE', 500))
+    # Per-request query counts: Server-Timing header, and a warning in the log for a
+    # statement repeated N_PLUS_ONE_THRESHOLD times with different parameters
+    app.config['SERVER_TIMING_ENABLED'] = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+    # Request profiling (see utils.profiling): on demand for admins with ?_profile=1,
+    # and for a random PROFILE_SAMPLE_RATE share of requests (0.01 = 1%)
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR')
+    app.config['PROFILE_RETENTION'] = int(os.getenv('PROFILE_RETENTION', 200))
+
+    # Prometheus metrics at /metrics (see utils.metrics). METRICS_DIR is a directory
+    # shared by the worker processes, PROMETHEUS_MULTIPROC_DIR is honoured as well
+    app.config['METRICS_DIR'] = os.getenv('METRICS_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+    # Bearer token of the scraper; without it /metrics only answers local requests
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+    if config:
+        app.config.from_mapping(config)
+
+    # Initialize cache with app after creating the app
+    cache.init_app(app)
+
+    # Initialize extensions
+    db.init_app(app)
+    init_sqlite(app)
+    init_query_stats(app)
+    init_profiling(app)
+    init_metrics(app, cache)
+    # Flask-Migrate pulls in alembic, only the 'flask db' commands need it
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    login_manager.init_app(app)
+    login_manager.user_loader(load_user)
+    login_manager.login_view = 'auth.login'
+    login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
+    login_manager.login_message_category = 'warning'
+
+    # Register blueprints
+    from importlib import import_module
+    for module_name, attribute in BLUEPRINTS:
+        app.register_blueprint(getattr(import_module(module_name), attribute))
+
+    from routes.core import register_core_routes
+    from commands import register_commands
+    register_core_routes(app)
+    register_commands(app)
+    register_error_handlers(app)
+    return app
 
-@app.route('/zones/delete/<int:id>', methods=['POST'])
-@login_required
-def delete_zone(id):
-    if current_user.role != UserRole.ADMIN:
-        flash('Accès non autorisé.', 'danger')
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    try:
-        zone = Zone.query.get_or_404(id)
-        
-        # Delete all units in the zone first
-        for unit in zone.units:
-            # Delete all centers in each unit
-            for center in unit.centers:
-                db.session.delete(center)
-            db.session.delete(unit)
-        
-        # Finally delete the zone
-        db.session.delete(zone)
-        db.session.commit()
-        flash('Zone supprimée avec succès.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Erreur lors de la suppression de la zone: {str(e)}', 'danger')
-    
-    return redirect(url_for('main_dashboard.dashboard'))
-
-@app.route('/centers/create', methods=['POST'])
-@login_required
-def create_center():
-    if current_user.role not in [UserRole.ADMIN, UserRole.UNIT_OFFICER]:
-        flash('Accès non autorisé.', 'danger')
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    try:
-        # If Unit Officer, use their unit_id
-        unit_id = current_user.unit_id if current_user.role == UserRole.UNIT_OFFICER else request.form['unit_id']
-        
-        center = Center(
-            name=request.form['name'],
-            description=request.form['description'],
-            address=request.form['address'],
-            phone=request.form['phone'],
-            email=request.form['email'],
-            unit_id=unit_id
-        )
-        db.session.add(center)
-        db.session.commit()
-        flash('Centre créé avec succès.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Erreur lors de la création du centre: {str(e)}', 'danger')
-    
-    return redirect(url_for('main_dashboard.dashboard'))
-
-@app.route('/centers/edit/<int:id>', methods=['POST'])
-@login_required
-def edit_center(id):
-    center = Center.query.get_or_404(id)
-    
-    # Check permissions
-    if current_user.role == UserRole.UNIT_OFFICER and center.unit_id != current_user.unit_id:
-        flash('Accès non autorisé.', 'danger')
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    try:
-        center.name = request.form['name']
-        center.description = request.form['description']
-        center.address = request.form['address']
-        center.phone = request.form['phone']
-        center.email = request.form['email']
-        if current_user.role == UserRole.ADMIN:
-            center.unit_id = request.form['unit_id']
-        db.session.commit()
-        flash('Centre mis à jour avec succès.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Erreur lors de la mise à jour du centre: {str(e)}', 'danger')
-    
-    return redirect(url_for('main_dashboard.dashboard'))
-
-@app.route('/centers/delete/<int:id>', methods=['POST'])
-@login_required
-def delete_center(id):
-    center = Center.query.get_or_404(id)
-    
-    # Check permissions
-    if current_user.role == UserRole.UNIT_OFFICER and center.unit_id != current_user.unit_id:
-        flash('Accès non autorisé.', 'danger')
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    try:
-        db.session.delete(center)
-        db.session.commit()
-        flash('Centre supprimé avec succès.', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash(f'Erreur lors de la suppression du centre: {str(e)}', 'danger')
-    
-    return redirect(url_for('main_dashboard.dashboard'))
-
-@app.route('/select-unit', methods=['GET', 'POST'])
-@login_required
-def select_unit():
-    # Exempt certain roles from unit selection
-    if current_user.role in [UserRole.EMPLOYEUR_ZONE, UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    # If user has no zone, they need to be assigned first
-    if not current_user.zone_id:
-        flash("Vous devez d'abord être assigné à une zone par un administrateur.", "warning")
-        return redirect(url_for('main_dashboard.dashboard'))
-    
-    if request.method == 'POST':
-        zone_id = request.form.get('zone')
-        unit_id = request.form.get('unit_id')
-        
-        if not zone_id or not unit_id:
-            flash("Veuillez sélectionner une zone et une unité.", "warning")
-            return redirect(url_for('select_unit'))
-            
-        # Verify the unit belongs to the selected zone
-        unit = Unit.query.get(unit_id)
-        if not unit or str(unit.zone_id) != zone_id:
-            flash("Unité invalide sélectionnée.", "danger")
-            return redirect(url_for('select_unit'))
-            
-        # Update user's unit
-        current_user.unit_id = unit_id
-        db.session.commit()
-        
-        flash(f"Vous êtes maintenant connecté à l'unité: {unit.name}", "success")
-        return redirect(url_for('main_dashboard.dashboard'))
-        
-    # GET request - show selection form
-    zones = [Zone.query.get(current_user.zone_id)]
-    
-    # Get units for the zone
-    units = Unit.query.filter_by(zone_id=current_user.zone_id).all()
-    
-    return render_template('select_unit.html', zones=zones, units=units)
-
-@app.route('/api/units/<int:zone_id>')
-@login_required
-def get_zone_units(zone_id):
-    """
-    API endpoint to retrieve units for a specific zone.
-    
-    Permissions:
-    - Admin and DG can view all units
-    - Zone employers can view units in their assigned zone
-    - Other roles are restricted
-    """
-    # Check if user has permission to view units
-    if not PermissionManager.has_permission(current_user.role, Permission.VIEW_ALL_UNITS):
-        # For non-admin/DG roles, only allow access to their own zone
-        if current_user.zone_id != zone_id:
-            return jsonify({
-                'error': 'Accès non autorisé',
-                'status': 'forbidden'
-            }), 403
-    
-    # Retrieve units for the specified zone
-    try:
-        units = Unit.query.filter_by(zone_id=zone_id).all()
-        
-        # Convert units to a list of dictionaries
-        units_list = [
-            {
-                'id': unit.id, 
-                'name': unit.name, 
-                'code': unit.code
-            } for unit in units
-        ]
-        
-        return jsonify({
-            'units': units_list,
-            'total_units': len(units_list),
-            'status': 'success'
-        })
-    
-    except Exception as e:
-        # Log the error for debugging
-        current_app.logger.error(f"Error retrieving units for zone {zone_id}: {str(e)}")
-        
-        return jsonify({
-            'error': 'Erreur lors de la récupération des unités',
-            'status': 'error'
-        }), 500
-
-@app.route('/login')
-def login():
-    return render_template('auth/login.html')
-
-@app.route('/new-incident')
-@login_required
-def new_incident():
-    return render_template('incidents/new_incident.html')
-
-@app.route('/docs')
-def serve_docs():
-    return send_file('docs/index.html')
-
-@app.route('/spark-agent')
-@login_required
-def spark_agent():
-    return render_template('sparkagent/spark_agent.html')
+def load_user(user_id):
+    # The base template shows the user's unit on every page
+    return db.session.get(User, int(user_id), options=[
+        joinedload(User.assigned_unit),
+        joinedload(User.assigned_zone)
+    ])
 
 # Add error handling for common HTTP errors and exceptions
-@app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/error.html', error_code=404, error_message="Page non trouvée"), 404
 
-@app.errorhandler(500)
 def internal_error(error):
     import traceback
     error_details = traceback.format_exc()
     return render_template('errors/error.html', error_code=500, error_message="Erreur interne du serveur", error_details=error_details), 500
 
-@app.errorhandler(403)
 def forbidden_error(error):
     return render_template('errors/error.html', error_code=403, error_message="Accès non autorisé"), 403
 
-@app.errorhandler(Exception)
 def handle_exception(error):
     import traceback
     error_details = traceback.format_exc()
     return render_template('errors/error.html', error_code=500, error_message="Une erreur inattendue s'est produite", error_details=error_details), 500
 
+def register_error_handlers(app):
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, internal_error)
+    app.register_error_handler(403, forbidden_error)
+    app.register_error_handler(Exception, handle_exception)
+
 if __name__ == '__main__':
+    app = create_app()
+
     # Create default admin user if it doesn't exist
     with app.app_context():
         admin_user = User.query.filter_by(username='admin').first()
@@ -0,0 +1,221 @@
+"""
+Command line commands (flask <command>), added to the application by create_app().
+"""
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Initialize the database.
+    
+    This method provides two initialization strategies:
+    1. Standard SQLAlchemy table creation
+    2. Optional custom initialization script
+    """
+    # Standard table creation
+    db.create_all()
+    click.echo('Created database tables.')
+    
+    # Optional: Run custom initialization script if available
+    try:
+        from scripts.init_db import init_database
+        init_database()
+        click.echo('Ran custom database initialization script.')
+    except ImportError:
+        click.echo('No custom initialization script found.')
+
+@click.command("gc-files")
+@click.option('--min-age', default=3600, show_default=True, help='Keep files modified less than this many seconds ago.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+@with_appcontext
+def gc_files_command(min_age, dry_run):
+    """Remove unreferenced blobs and stray uploaded files."""
+    from utils.blob_store import collect_garbage
+    summary = collect_garbage(min_age=min_age, dry_run=dry_run)
+    for path in summary['files_removed']:
+        click.echo(f"{'Would remove' if dry_run else 'Removed'} {path}")
+    click.echo(f"Blobs removed: {summary['blobs_removed']}, "
+               f"files removed: {len(summary['files_removed'])}, "
+               f"bytes freed: {summary['bytes_freed']}")
+
+@click.command("relocate-uploads")
+@click.option('--dry-run', is_flag=True, help='Only report what would be moved.')
+@with_appcontext
+def relocate_uploads_command(dry_run):
+    """Move the files uploaded by earlier versions out of static/uploads."""
+    from utils.blob_store import relocate_legacy_uploads
+    summary = relocate_legacy_uploads(dry_run=dry_run)
+    for path in summary['files_moved']:
+        click.echo(f"{'Would move' if dry_run else 'Moved'} {path}")
+    for path in summary['files_left']:
+        click.echo(f"Left in place (not referenced by this database) {path}")
+    click.echo(f"Files moved: {len(summary['files_moved'])}, "
+               f"files left: {len(summary['files_left'])}, "
+               f"rows updated: {summary['rows_updated']}")
+
+@click.command("import-infrastructures")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows written per batch.')
+@click.option('--dry-run', is_flag=True, help='Validate the file without saving anything.')
+@with_appcontext
+def import_infrastructures_command(path, batch_size, dry_run):
+    """Bulk import infrastructures from a CSV, JSON, JSON Lines or XLSX file."""
+    from utils.infrastructure_import import import_infrastructures, detect_format, ImportFormatError
+    try:
+        file_format = detect_format(path)
+        with open(path, 'rb') as stream:
+            report = import_infrastructures(stream, file_format, batch_size=batch_size, dry_run=dry_run)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    for error in report['errors']:
+        click.echo(f"Line {error['line']} ({error['nom'] or '?'}): {'; '.join(error['errors'])}", err=True)
+    click.echo(f"Created: {report['created']}, updated: {report['updated']}, "
+               f"skipped: {report['skipped']}, errors: {report['error_count']}"
+               f"{' (dry run)' if dry_run else ''}")
+
+@click.command("backup-db")
+@click.option('--format', 'fmt', type=click.Choice(['zstd', 'gzip']), help='Compression (zstd when installed).')
+@click.option('--keep', type=int, help='Backups to keep (defaults to BACKUP_RETENTION).')
+@click.option('--verify', is_flag=True, help='Run an integrity check on the new backup.')
+@click.option('--every', type=float, help='Keep running and take a backup every N hours.')
+@with_appcontext
+def backup_db_command(fmt, keep, verify, every):
+    """Write a rotating online backup of the SQLite database.
+
+    Run it from cron, or as a long-lived process with --every.
+    """
+    from utils.db_backup import create_backup, rotate_backups, verify_backup, BackupError
+    keep = keep if keep is not None else current_app.config['BACKUP_RETENTION']
+    while True:
+        try:
+            backup_path = create_backup(fmt=fmt)
+            click.echo(f"Backup written to {backup_path}")
+            if verify:
+                result = verify_backup(backup_path)
+                click.echo(f"Integrity check: {', '.join(result['messages'])}")
+                if not result['ok']:
+                    raise click.ClickException(f"Backup {backup_path} failed the integrity check")
+            for path in rotate_backups(keep):
+                click.echo(f"Removed old backup {path}")
+        except BackupError as e:
+            raise click.ClickException(str(e))
+        if not every:
+            break
+        time.sleep(every * 3600)
+
+@click.command("verify-backup")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def verify_backup_command(path):
+    """Restore a backup to a temporary file and run PRAGMA integrity_check on it."""
+    from utils.db_backup import verify_backup, BackupError
+    try:
+        result = verify_backup(path)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    for message in result['messages']:
+        click.echo(message)
+    click.echo(f"Tables: {result['table_count']}")
+    if not result['ok']:
+        raise click.ClickException('Integrity check failed')
+
+@click.command("generate-data")
+@click.option('--zones', default=10, show_default=True, help='Zones created.')
+@click.option('--units-per-zone', default=8, show_default=True, help='Units per zone.')
+@click.option('--centers-per-unit', default=3, show_default=True, help='Centers per unit.')
+@click.option('--users-per-unit', default=5, show_default=True, help='Users per unit, besides its director.')
+@click.option('--incidents', default=100000, show_default=True, help='Incidents created.')
+@click.option('--infrastructures', default=500, show_default=True, help='Infrastructures created.')
+@click.option('--files-per-infrastructure', default=2, show_default=True, help='PDF files attached to each infrastructure.')
+@click.option('--seed', default=42, show_default=True, help='Random seed, the same seed gives the same data.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows written per batch.')
+@with_appcontext
+def generate_data_command(zones, units_per_zone, centers_per_unit, users_per_unit, incidents,
+                          infrastructures, files_per_infrastructure, seed, batch_size):
+    """Bulk insert a deterministic synthetic dataset for scale testing."""
+    from utils.synthetic_data import generate_dataset, SyntheticDataError, SYNTHETIC_PASSWORD
+    reported = {}
+
+    def progress(table, written, total):
+        # One line per table and about every 10%
+        step = max((total or written) // 10, 1)
+        if written == total or written // step != reported.get(table, -1):
+            reported[table] = written // step
+            click.echo(f"{table}: {written}/{total}")
+
+    db.create_all()
+    try:
+        counts = generate_dataset(
+            zones=zones, units_per_zone=units_per_zone, centers_per_unit=centers_per_unit,
+            users_per_unit=users_per_unit, incidents=incidents, infrastructures=infrastructures,
+            files_per_infrastructure=files_per_infrastructure, seed=seed, batch_size=batch_size,
+            progress=progress
+        )
+    except SyntheticDataError as e:
+        raise click.ClickException(str(e))
+    elapsed = counts.pop('elapsed_seconds')
+    click.echo(', '.join(f"{table}: {count}" for table, count in counts.items()))
+    click.echo(f"Done in {elapsed} s. Generated accounts use the password '{SYNTHETIC_PASSWORD}'.")
+
+@click.command("water-quality-rules")
+@click.option('--load', 'load_path', type=click.Path(exists=True, dir_okay=False),
+              help='Save the rule set of this JSON file as the new active version.')
+@click.option('--comment', help='Comment stored with the version saved by --load.')
+@click.option('--export', 'export_path', type=click.Path(dir_okay=False),
+              help='Write the active rule set to this JSON file.')
+@click.option('--reset', is_flag=True, help='Deactivate every saved version, the built-in rules apply again.')
+@with_appcontext
+def water_quality_rules_command(load_path, comment, export_path, reset):
+    """Show, export or replace the water quality rules (thresholds, grades, crops)."""
+    import json
+    from utils.water_quality import get_rules, describe_norms, save_rule_set, reset_rule_sets, WaterQualityRuleError
+
+    db.create_all()
+    if reset:
+        reset_rule_sets()
+        click.echo('Built-in rules active.')
+    if load_path:
+        with open(load_path, encoding='utf-8') as handle:
+            try:
+                rule_set = json.load(handle)
+            except json.JSONDecodeError as e:
+                raise click.ClickException(f'Invalid JSON: {e}')
+        try:
+            saved = save_rule_set(rule_set, comment=comment)
+        except WaterQualityRuleError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Rule set version {saved.version} saved and active.")
+
+    rules = get_rules()
+    if export_path:
+        with open(export_path, 'w', encoding='utf-8') as handle:
+            json.dump(rules.rule_set, handle, ensure_ascii=False, indent=2)
+        click.echo(f"Rule set version {rules.version} written to {export_path}")
+    click.echo(f"Active rules: version {rules.version}{' (built-in)' if not rules.version else ''}, "
+               f"{len(rules.checks)} checks, grades {', '.join(rules.grades)}")
+    for group_title, lines in describe_norms(rules):
+        click.echo(group_title)
+        for line in lines:
+            click.echo(f"  - {line}")
+
+COMMANDS = (
+    init_db_command,
+    gc_files_command,
+    relocate_uploads_command,
+    import_infrastructures_command,
+    backup_db_command,
+    verify_backup_command,
+    generate_data_command,
+    water_quality_rules_command,
+)
+
+def register_commands(app):
+    for command in COMMANDS:
+        app.cli.add_command(command)
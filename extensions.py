@@ -1,7 +1,11 @@
 from flask_caching import Cache
+from flask_login import LoginManager
 
 # Initialize cache as a global object
 cache = Cache(config={
     'CACHE_TYPE': 'SimpleCache',  # Use in-memory caching
     'CACHE_DEFAULT_TIMEOUT': 300  # Cache for 5 minutes
 })
+
+# Login manager, bound to the app in create_app()
+login_manager = LoginManager()
@@ -0,0 +1,90 @@
+"""
+gunicorn settings (gunicorn --config gunicorn.conf.py), see docs/deployment.md.
+
+The application is imported and the database bootstrapped once in the master
+process, then the workers are forked from it. Each worker serves requests
+from a pool of threads and is replaced after MAX_REQUESTS requests or once
+its memory exceeds WORKER_MAX_RSS_MB.
+"""
+
+import os
+import tempfile
+
+from utils import server
+
+wsgi_app = 'wsgi:app'
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Import the app once, before forking: the workers share its memory pages and start instantly
+preload_app = True
+
+worker_class = 'gthread'
+workers = server.worker_count()
+threads = server.gunicorn_threads()
+
+backlog = server.backlog()
+timeout = server.timeout()
+graceful_timeout = server.timeout()
+keepalive = server.keepalive()
+
+max_requests = server.max_requests()
+max_requests_jitter = server.max_requests_jitter()
+
+# Worker heartbeat files (and default metrics directory) on a tmpfs rather than on disk
+shared_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+worker_tmp_dir = shared_tmp_dir
+
+# Several workers: /metrics must add up the metrics of all of them (see utils.metrics)
+if workers > 1 and not (os.getenv('METRICS_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR')):
+    os.environ['METRICS_DIR'] = os.path.join(shared_tmp_dir, f'ona_metrics_{os.getpid()}')
+
+def on_starting(arbiter):
+    """Master process, once: create the missing tables, drop the metrics of previous runs and receive the workers' logs"""
+    from utils.logging_config import start_log_receiver
+    from utils.metrics import clear_metrics_dir
+
+    app = arbiter.app.wsgi()
+    server.bootstrap_database(app)
+    clear_metrics_dir(app.config.get('METRICS_DIR'))
+    # Several workers: the master alone writes and rotates the log file (see utils.logging_config)
+    if workers > 1:
+        start_log_receiver(shared_tmp_dir)
+
+def post_fork(arbiter, worker):
+    """Worker process, after the fork: threads and connections of the master are not usable here"""
+    from models import db
+    from utils.logging_config import configure_logging, get_log_receiver
+
+    # The background log writer is a thread, which a fork does not copy
+    configure_logging(forward_to=get_log_receiver())
+    with arbiter.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+
+def post_request(worker, req, environ, resp):
+    """Replace the worker once its resident memory grows above WORKER_MAX_RSS_MB"""
+    limit = server.max_rss_mb()
+    if not limit or not worker.alive or worker.nr % server.RSS_CHECK_INTERVAL:
+        return
+    rss = server.rss_mb()
+    if rss is not None and rss > limit:
+        worker.log.warning(f"Worker {worker.pid} uses {rss:.0f} MB (limit {limit} MB), restarting it")
+        worker.alive = False
+
+def child_exit(arbiter, worker):
+    """Master process, once a worker exited: fold its last metrics into the exited workers' totals"""
+    from utils.metrics import retire_snapshot
+
+    retire_snapshot(arbiter.app.wsgi().config.get('METRICS_DIR'), worker.pid)
+
+def worker_exit(arbiter, worker):
+    """Write the last metrics of the worker, they would be lost with it otherwise"""
+    from utils.metrics import flush_metrics
+
+    with arbiter.app.wsgi().app_context():
+        flush_metrics(force=True)
+
+def on_exit(arbiter):
+    """Master process, on shutdown: remove the log receiver's socket"""
+    from utils.logging_config import stop_log_receiver
+
+    stop_log_receiver()
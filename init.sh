@@ -4,16 +4,9 @@
 mkdir -p instance
 chmod 777 instance
 
-# Initialize the database
-python -c "
-from app import app, db
-with app.app_context():
-    db.create_all()
-    print('Database tables created successfully')
-"
-
 # Run database migrations
 flask db upgrade
 
-# Start the application
-exec python wsgi.py
+# Start the application: gunicorn creates the missing tables once in its master
+# process, then forks the workers (see gunicorn.conf.py and docs/deployment.md)
+exec gunicorn --config gunicorn.conf.py
@@ -44,7 +44,8 @@ class Unit(db.Model):
     director_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     
     # Relationships
-    centers = db.relationship('Center', backref='unit', lazy='joined', cascade='all, delete-orphan')
+    # Loaded on access: endpoints listing centers ask for them with selectinload
+    centers = db.relationship('Center', backref='unit', lazy=True, cascade='all, delete-orphan')
     users = db.relationship('User', backref='assigned_unit', lazy=True, foreign_keys='User.unit_id')
     director = db.relationship('User', foreign_keys=[director_id], backref='directed_unit', lazy=True)
     incidents = db.relationship('Incident', backref='unit', lazy=True)
@@ -67,7 +68,7 @@ class Center(db.Model):
     email = db.Column(db.String(120))
     
     # Foreign Keys
-    unit_id = db.Column(db.Integer, db.ForeignKey('units.id', ondelete='CASCADE'), nullable=False)
+    unit_id = db.Column(db.Integer, db.ForeignKey('units.id', ondelete='CASCADE'), nullable=False, index=True)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -105,8 +106,6 @@ class User(UserMixin, db.Model):
         """
         Invalidate all active user sessions by setting is_active to False.
         """
-        from app import db
-        
         # Update all users to be inactive
         cls.query.update({cls.is_active: False})
         db.session.commit()
@@ -225,7 +224,7 @@ class Infrastructure(db.Model):
     nom = db.Column(db.String(200), nullable=False, index=True)
     type = db.Column(db.String(100), nullable=False, index=True)
     localisation = db.Column(db.String(200), nullable=False)
-    capacite = db.Column(db.Float, nullable=False)
+    capacite = db.Column(db.Float, nullable=False, index=True)
     etat = db.Column(db.String(50), nullable=False, default='Opérationnel', index=True)
     epuration_type = db.Column(db.String(100), nullable=True, index=True)
     
@@ -274,10 +273,25 @@ class InfrastructureFile(db.Model):
     
     # Relationship
     infrastructure = db.relationship('Infrastructure', back_populates='infrastructure_files')
+    variants = db.relationship('InfrastructureFileVariant', back_populates='file', lazy=True,
+                               cascade='all, delete-orphan', order_by='InfrastructureFileVariant.width')
     
     def __repr__(self):
         return f'<InfrastructureFile {self.filename}>'
     
+    def get_srcset(self, url_builder):
+        """
+        Build a srcset attribute value from the resized variants of this file.
+        
+        Args:
+            url_builder: Callable returning the URL of a variant (stored
+                         paths are not publicly served)
+        
+        Returns:
+            str: Comma-separated '<url> <width>w' candidates, empty if the file has no variants
+        """
+        return ', '.join(f"{url_builder(variant)} {variant.width}w" for variant in self.variants)
+    
     def get_file_size_human_readable(self):
         """
         Convert file size to human-readable format.
@@ -304,3 +318,218 @@ class InfrastructureFile(db.Model):
             list: List of associated infrastructure files
         """
         return cls.query.filter_by(infrastructure_id=infrastructure_id).all()
+
+class InfrastructureFileVariant(db.Model):
+    """
+    Model representing a resized derivative of an infrastructure image.
+    One row is stored per generated width so templates can build srcset attributes.
+    """
+    __tablename__ = 'infrastructures_files_variants'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Foreign Key
+    file_id = db.Column(db.Integer, db.ForeignKey('infrastructures_files.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    # Variant metadata columns
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    filepath = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    # Relationship
+    file = db.relationship('InfrastructureFile', back_populates='variants')
+    
+    def __repr__(self):
+        return f'<InfrastructureFileVariant {self.width}w {self.filepath}>'
+
+class FileBlob(db.Model):
+    """
+    Model representing a content-addressed file stored once on disk.
+    InfrastructureFile rows point at a blob through its filepath; ref_count
+    tracks how many of them do so the blob can be removed when unused.
+    """
+    __tablename__ = 'file_blobs'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # SHA-256 of the uploaded bytes (before any transcoding)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    
+    # Stored file metadata columns
+    filepath = db.Column(db.String(500), nullable=False, index=True)
+    mime_type = db.Column(db.String(100), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FileBlob {self.sha256[:12]} refs={self.ref_count}>'
+
+class SlowQuery(db.Model):
+    """
+    Model recording a SQL statement that ran longer than the slow query threshold.
+    Rows are written by utils.query_stats at the end of the request that ran it.
+    """
+    __tablename__ = 'slow_queries'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Statement as sent to the database, with its bound parameters as JSON
+    statement = db.Column(db.Text, nullable=False)
+    parameters = db.Column(db.Text, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=False, index=True)
+    
+    # Endpoint (or CLI command) that ran the statement
+    endpoint = db.Column(db.String(200), nullable=True, index=True)
+    
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<SlowQuery {self.duration_ms:.1f}ms {self.statement[:40]}>'
+
+class RequestProfile(db.Model):
+    """
+    Model describing a profiled request.
+    The cProfile statistics are stored as a pstats file in PROFILE_DIR,
+    written by utils.profiling when the request ends.
+    """
+    __tablename__ = 'request_profiles'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Request information
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    endpoint = db.Column(db.String(200), nullable=True, index=True)
+    status_code = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=False, index=True)
+    
+    # Why the request was profiled: 'requested' (admin flag) or 'sampled'
+    trigger = db.Column(db.String(20), nullable=False)
+    
+    # File name of the pstats dump, relative to PROFILE_DIR
+    filename = db.Column(db.String(100), nullable=False)
+    
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<RequestProfile {self.method} {self.path} {self.duration_ms:.0f}ms>'
+
+class WaterQualityRuleSet(db.Model):
+    """
+    Model storing a version of the water quality rule table (grades, limits and
+    crop categories) as JSON, in the format of utils.water_quality.DEFAULT_RULE_SET.
+    A version is never modified: changing the rules saves a new active version.
+    """
+    __tablename__ = 'water_quality_rule_sets'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Version number, increasing, and the rule table
+    version = db.Column(db.Integer, nullable=False, unique=True, index=True)
+    rules = db.Column(db.Text, nullable=False)
+    comment = db.Column(db.String(500), nullable=True)
+    
+    # Only the active version is used for new assessments
+    is_active = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    
+    # Author and timestamp
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<WaterQualityRuleSet v{self.version}{" (active)" if self.is_active else ""}>'
+
+class WaterQualitySample(db.Model):
+    """
+    Model storing a water sample and its measured parameters, taken at a
+    wastewater treatment plant (STEP) or entered without one.
+    Trend queries read the samples of one infrastructure over a date range
+    through the (infrastructure_id, sampled_at) index.
+    """
+    __tablename__ = 'water_quality_samples'
+    __table_args__ = (
+        db.Index('ix_water_quality_samples_infrastructure_sampled_at', 'infrastructure_id', 'sampled_at'),
+    )
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Sampling point, date and laboratory reference
+    infrastructure_id = db.Column(db.Integer, db.ForeignKey('infrastructures.id', ondelete='CASCADE'), nullable=True)
+    sampled_at = db.Column(db.DateTime, nullable=False, index=True)
+    reference = db.Column(db.String(100), nullable=True)
+    
+    # Measured parameters (ids of utils.water_quality.PARAMETERS)
+    coliform_fecal = db.Column(db.Float, nullable=False)
+    nematodes = db.Column(db.Float, nullable=False)
+    ph = db.Column(db.Float, nullable=False)
+    mes = db.Column(db.Float, nullable=False)
+    ce = db.Column(db.Float, nullable=False)
+    dbo5 = db.Column(db.Float, nullable=False)
+    dco = db.Column(db.Float, nullable=False)
+    chlorure = db.Column(db.Float, nullable=False)
+    cadmium = db.Column(db.Float, nullable=False)
+    mercury = db.Column(db.Float, nullable=False)
+    arsenic = db.Column(db.Float, nullable=False)
+    lead = db.Column(db.Float, nullable=False)
+    
+    # Author and timestamp
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    infrastructure = db.relationship('Infrastructure', backref=db.backref('water_quality_samples', lazy='dynamic', passive_deletes=True))
+    assessment = db.relationship('WaterQualityAssessment', back_populates='sample', uselist=False,
+                                 cascade='all, delete-orphan', passive_deletes=True)
+    
+    def __repr__(self):
+        return f'<WaterQualitySample {self.id} {self.sampled_at:%Y-%m-%d}>'
+
+class WaterQualityAssessment(db.Model):
+    """
+    Model storing the assessment of a WaterQualitySample, as computed by
+    utils.water_quality with the rules version it records. Results pages and
+    PDF reports read it instead of assessing the sample again.
+    """
+    __tablename__ = 'water_quality_assessments'
+    
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Assessed sample, one assessment per sample
+    sample_id = db.Column(db.Integer, db.ForeignKey('water_quality_samples.id', ondelete='CASCADE'), nullable=False, unique=True)
+    rules_version = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Ratings: micro 'A'/'B'/'C', physico 'OK'/'FAIL', classification key of RATING_CLASSIFICATIONS
+    micro_rating = db.Column(db.String(10), nullable=False)
+    physico_rating = db.Column(db.String(10), nullable=False)
+    rating = db.Column(db.String(20), nullable=False, index=True)
+    
+    # Lists of strings
+    allowed_crops = db.Column(JSON, nullable=False, default=list)
+    restrictions = db.Column(JSON, nullable=False, default=list)
+    violations = db.Column(JSON, nullable=False, default=list)
+    
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationship
+    sample = db.relationship('WaterQualitySample', back_populates='assessment')
+    
+    def __repr__(self):
+        return f'<WaterQualityAssessment {self.id} {self.micro_rating}/{self.physico_rating}>'
@@ -5,7 +5,7 @@ from utils.decorators import admin_required
 from utils.permissions import PermissionManager, Permission
 import traceback
 import uuid
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
 
 centers = Blueprint('centers', __name__)
 
@@ -22,8 +22,9 @@ def centres_listes_par_zone():
     
     # Get all zones with their units and centres
     if current_user.role == 'Admin':
+        # One query per level instead of a zones x units x centers join
         zones = Zone.query.options(
-            joinedload(Zone.units).joinedload(Unit.centers)
+            selectinload(Zone.units).selectinload(Unit.centers)
         ).all()
         page_title = "Liste des Centres de toutes les zones de l'ONA"
     else:
@@ -33,11 +34,11 @@ def centres_listes_par_zone():
             return redirect(url_for('main.dashboard'))
         
         zones = Zone.query.filter_by(id=current_user.zone_id).options(
-            joinedload(Zone.units).joinedload(Unit.centers)
+            selectinload(Zone.units).selectinload(Unit.centers)
         ).all()
         
         # Safely get zone name
-        zone_name = Zone.query.get(current_user.zone_id).name if current_user.zone_id else "Zone non assignée"
+        zone_name = zones[0].name if zones else "Zone non assignée"
         page_title = f"Liste des Centres de la zone {zone_name}"
     
     # Add logging
@@ -54,8 +55,7 @@ def centres_listes_par_zone():
 @admin_required
 def new_center():
     try:
-        # Log all form data for debugging
-        current_app.logger.info(f"Form data received: {request.form}")
+        current_app.logger.debug(f"Center creation form fields: {sorted(request.form.keys())}")
         
         name = request.form.get('name')
         description = request.form.get('description')
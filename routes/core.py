@@ -0,0 +1,382 @@
+"""
+Routes registered on the application itself rather than on a blueprint, so
+their endpoints have no prefix (url_for('select_unit'), url_for('list_zones')).
+"""
+
+from flask import render_template, request, jsonify, redirect, url_for, flash, send_file, current_app
+from flask_login import login_required, current_user
+from functools import wraps
+from models import db, Unit, Zone, Center
+from extensions import cache
+from utils.incident_utils import get_user_incident_counts
+from utils.permissions import PermissionManager, Permission, UserRole
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated or not UserRole.has_permission(current_user.role, 'can_view_all_incidents'):
+            flash('Vous devez être administrateur pour accéder à cette page.', 'danger')
+            return redirect(url_for('incidents.list'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def unit_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Exempt certain roles from unit requirement
+        if current_user.role in [UserRole.EMPLOYEUR_ZONE, UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
+            return f(*args, **kwargs)
+        
+        # Check if user has a unit
+        if not current_user.unit_id:
+            flash('Vous devez sélectionner une unité avant de continuer.', 'warning')
+            return redirect(url_for('select_unit'))
+        
+        return f(*args, **kwargs)
+    return decorated_function
+
+@login_required
+def invalidate_incident_cache():
+    """
+    Endpoint to manually invalidate incident count cache.
+    Useful after creating, updating, or deleting incidents.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
+        flash('Unauthorized to invalidate cache', 'error')
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    
+    # Clear all keys starting with 'incident_counts_'
+    cache.delete_memoized(get_user_incident_counts)
+    
+    flash('Incident count cache has been invalidated', 'success')
+    return jsonify({'status': 'success', 'message': 'Cache invalidated'}), 200
+
+@login_required
+def services():
+    return render_template('services.html')
+
+@login_required
+def exploitation():
+    return render_template('departement/exploitation.html')
+
+@login_required
+def departements():
+    return render_template('departement/departement.html')
+
+REUSE_SECTIONS = {
+    'introduction': 'departement/reuse/introduction.html',
+    'regulations': 'departement/reuse/regulations.html',
+    'methods': 'departement/reuse/methods.html',
+    'case-studies': 'departement/reuse/case_studies.html',
+    'documentation': 'departement/reuse/documentation.html'
+}
+
+@login_required
+def reuse():
+    return redirect(url_for('reuse_section', section='introduction'))
+
+@login_required
+def reuse_section(section):
+    if section not in REUSE_SECTIONS:
+        flash('Section non trouvée.', 'danger')
+        return redirect(url_for('reuse_section', section='introduction'))
+    
+    template = REUSE_SECTIONS[section]
+    return render_template(template, active_page=section)
+
+@login_required
+def rapports():
+    
+    # Get the count of incidents (you can modify this based on your needs)
+    incident_counts = get_user_incident_counts(current_user)
+    incidents_count = incident_counts['total_incidents']
+    return render_template('departement/rapports.html', incidents_count=incidents_count)
+
+
+@login_required
+def list_zones():
+    zones = Zone.query.all()
+    return render_template('admin/zones.html', zones=zones)
+
+@login_required
+def list_centers():
+    # If user is admin, show all centers
+    if current_user.role == UserRole.ADMIN:
+        centers = Center.query.all()
+        zones = Zone.query.all()
+    # If user is Unit Officer, show only centers in their unit
+    elif current_user.assigned_unit:
+        centers = Center.query.filter_by(unit_id=current_user.assigned_unit.id).all()
+        zones = []
+    else:
+        centers = []
+        zones = []
+    return render_template('admin/centers.html', centers=centers, zones=zones)
+
+@login_required
+def create_zone():
+    if current_user.role != UserRole.ADMIN:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    try:
+        zone = Zone(
+            code=request.form['code'],
+            name=request.form['name'],
+            description=request.form['description'],
+            address=request.form['address'],
+            phone=request.form['phone'],
+            email=request.form['email']
+        )
+        db.session.add(zone)
+        db.session.commit()
+        flash('Zone créée avec succès.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la création de la zone: {str(e)}', 'danger')
+    
+    return redirect(url_for('list_zones'))
+
+@login_required
+def edit_zone(id):
+    if current_user.role != UserRole.ADMIN:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    zone = Zone.query.get_or_404(id)
+    try:
+        zone.code = request.form['code']
+        zone.name = request.form['name']
+        zone.description = request.form['description']
+        zone.address = request.form['address']
+        zone.phone = request.form['phone']
+        zone.email = request.form['email']
+        db.session.commit()
+        flash('Zone mise à jour avec succès.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la mise à jour de la zone: {str(e)}', 'danger')
+    
+    return redirect(url_for('main_dashboard.dashboard'))
+
+@login_required
+def delete_zone(id):
+    if current_user.role != UserRole.ADMIN:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    try:
+        zone = Zone.query.get_or_404(id)
+        
+        # Delete all units in the zone first
+        for unit in zone.units:
+            # Delete all centers in each unit
+            for center in unit.centers:
+                db.session.delete(center)
+            db.session.delete(unit)
+        
+        # Finally delete the zone
+        db.session.delete(zone)
+        db.session.commit()
+        flash('Zone supprimée avec succès.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la suppression de la zone: {str(e)}', 'danger')
+    
+    return redirect(url_for('main_dashboard.dashboard'))
+
+@login_required
+def create_center():
+    if current_user.role not in [UserRole.ADMIN, UserRole.UNIT_OFFICER]:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    try:
+        # If Unit Officer, use their unit_id
+        unit_id = current_user.unit_id if current_user.role == UserRole.UNIT_OFFICER else request.form['unit_id']
+        
+        center = Center(
+            name=request.form['name'],
+            description=request.form['description'],
+            address=request.form['address'],
+            phone=request.form['phone'],
+            email=request.form['email'],
+            unit_id=unit_id
+        )
+        db.session.add(center)
+        db.session.commit()
+        flash('Centre créé avec succès.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la création du centre: {str(e)}', 'danger')
+    
+    return redirect(url_for('main_dashboard.dashboard'))
+
+@login_required
+def edit_center(id):
+    center = Center.query.get_or_404(id)
+    
+    # Check permissions
+    if current_user.role == UserRole.UNIT_OFFICER and center.unit_id != current_user.unit_id:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    try:
+        center.name = request.form['name']
+        center.description = request.form['description']
+        center.address = request.form['address']
+        center.phone = request.form['phone']
+        center.email = request.form['email']
+        if current_user.role == UserRole.ADMIN:
+            center.unit_id = request.form['unit_id']
+        db.session.commit()
+        flash('Centre mis à jour avec succès.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la mise à jour du centre: {str(e)}', 'danger')
+    
+    return redirect(url_for('main_dashboard.dashboard'))
+
+@login_required
+def delete_center(id):
+    center = Center.query.get_or_404(id)
+    
+    # Check permissions
+    if current_user.role == UserRole.UNIT_OFFICER and center.unit_id != current_user.unit_id:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    try:
+        db.session.delete(center)
+        db.session.commit()
+        flash('Centre supprimé avec succès.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la suppression du centre: {str(e)}', 'danger')
+    
+    return redirect(url_for('main_dashboard.dashboard'))
+
+@login_required
+def select_unit():
+    # Exempt certain roles from unit selection
+    if current_user.role in [UserRole.EMPLOYEUR_ZONE, UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    # If user has no zone, they need to be assigned first
+    if not current_user.zone_id:
+        flash("Vous devez d'abord être assigné à une zone par un administrateur.", "warning")
+        return redirect(url_for('main_dashboard.dashboard'))
+    
+    if request.method == 'POST':
+        zone_id = request.form.get('zone')
+        unit_id = request.form.get('unit_id')
+        
+        if not zone_id or not unit_id:
+            flash("Veuillez sélectionner une zone et une unité.", "warning")
+            return redirect(url_for('select_unit'))
+            
+        # Verify the unit belongs to the selected zone
+        unit = Unit.query.get(unit_id)
+        if not unit or str(unit.zone_id) != zone_id:
+            flash("Unité invalide sélectionnée.", "danger")
+            return redirect(url_for('select_unit'))
+            
+        # Update user's unit
+        current_user.unit_id = unit_id
+        db.session.commit()
+        
+        flash(f"Vous êtes maintenant connecté à l'unité: {unit.name}", "success")
+        return redirect(url_for('main_dashboard.dashboard'))
+        
+    # GET request - show selection form
+    zones = [Zone.query.get(current_user.zone_id)]
+    
+    # Get units for the zone
+    units = Unit.query.filter_by(zone_id=current_user.zone_id).all()
+    
+    return render_template('select_unit.html', zones=zones, units=units)
+
+@login_required
+def get_zone_units(zone_id):
+    """
+    API endpoint to retrieve units for a specific zone.
+    
+    Permissions:
+    - Admin and DG can view all units
+    - Zone employers can view units in their assigned zone
+    - Other roles are restricted
+    """
+    # Check if user has permission to view units
+    if not PermissionManager.has_permission(current_user.role, Permission.VIEW_ALL_UNITS):
+        # For non-admin/DG roles, only allow access to their own zone
+        if current_user.zone_id != zone_id:
+            return jsonify({
+                'error': 'Accès non autorisé',
+                'status': 'forbidden'
+            }), 403
+    
+    # Retrieve units for the specified zone
+    try:
+        units = Unit.query.filter_by(zone_id=zone_id).all()
+        
+        # Convert units to a list of dictionaries
+        units_list = [
+            {
+                'id': unit.id, 
+                'name': unit.name, 
+                'code': unit.code
+            } for unit in units
+        ]
+        
+        return jsonify({
+            'units': units_list,
+            'total_units': len(units_list),
+            'status': 'success'
+        })
+    
+    except Exception as e:
+        # Log the error for debugging
+        current_app.logger.error(f"Error retrieving units for zone {zone_id}: {str(e)}")
+        
+        return jsonify({
+            'error': 'Erreur lors de la récupération des unités',
+            'status': 'error'
+        }), 500
+
+def login():
+    return render_template('auth/login.html')
+
+@login_required
+def new_incident():
+    return render_template('incidents/new_incident.html')
+
+def serve_docs():
+    return send_file('docs/index.html')
+
+@login_required
+def spark_agent():
+    return render_template('sparkagent/spark_agent.html')
+
+def register_core_routes(app):
+    """Add the routes of this module to the application"""
+    app.add_url_rule('/invalidate_incident_cache', view_func=invalidate_incident_cache, methods=['POST'])
+    app.add_url_rule('/services', view_func=services)
+    app.add_url_rule('/exploitation', view_func=exploitation)
+    app.add_url_rule('/departements', view_func=departements)
+    app.add_url_rule('/departements/reuse', view_func=reuse)
+    app.add_url_rule('/departements/reuse/<section>', view_func=reuse_section)
+    app.add_url_rule('/departements/reuse/rapports', view_func=rapports)
+    app.add_url_rule('/zones', view_func=list_zones)
+    app.add_url_rule('/centers', view_func=list_centers)
+    app.add_url_rule('/zones/create', view_func=create_zone, methods=['POST'])
+    app.add_url_rule('/zones/edit/<int:id>', view_func=edit_zone, methods=['POST'])
+    app.add_url_rule('/zones/delete/<int:id>', view_func=delete_zone, methods=['POST'])
+    app.add_url_rule('/centers/create', view_func=create_center, methods=['POST'])
+    app.add_url_rule('/centers/edit/<int:id>', view_func=edit_center, methods=['POST'])
+    app.add_url_rule('/centers/delete/<int:id>', view_func=delete_center, methods=['POST'])
+    app.add_url_rule('/select-unit', view_func=select_unit, methods=['GET', 'POST'])
+    app.add_url_rule('/api/units/<int:zone_id>', view_func=get_zone_units)
+    app.add_url_rule('/login', view_func=login)
+    app.add_url_rule('/new-incident', view_func=new_incident)
+    app.add_url_rule('/docs', view_func=serve_docs)
+    app.add_url_rule('/spark-agent', view_func=spark_agent)
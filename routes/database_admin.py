@@ -1,25 +1,42 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, current_app
 from flask_login import login_required
 from utils.decorators import admin_required
-from models import db
-from sqlalchemy import inspect, text, MetaData
+from models import db, SlowQuery
+from sqlalchemy import text
 import sqlalchemy as sa
-import os
-import shutil
-from datetime import datetime
+from utils.pagination import keyset_page, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utils.schema_cache import schema_cache, invalidate_schema_cache
+from utils.data_export import export_response, EXPORT_FORMATS
+from utils.db_backup import (
+    iter_backup,
+    check_format,
+    default_format,
+    get_database_path,
+    BackupError,
+    COMPRESSION_FORMATS
+)
+from utils.query_stats import query_stats, explain_query_plan
+from datetime import date, datetime
+import json
 
 database_admin = Blueprint('database_admin', __name__)
 
+# Results returned by the foreign key typeahead
+TYPEAHEAD_LIMIT = 20
+
+# Rows shown on the query statistics page
+TOP_STATEMENTS_LIMIT = 50
+SLOW_QUERIES_LIMIT = 50
+
 @database_admin.route('/admin/database')
 @login_required
 @admin_required
 def database_overview():
     """Show all tables in the database"""
-    inspector = inspect(db.engine)
     tables = []
-    for table_name in inspector.get_table_names():
+    for table_name in schema_cache.get_table_names():
         columns = []
-        for column in inspector.get_columns(table_name):
+        for column in schema_cache.get_columns(table_name):
             columns.append({
                 'name': column['name'],
                 'type': str(column['type']),
@@ -34,13 +51,7 @@ def database_overview():
 
 def get_foreign_keys(table_name):
     """Get foreign key information for a table"""
-    inspector = inspect(db.engine)
-    foreign_keys = {}
-    for fk in inspector.get_foreign_keys(table_name):
-        constrained_column = fk['constrained_columns'][0]
-        referred_table = fk['referred_table']
-        foreign_keys[constrained_column] = referred_table
-    return foreign_keys
+    return schema_cache.get_foreign_keys(table_name)
 
 def get_display_column(table_name):
     """Get the appropriate display column for a table"""
@@ -49,39 +60,113 @@ def get_display_column(table_name):
         'zones': 'name',
         'units': 'name',
         'centers': 'name',
-        'incidents': 'title'
+        'incidents': 'title',
+        'infrastructures': 'nom'
     }
     return display_columns.get(table_name, 'id')
 
-def get_related_data(table_name):
-    """Get data for related tables"""
-    inspector = inspect(db.engine)
-    foreign_keys = get_foreign_keys(table_name)
-    related_data = {}
+def get_table(table_name):
+    """Get the reflected table, so that queries are built from its actual columns"""
+    return schema_cache.get_table(table_name)
+
+def get_key_column(table):
+    """Get the column pages are keyed on: the primary key, or SQLite's rowid"""
+    primary_key = list(table.primary_key.columns)
+    if primary_key:
+        return primary_key[0]
+    return sa.literal_column('rowid').label('rowid')
+
+def parse_filter_value(column, value):
+    """
+    Build the condition of a column filter typed in the table browser.
+    
+    Text columns are matched on a substring, other columns on equality.
+    
+    Raises:
+        ValueError: If the value does not fit the column type
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = str
     
+    if python_type is str:
+        return sa.cast(column, sa.String).ilike(f'%{value}%')
+    if python_type is bool:
+        return column == (value.lower() in ('1', 'true', 'oui', 'vrai'))
+    if python_type in (datetime, date):
+        # Dates are stored as text in SQLite: match on their prefix (e.g. '2024-05')
+        return sa.cast(column, sa.String).like(f'{value}%')
+    return column == python_type(value)
+
+def get_related_labels(foreign_keys, rows):
+    """
+    Get the display names of the foreign keys shown on a page.
+    
+    Only the referenced rows appearing on the page are loaded.
+    
+    Returns:
+        dict: {column name: {referenced id: display name}}
+    """
+    labels = {}
     for column, referred_table in foreign_keys.items():
-        # Get the display column for the referred table
-        display_column = get_display_column(referred_table)
-        
-        # Get the data from the referred table
-        query = text(f'SELECT id, {display_column} as display_name FROM {referred_table}')
-        result = db.session.execute(query)
-        related_data[referred_table] = [dict(row._mapping) for row in result]
+        ids = {row[column] for row in rows if row[column] is not None}
+        if not ids:
+            labels[column] = {}
+            continue
+        table = get_table(referred_table)
+        key_column = get_key_column(table)
+        display_column = table.c.get(get_display_column(referred_table), key_column)
+        result = db.session.execute(
+            sa.select(key_column, display_column).where(key_column.in_(ids))
+        )
+        labels[column] = dict(result.all())
+    return labels
+
+def filter_table(table, key_column, args):
+    """
+    Build the select of a table restricted by the filter_<column> arguments.
+    
+    Returns:
+        tuple: (select, applied filters by column, columns whose filter was invalid)
+    """
+    query = sa.select(table)
+    if key_column.name == 'rowid':
+        query = query.add_columns(key_column)
     
-    return related_data
+    filters = {}
+    rejected = []
+    for column in table.columns:
+        value = args.get(f'filter_{column.name}', '').strip()
+        if not value:
+            continue
+        try:
+            query = query.where(parse_filter_value(column, value))
+            filters[column.name] = value
+        except ValueError:
+            rejected.append(column.name)
+    return query, filters, rejected
 
 @database_admin.route('/admin/database/table/<table_name>')
 @login_required
 @admin_required
 def view_table(table_name):
-    """View and edit table data"""
-    inspector = inspect(db.engine)
-    if table_name not in inspector.get_table_names():
+    """
+    Browse table data one page at a time
+    
+    Query Parameters:
+    - sort: Column to sort on (primary key by default)
+    - order: asc (default) or desc
+    - filter_<column>: Filter on a column
+    - cursor / before: Page boundaries returned with the current page
+    - per_page: Rows per page
+    """
+    if not schema_cache.has_table(table_name):
         flash('Table not found', 'error')
         return redirect(url_for('database_admin.database_overview'))
     
     # Get table columns and their foreign keys
-    columns = inspector.get_columns(table_name)
+    columns = schema_cache.get_columns(table_name)
     foreign_keys = get_foreign_keys(table_name)
     
     # Add foreign key information to columns
@@ -90,29 +175,122 @@ def view_table(table_name):
         if column['foreign_key']:
             column['foreign_table'] = foreign_keys[column['name']]
     
-    # Get table data
-    query = text(f'SELECT * FROM {table_name}')
-    result = db.session.execute(query)
-    rows = [dict(row._mapping) for row in result]
+    table = get_table(table_name)
+    key_column = get_key_column(table)
+    query, filters, rejected = filter_table(table, key_column, request.args)
+    for column_name in rejected:
+        flash(f'Filtre ignoré pour {column_name}: valeur invalide', 'warning')
     
-    # Get related data for foreign keys
-    related_data = get_related_data(table_name)
+    sort = request.args.get('sort')
+    sort_column = table.c.get(sort, key_column) if sort else key_column
+    descending = request.args.get('order') == 'desc'
+    before = request.args.get('before')
+    
+    try:
+        page = keyset_page(
+            query,
+            sort_column,
+            key_column,
+            cursor=before or request.args.get('cursor'),
+            limit=request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int),
+            descending=descending,
+            nullable=sort_column is not key_column and sort_column.nullable,
+            backwards=bool(before)
+        )
+    except InvalidCursor:
+        flash('Pagination réinitialisée', 'warning')
+        return redirect(url_for('database_admin.view_table', table_name=table_name))
+    
+    rows = [dict(row._mapping) for row in page.items]
+    
+    # Query string kept by the navigation links
+    filter_args = {f'filter_{name}': value for name, value in filters.items()}
+    state = dict(filter_args)
+    if sort:
+        state.update(sort=sort_column.name, order='desc' if descending else 'asc')
+    if request.args.get('per_page'):
+        state['per_page'] = request.args.get('per_page')
     
     return render_template('admin/database/table.html', 
                          table_name=table_name, 
                          columns=columns, 
                          rows=rows,
-                         related_data=related_data)
+                         key_name=key_column.name,
+                         related_labels=get_related_labels(foreign_keys, rows),
+                         filters=filters,
+                         filter_args=filter_args,
+                         sort=sort_column.name,
+                         descending=descending,
+                         state=state,
+                         next_cursor=page.next_cursor,
+                         prev_cursor=page.prev_cursor)
+
+@database_admin.route('/admin/database/table/<table_name>/export')
+@login_required
+@admin_required
+def export_table(table_name):
+    """
+    Stream a table as CSV or JSON Lines
+    
+    Query Parameters:
+    - format: csv (default) or jsonl
+    - filter_<column>: Same filters as the table browser
+    """
+    if not schema_cache.has_table(table_name):
+        flash('Table not found', 'error')
+        return redirect(url_for('database_admin.database_overview'))
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        flash(f'Format d\'export inconnu: {fmt}', 'error')
+        return redirect(url_for('database_admin.view_table', table_name=table_name))
+    
+    table = get_table(table_name)
+    key_column = get_key_column(table)
+    query, _, _ = filter_table(table, key_column, request.args)
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return export_response(query.order_by(key_column), fmt, f'{table_name}_{timestamp}')
 
 @database_admin.route('/admin/database/related-data/<table_name>')
 @login_required
 @admin_required
 def get_related_table_data(table_name):
-    """Get data for a related table"""
-    display_column = get_display_column(table_name)
-    query = text(f'SELECT id, {display_column} as display_name FROM {table_name}')
-    result = db.session.execute(query)
-    data = [dict(row._mapping) for row in result]
+    """
+    Typeahead search in a related table
+    
+    Query Parameters:
+    - q: Text searched in the display column
+    - id: Row to include whatever the search (current value of a field)
+    - limit: Maximum number of results (default 20)
+    
+    Returns:
+        JSON list of {id, display_name}
+    """
+    if not schema_cache.has_table(table_name):
+        return jsonify([]), 404
+    
+    table = get_table(table_name)
+    key_column = get_key_column(table)
+    display_column = table.c.get(get_display_column(table_name), key_column)
+    limit = max(1, min(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), MAX_PAGE_SIZE))
+    
+    query = sa.select(key_column.label('id'), display_column.label('display_name'))
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.where(sa.cast(display_column, sa.String).ilike(f'%{search}%'))
+    # Ordered on the key so that the scan stops after `limit` matches
+    data = [dict(row._mapping) for row in db.session.execute(query.order_by(key_column).limit(limit))]
+    
+    selected_id = request.args.get('id')
+    if selected_id and not any(str(item['id']) == selected_id for item in data):
+        selected = db.session.execute(
+            sa.select(key_column.label('id'), display_column.label('display_name'))
+            .where(key_column == selected_id)
+        ).first()
+        if selected:
+            data.insert(0, dict(selected._mapping))
+    
     return jsonify(data)
 
 @database_admin.route('/admin/database/table/<table_name>/row/<int:row_id>')
@@ -120,10 +298,13 @@ def get_related_table_data(table_name):
 @admin_required
 def get_row(table_name, row_id):
     """Get a single row's data"""
+    if not schema_cache.has_table(table_name):
+        return jsonify({'error': 'Table not found'}), 404
     query = text(f'SELECT * FROM {table_name} WHERE id = :id')
-    result = db.session.execute(query, {'id': row_id})
-    row = dict(result.fetchone()._mapping)
-    return jsonify(row)
+    result = db.session.execute(query, {'id': row_id}).fetchone()
+    if result is None:
+        return jsonify({'error': 'Row not found'}), 404
+    return jsonify(dict(result._mapping))
 
 @database_admin.route('/admin/database/table/<table_name>/add-column', methods=['POST'])
 @login_required
@@ -143,6 +324,8 @@ def add_column(table_name):
         flash('Column added successfully', 'success')
     except Exception as e:
         flash(f'Error adding column: {str(e)}', 'error')
+    finally:
+        invalidate_schema_cache()
     
     return redirect(url_for('database_admin.view_table', table_name=table_name))
 
@@ -212,35 +395,115 @@ def delete_row(table_name, row_id):
 @login_required
 @admin_required
 def download_database():
-    """Download the SQLite database file"""
+    """
+    Download a compressed online backup of the SQLite database
+    
+    The snapshot is taken with the SQLite backup API and compressed while
+    it is streamed to the client.
+    
+    Query Parameters:
+    - format: zstd or gzip (zstd when available)
+    """
+    fmt = request.args.get('format') or default_format()
     try:
-        db_path = db.engine.url.database
-        if not db_path or not os.path.exists(db_path):
-            flash("Base de données introuvable.", "error")
-            return redirect(url_for('database_admin.database_overview'))
-
-        # Create a copy of the database file
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'OnaDB_backup_{timestamp}.db'
-        temp_path = os.path.join(os.path.dirname(db_path), backup_filename)
-        
-        # Copy the database file
-        shutil.copy2(db_path, temp_path)
-        
-        try:
-            return send_file(
-                temp_path,
-                mimetype='application/x-sqlite3',
-                as_attachment=True,
-                download_name=backup_filename
-            )
-        finally:
-            # Clean up the temporary file after sending
-            try:
-                os.unlink(temp_path)
-            except:
-                pass  # Ignore cleanup errors
-                
-    except Exception as e:
+        check_format(fmt)
+        get_database_path()
+    except BackupError as e:
         flash(f"Erreur lors du téléchargement de la base de données: {str(e)}", "error")
         return redirect(url_for('database_admin.database_overview'))
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_filename = f"OnaDB_backup_{timestamp}.db{COMPRESSION_FORMATS[fmt]['extension']}"
+    
+    return Response(
+        stream_with_context(iter_backup(fmt)),
+        mimetype=COMPRESSION_FORMATS[fmt]['mimetype'],
+        headers={
+            'Content-Disposition': f'attachment; filename={backup_filename}',
+            'Cache-Control': 'no-store'
+        }
+    )
+
+@database_admin.route('/admin/database/queries')
+@login_required
+@admin_required
+def query_statistics():
+    """
+    Show the statements taking the most database time
+    
+    In-memory aggregates cover this process since its start (or the last
+    reset), the slow_queries table keeps the slow statements of every process.
+    
+    Query Parameters:
+    - slow_sort: 'duration' (slowest first) or 'recent' (latest first)
+    """
+    slow_sort = request.args.get('slow_sort', 'duration')
+    slow_order = SlowQuery.created_at.desc() if slow_sort == 'recent' else SlowQuery.duration_ms.desc()
+    slow_queries = SlowQuery.query.order_by(slow_order).limit(SLOW_QUERIES_LIMIT).all()
+    
+    slow_by_endpoint = db.session.query(
+        SlowQuery.endpoint,
+        sa.func.count(SlowQuery.id).label('count'),
+        sa.func.sum(SlowQuery.duration_ms).label('total_ms'),
+        sa.func.max(SlowQuery.duration_ms).label('max_ms')
+    ).group_by(SlowQuery.endpoint).order_by(sa.func.sum(SlowQuery.duration_ms).desc()).limit(20).all()
+    
+    return render_template('admin/database/queries.html',
+                         top_statements=query_stats.top_statements(TOP_STATEMENTS_LIMIT),
+                         recent_statements=query_stats.recent_statements(),
+                         untracked=query_stats.untracked,
+                         stats_since=query_stats.started_at,
+                         slow_queries=slow_queries,
+                         slow_by_endpoint=slow_by_endpoint,
+                         slow_sort=slow_sort,
+                         threshold_ms=current_app.config.get('SLOW_QUERY_THRESHOLD_MS'),
+                         enabled=current_app.config.get('QUERY_STATS_ENABLED', True))
+
+@database_admin.route('/admin/database/queries/explain', methods=['POST'])
+@login_required
+@admin_required
+def explain_statement():
+    """
+    Run EXPLAIN QUERY PLAN on a recorded statement
+    
+    Only statements already recorded can be explained, never free SQL text.
+    
+    Form Parameters:
+    - key: Statement key from the in-memory statistics
+    - slow_query_id: Or id of a persisted slow query (its parameters are reused)
+    """
+    parameters = None
+    if request.form.get('slow_query_id'):
+        slow_query = db.session.get(SlowQuery, request.form.get('slow_query_id', type=int))
+        if slow_query is None:
+            return jsonify({'error': 'Requête introuvable'}), 404
+        statement = slow_query.statement
+        if slow_query.parameters:
+            parameters = json.loads(slow_query.parameters)
+    else:
+        statement = query_stats.get_statement(request.form.get('key', ''))
+        if statement is None:
+            return jsonify({'error': 'Requête introuvable (statistiques réinitialisées ?)'}), 404
+    
+    try:
+        plan = explain_query_plan(statement, parameters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sa.exc.DBAPIError as e:
+        return jsonify({'error': f"EXPLAIN impossible: {e.orig}"}), 400
+    
+    return jsonify({'statement': statement, 'plan': plan})
+
+@database_admin.route('/admin/database/queries/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_query_statistics():
+    """Reset the in-memory statistics, and empty slow_queries when clear_slow is set"""
+    query_stats.reset()
+    if request.form.get('clear_slow'):
+        SlowQuery.query.delete()
+        db.session.commit()
+        flash('Statistiques et requêtes lentes effacées', 'success')
+    else:
+        flash('Statistiques réinitialisées', 'success')
+    return redirect(url_for('database_admin.query_statistics'))
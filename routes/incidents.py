@@ -3,23 +3,35 @@ from flask import (
     flash, current_app, send_file, jsonify, session
 )
 from flask_login import login_required, current_user
-from models import db, Incident, Unit, UserRole, Zone
+from models import db, Incident, Unit, User, UserRole, Zone
+from sqlalchemy.orm import joinedload, load_only, raiseload
 from datetime import datetime
 from functools import wraps
 from utils.decorators import admin_required
-from utils.pdf_generator import create_incident_pdf
 from utils.url_endpoints import SELECT_UNIT, INCIDENT_LIST, VIEW_INCIDENT
+import io
 import os
 import json
 from typing import Dict, Any, Optional
-import requests
 from flask_caching import Cache
 from extensions import cache
 from utils.incident_utils import get_user_incident_counts, get_incident_cache_key
 from utils.permissions import UserRole, Permission, context_permission_check, permission_required
+from utils.data_export import export_response, EXPORT_FORMATS
+from utils.metrics import observe_external_call
 
 incidents = Blueprint('incidents', __name__)
 
+MISTRAL_COMPLETIONS_URL = 'https://api.mistral.ai/v1/chat/completions'
+
+def post_mistral_completion(payload, headers, **kwargs):
+    """Send a chat completion request to Mistral, recording its latency and failures"""
+    import requests
+    with observe_external_call('mistral') as call:
+        response = requests.post(MISTRAL_COMPLETIONS_URL, json=payload, headers=headers, **kwargs)
+        call['status'] = response.status_code
+    return response
+
 def parse_drawn_shapes(drawn_shapes_json: Optional[str]) -> Optional[Dict[str, Any]]:
     """
     Parse and validate drawn shapes from JSON input.
@@ -62,31 +74,27 @@ def parse_drawn_shapes(drawn_shapes_json: Optional[str]) -> Optional[Dict[str, A
         current_app.logger.warning(f"Invalid drawn shapes JSON: {drawn_shapes_json}")
         return None
 
-@incidents.route('/list', methods=['GET'], endpoint='incident_list')
-@login_required
-@permission_required(Permission.VIEW_INCIDENT)
-def list_incidents():
+def build_incident_query(args):
     """
-    Display a paginated list of incidents with optional filtering, searching, and sorting.
+    Build the incident query of the list view for the current user.
     
-    Query Parameters:
-    - page: Current page number
-    - status: Filter incidents by status
-    - search: Search term for incidents
-    - sort: Sorting option
+    The query is scoped to what the user's role can see, then filtered,
+    searched and sorted from the list parameters.
+    
+    Args:
+        args: Request arguments (status, search, sort, zone, unit)
     
     Returns:
-        Rendered incident list template with pagination
+        tuple: (query, zone filter, unit filter)
     """
     # Get query parameters
-    page = request.args.get('page', 1, type=int)
-    status_filter = request.args.get('status', None)
-    search_term = request.args.get('search', '').strip()
-    sort_option = request.args.get('sort', 'date_desc')
+    status_filter = args.get('status', None)
+    search_term = args.get('search', '').strip()
+    sort_option = args.get('sort', 'date_desc')
     
     # New filtering parameters for admin
-    zone_filter = request.args.get('zone', None, type=int) if current_user.role == UserRole.ADMIN else None
-    unit_filter = request.args.get('unit', None, type=int) if current_user.role == UserRole.ADMIN else None
+    zone_filter = args.get('zone', None, type=int) if current_user.role == UserRole.ADMIN else None
+    unit_filter = args.get('unit', None, type=int) if current_user.role == UserRole.ADMIN else None
     
     # Base query setup based on user role
     if current_user.role in [UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
@@ -155,6 +163,41 @@ def list_incidents():
         # Sort by unit name
         query = query.join(Unit).order_by(Unit.name)
     
+    return query, zone_filter, unit_filter
+
+def get_filter_zones():
+    """Zones of the filter dropdown, only the columns it displays"""
+    return Zone.query.options(load_only(Zone.id, Zone.name), raiseload('*')).all()
+
+def get_filter_units():
+    """Units of the filter dropdown, only the columns it displays"""
+    return Unit.query.options(load_only(Unit.id, Unit.name, Unit.zone_id), raiseload('*')).all()
+
+@incidents.route('/list', methods=['GET'], endpoint='incident_list')
+@login_required
+@permission_required(Permission.VIEW_INCIDENT)
+def list_incidents():
+    """
+    Display a paginated list of incidents with optional filtering, searching, and sorting.
+    
+    Query Parameters:
+    - page: Current page number
+    - status: Filter incidents by status
+    - search: Search term for incidents
+    - sort: Sorting option
+    
+    Returns:
+        Rendered incident list template with pagination
+    """
+    page = request.args.get('page', 1, type=int)
+    status_filter = request.args.get('status', None)
+    query, zone_filter, unit_filter = build_incident_query(request.args)
+    # The list shows the author and unit names of each incident
+    query = query.options(
+        joinedload(Incident.author).load_only(User.id, User.username),
+        joinedload(Incident.unit).load_only(Unit.id, Unit.name)
+    )
+    
     # Paginate results
     pagination = query.paginate(
         page=page, 
@@ -178,14 +221,40 @@ def list_incidents():
         'can_export_pdf': context_permission_check(Permission.EXPORT_INCIDENT_PDF),
         'can_ai_analysis': context_permission_check(Permission.GET_AI_EXPLANATION),
         # Add zones and units for filtering dropdowns
-        'zones': Zone.query.all() if current_user.role == UserRole.ADMIN else [],
-        'units': Unit.query.all() if current_user.role == UserRole.ADMIN else [],
+        'zones': get_filter_zones() if current_user.role == UserRole.ADMIN else [],
+        'units': get_filter_units() if current_user.role == UserRole.ADMIN else [],
         'selected_zone': zone_filter,
         'selected_unit': unit_filter,
     }
     
     return render_template('incidents/incident_list.html', **context)
 
+@incidents.route('/list/export', methods=['GET'])
+@login_required
+@permission_required(Permission.VIEW_INCIDENT)
+def export_incident_list():
+    """
+    Stream the incident list, with its current filters and sort, as CSV or JSON Lines.
+    
+    Query Parameters:
+    - format: csv (default) or jsonl
+    - status, search, sort, zone, unit: Same as the list view
+    
+    Returns:
+        Streamed file download
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        flash(f'Format d\'export inconnu: {fmt}', 'danger')
+        return redirect(url_for(INCIDENT_LIST))
+    
+    query, _, _ = build_incident_query(request.args)
+    # Plain columns: rows are streamed without building Incident objects
+    query = query.with_entities(*Incident.__table__.columns)
+    
+    filename = f'incidents_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+    return export_response(query, fmt, filename)
+
 @incidents.route('/incident/new', methods=['GET', 'POST'])
 @login_required
 @permission_required(Permission.CREATE_INCIDENT)
@@ -222,8 +291,7 @@ def new_incident():
             # Check if it's an AJAX request
             is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-            # Log all form data for debugging
-            current_app.logger.info(f"Incident Creation Form Data: {dict(request.form)}")
+            current_app.logger.debug(f"Incident creation form fields: {sorted(request.form.keys())}")
 
             # Get the unit_id from the form or use the user's assigned unit
             unit_id = request.form.get('unit_id')
@@ -471,8 +539,7 @@ def delete_incident(incident_id):
         db.session.delete(incident)
         db.session.commit()
         flash('Incident supprimé avec succès.', 'success')
-        current_app.logger.info(f"Flash message set: Incident supprimé avec succès")
-        current_app.logger.info(f"Session data: {dict(session)}")
+        current_app.logger.debug("Flash message set: Incident supprimé avec succès")
         
         # Invalidate incident count cache
         cache.delete(get_incident_cache_key(current_user))
@@ -513,8 +580,7 @@ def resolve_incident(incident_id):
     db.session.commit()
     
     flash("L'incident a été marqué comme résolu.", 'success')
-    current_app.logger.info("Flash message set: L'incident a été marqué comme résolu")
-    current_app.logger.info(f"Session data: {dict(session)}")
+    current_app.logger.debug("Flash message set: L'incident a été marqué comme résolu")
     
     # Invalidate incident count cache
     cache.delete(get_incident_cache_key(current_user))
@@ -528,24 +594,19 @@ def export_incident_pdf(incident_id):
     try:
         incident = Incident.query.get_or_404(incident_id)
         
-        # Create temporary directory if it doesn't exist
-        temp_dir = os.path.join(current_app.root_path, 'temp')
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-            
         # Generate PDF filename
         filename = f'incident_{incident.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        pdf_path = os.path.join(temp_dir, filename)
         
         # Get unit name safely
         unit_name = incident.unit.name if incident.unit else "Unité non spécifiée"
         
-        # Generate PDF
-        create_incident_pdf([incident], pdf_path, unit_name)
+        # Render the PDF in memory (reportlab is only loaded when a report is requested)
+        from utils.pdf_generator import render_incident_pdf
+        pdf = render_incident_pdf([incident], unit_name)
         
-        # Send file to user and delete after sending
+        # Send the document to the user
         return send_file(
-            pdf_path,
+            io.BytesIO(pdf),
             as_attachment=True,
             download_name=filename,
             mimetype='application/pdf'
@@ -586,24 +647,19 @@ def export_all_incidents_pdf():
 
     # Generate PDF
     try:
-        # Create temporary directory if it doesn't exist
-        temp_dir = os.path.join(current_app.root_path, 'temp')
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-        
         # Generate PDF filename
         filename = f'all_incidents_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        pdf_path = os.path.join(temp_dir, filename)
         
         # Get unit name safely
         unit_name = current_user.assigned_unit.name if current_user.assigned_unit else "Toutes les unités" if current_user.role == UserRole.ADMIN else "Unité non spécifiée"
         
-        # Generate PDF
-        create_incident_pdf(incidents, pdf_path, unit_name)
+        # Render the PDF in memory (reportlab is only loaded when a report is requested)
+        from utils.pdf_generator import render_incident_pdf
+        pdf = render_incident_pdf(incidents, unit_name)
         
-        # Send file to user
+        # Send the document to the user
         return send_file(
-            pdf_path,
+            io.BytesIO(pdf),
             as_attachment=True,
             download_name=filename,
             mimetype='application/pdf'
@@ -691,8 +747,7 @@ INSTRUCTIONS:
                 'max_tokens': 750
             }
 
-            # Log full payload for debugging
-            current_app.logger.info(f"Mistral API Payload: {payload}")
+            current_app.logger.debug(f"Mistral API payload: {len(json.dumps(payload))} bytes, max_tokens={payload['max_tokens']}")
 
             # Validate API key
             if not mistral_api_key:
@@ -709,15 +764,10 @@ INSTRUCTIONS:
             }
 
             try:
-                response = requests.post(
-                    'https://api.mistral.ai/v1/chat/completions', 
-                    json=payload, 
-                    headers=headers
-                )
+                response = post_mistral_completion(payload, headers)
                 
-                # Log full response for debugging
                 current_app.logger.info(f"Mistral API Response Status: {response.status_code}")
-                current_app.logger.info(f"Mistral API Response Body: {response.text}")
+                current_app.logger.debug(f"Mistral API Response Body: {response.text[:500]}")
 
                 # Check response
                 if response.status_code != 200:
@@ -768,6 +818,8 @@ def deep_incident_analysis():
     Returns:
         JSON response with comprehensive incident analysis
     """
+    import requests
+
     try:
         # Validate request
         if not request.is_json:
@@ -876,10 +928,9 @@ def deep_incident_analysis():
         # Make API call to Mistral
         try:
             # Configure more robust request parameters
-            response = requests.post(
-                'https://api.mistral.ai/v1/chat/completions', 
-                headers=headers, 
-                json=payload,
+            response = post_mistral_completion(
+                payload,
+                headers,
                 timeout=(10, 45),  # (connect timeout, read timeout)
                 verify=True,  # Ensure SSL certificate verification
             )
@@ -1,21 +1,78 @@
-from flask import Blueprint, render_template, request, jsonify
-from models import Infrastructure, db, InfrastructureFile
+from flask import Blueprint, render_template, request, jsonify, url_for, abort
+from models import Infrastructure, db, InfrastructureFile, InfrastructureFileVariant, FileBlob
 from utils.permissions import permission_required, Permission
 from flask_login import login_required
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from utils.blob_store import (
+    spool_and_hash,
+    get_upload_digest,
+    reserve_blob_dir,
+    discard_new_blobs,
+    link_blob_file,
+    write_blob_file,
+    store_stream,
+    find_blob,
+    create_blob,
+    acquire_blob,
+    get_blob_variants,
+    to_stored_path,
+    to_disk_path,
+    release_file,
+    remove_stored_files
+)
+from utils.file_serving import send_stored_file
+from utils.pagination import keyset_page, InvalidCursor, DEFAULT_PAGE_SIZE
+from utils.infrastructure_import import import_infrastructures, detect_format, ImportFormatError
+from utils.metrics import observe_duration, UPLOAD_PROCESSING_DURATION
 import os
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask import current_app
 import json
-from PIL import Image
 import io
 import re
 
 infrastructures_bp = Blueprint('infrastructures', __name__)
 
-# Configure file upload settings
+# Configure file upload settings (size limits are enforced while streaming,
+# see MAX_CONTENT_LENGTH / UPLOAD_MAX_FILE_SIZE and utils.uploads)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+
+# Maximum dimensions of the derivatives generated for each uploaded image.
+# The largest one is the main file, the smaller ones feed srcset attributes.
+IMAGE_VARIANT_SIZES = (1920, 1280, 480, 160)
+
+# Predefined infrastructure types
+INFRASTRUCTURE_TYPES = [
+    "Station d'épuration",
+    "Station de relevage", 
+    "Station de pompage"
+]
+
+# Columns the infrastructure list can be sorted on (ties broken by id)
+INFRASTRUCTURE_SORT_COLUMNS = {
+    'nom': Infrastructure.nom,
+    'type': Infrastructure.type,
+    'capacite': Infrastructure.capacite,
+    'etat': Infrastructure.etat,
+    'id': Infrastructure.id
+}
+
+@infrastructures_bp.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    """
+    Reject an oversize request or uploaded file with a JSON error
+    
+    Returns:
+        JSON response with a 413 status code
+    """
+    current_app.logger.warning(f"Upload rejected: {error.description}")
+    return jsonify({
+        'success': False,
+        'message': error.description
+    }), 413
 
 def allowed_file(filename):
     """
@@ -45,22 +102,70 @@ def sanitize_filename(name):
     name = re.sub(r'[-\s]+', '_', name).strip('-_')
     return name.lower()
 
-def process_image(file_storage, output_path, infra_id, infra_name):
+def fit_within(size, max_dimension):
+    """
+    Compute the size of an image scaled down to fit a bounding square
+    
+    Args:
+        size (tuple): Original (width, height)
+        max_dimension (int): Maximum dimension for either width or height
+    
+    Returns:
+        tuple: Scaled (width, height), unchanged if already small enough
+    """
+    width, height = size
+    if width <= max_dimension and height <= max_dimension:
+        return size
+    ratio = min(max_dimension / width, max_dimension / height)
+    return (max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+def downscale_image(img, target_size):
+    """
+    Downscale an image using a cheap integer reduce() before the final LANCZOS resample
+    
+    Args:
+        img (Image): Source image
+        target_size (tuple): Target (width, height)
+    
+    Returns:
+        Image: Resized image
+    """
+    from PIL import Image
+
+    # Keep at least twice the target size for the LANCZOS pass to preserve quality
+    factor = min(img.width // (target_size[0] * 2), img.height // (target_size[1] * 2))
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != target_size:
+        img = img.resize(target_size, Image.Resampling.LANCZOS)
+    return img
+
+def process_image(source, output_path, infra_id, infra_name, stored_name=None):
     """
-    Process uploaded image: compress and convert to WebP format
+    Process uploaded image: decode once, then compress every size variant to WebP format
     
     Args:
-        file_storage (FileStorage): Uploaded file
+        source: Uploaded file stream or path to the spooled upload
         output_path (str): Path to save the processed image
         infra_id (int): Infrastructure ID
         infra_name (str): Infrastructure name
+        stored_name (str): Optional base name of the files written to disk
+                           (defaults to the generated display filename)
     
     Returns:
-        tuple: (filename, filepath, file_size)
+        tuple: (filename, filepath, file_size, variants) where variants is a list of
+               dicts with width, height, filepath and file_size, largest first
     """
+    # Pillow is only loaded when an image is uploaded
+    from PIL import Image
+
     try:
         # Open image using Pillow
-        img = Image.open(file_storage.stream)
+        img = Image.open(source)
+        
+        # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding,
+        # never going below the largest size we need (no-op for other formats)
+        img.draft('RGB', fit_within(img.size, IMAGE_VARIANT_SIZES[0]))
         
         # Convert to RGB if necessary (for PNG with transparency)
         if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
@@ -73,35 +178,48 @@ def process_image(file_storage, output_path, infra_id, infra_name):
         # Generate new filename
         sanitized_name = sanitize_filename(infra_name)
         new_filename = f"infra{infra_id}_{sanitized_name}.webp"
-        new_filepath = os.path.join(output_path, new_filename)
-        
-        # Calculate target size based on original dimensions
-        max_dimension = 1920  # Maximum dimension for either width or height
-        width, height = img.size
-        
-        if width > max_dimension or height > max_dimension:
-            # Calculate aspect ratio
-            ratio = min(max_dimension / width, max_dimension / height)
-            new_size = (int(width * ratio), int(height * ratio))
-            img = img.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Compress and save as WebP with quality optimization
-        img.save(new_filepath, 'WEBP', quality=85, method=6, lossless=False)
-        
-        # Get file size
-        file_size = os.path.getsize(new_filepath)
+        stored_name = stored_name or f"infra{infra_id}_{sanitized_name}"
+        os.makedirs(output_path, exist_ok=True)
         
-        # Convert filepath to relative path for storage
-        relative_filepath = new_filepath.replace(current_app.root_path, '').replace('\\', '/')
+        # Each variant is derived from the previous (larger) one, so the full
+        # resolution image is only resampled once
+        variants = []
+        for max_dimension in IMAGE_VARIANT_SIZES:
+            target_size = fit_within(img.size, max_dimension)
+            if variants and target_size == (variants[-1]['width'], variants[-1]['height']):
+                continue
+            img = downscale_image(img, target_size)
+            
+            if not variants:
+                variant_filename = f"{stored_name}.webp"
+            else:
+                variant_filename = f"{stored_name}_{img.width}w.webp"
+            variant_filepath = os.path.join(output_path, variant_filename)
+            
+            # Compress and save as WebP with quality optimization
+            file_size = write_blob_file(
+                variant_filepath, 
+                lambda output: img.save(output, 'WEBP', quality=85, method=6, lossless=False)
+            )
+            
+            variants.append({
+                'width': img.width,
+                'height': img.height,
+                # Convert filepath to the stored form
+                'filepath': to_stored_path(variant_filepath),
+                'file_size': file_size
+            })
         
-        return new_filename, relative_filepath, file_size
+        return new_filename, variants[0]['filepath'], variants[0]['file_size'], variants
     except Exception as e:
         current_app.logger.error(f"Error processing image: {str(e)}")
-        return None, None, None
+        return None, None, None, []
 
+@observe_duration(UPLOAD_PROCESSING_DURATION, kind='infrastructure_file')
 def save_infrastructure_file(file, infrastructure_id):
     """
-    Save an uploaded file for an infrastructure
+    Save an uploaded file for an infrastructure in the content-addressed blob store.
+    Identical uploads are stored (and, for images, transcoded) only once.
     
     Args:
         file (FileStorage): Uploaded file
@@ -113,46 +231,67 @@ def save_infrastructure_file(file, infrastructure_id):
     if not file or not allowed_file(file.filename):
         return None
     
+    temp_path = None
     try:
         infrastructure = Infrastructure.query.get(infrastructure_id)
         if not infrastructure:
             return None
-            
-        # Ensure upload directory exists
-        upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'infrastructures', str(infrastructure_id))
-        os.makedirs(upload_dir, exist_ok=True)
         
         original_ext = file.filename.rsplit('.', 1)[1].lower()
         is_image = original_ext in {'png', 'jpg', 'jpeg', 'gif'}
         
-        # Generate a unique filename to prevent overwriting
-        import uuid
-        unique_suffix = str(uuid.uuid4())[:8]
+        # The hash is computed while the request body is streamed in; uploads
+        # that did not go through StreamingUploadRequest are hashed here
+        sha256, upload_size = get_upload_digest(file)
+        if sha256 is None:
+            temp_path, sha256, upload_size = spool_and_hash(file.stream)
+        blob = find_blob(sha256)
         
         if is_image:
-            # Process image file
-            filename, filepath, file_size = process_image(
-                file, 
-                upload_dir, 
-                infrastructure_id, 
-                f"{infrastructure.nom}_{unique_suffix}"
-            )
-            if not filename:
-                return None
+            filename = f"infra{infrastructure_id}_{sanitize_filename(infrastructure.nom)}.webp"
+            variants = get_blob_variants(blob) if blob else None
+            
+            if variants is None:
+                # Unknown content: transcode once into the blob store
+                file.stream.seek(0)
+                _, filepath, file_size, variants = process_image(
+                    temp_path or file.stream, 
+                    reserve_blob_dir(sha256), 
+                    infrastructure_id, 
+                    infrastructure.nom,
+                    stored_name=sha256
+                )
+                if not filepath:
+                    return None
+            else:
+                filepath, file_size = blob.filepath, blob.file_size
                 
             mime_type = 'image/webp'
             file_type = 'image'
         else:
-            # Handle PDF files with unique naming
-            base_filename = secure_filename(file.filename)
-            filename = f"{os.path.splitext(base_filename)[0]}_{unique_suffix}{os.path.splitext(base_filename)[1]}"
-            filepath = os.path.join(upload_dir, filename)
-            file.save(filepath)
-            file_size = os.path.getsize(filepath)
+            variants = []
+            filename = secure_filename(file.filename)
+            
+            if blob:
+                filepath, file_size = blob.filepath, blob.file_size
+            else:
+                blob_path = os.path.join(reserve_blob_dir(sha256), f"{sha256}.{original_ext}")
+                if temp_path:
+                    link_blob_file(temp_path, blob_path)
+                    temp_path = None
+                else:
+                    store_stream(file.stream, blob_path)
+                filepath, file_size = to_stored_path(blob_path), upload_size
+                
             mime_type = 'application/pdf'
             file_type = 'pdf'
-            # Convert filepath to relative path for storage
-            filepath = filepath.replace(current_app.root_path, '').replace('\\', '/')
+        
+        if blob:
+            acquire_blob(blob)
+        else:
+            # Another request may have stored the same content meanwhile
+            blob = create_blob(sha256, filepath, mime_type, file_size)
+            filepath, file_size = blob.filepath, blob.file_size
         
         # Create file record
         new_file = InfrastructureFile(
@@ -163,39 +302,219 @@ def save_infrastructure_file(file, infrastructure_id):
             mime_type=mime_type,
             file_size=file_size
         )
+        for variant in variants:
+            new_file.variants.append(InfrastructureFileVariant(**variant))
         
         return new_file
         
     except Exception as e:
         current_app.logger.error(f"Error saving infrastructure file: {str(e)}")
         return None
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def get_file_hashes(files):
+    """
+    Get the content hash of each file stored in the blob store.
+    
+    Args:
+        files: InfrastructureFile records
+    
+    Returns:
+        dict: sha256 by file id (legacy uploads without a blob are left out)
+    """
+    filepaths = {file.filepath for file in files}
+    if not filepaths:
+        return {}
+    hashes = dict(
+        db.session.query(FileBlob.filepath, FileBlob.sha256)
+        .filter(FileBlob.filepath.in_(filepaths))
+    )
+    return {file.id: hashes[file.filepath] for file in files if file.filepath in hashes}
+
+def build_file_url(file_id, sha256=None, width=None):
+    """
+    Build the URL serving a file or one of its variants.
+    
+    The URL is versioned with the content hash when known, so that browsers
+    may cache it forever.
+    """
+    params = {'file_id': file_id}
+    if width is not None:
+        params['width'] = width
+    if sha256:
+        params['v'] = sha256[:16]
+    return url_for('infrastructures.serve_infrastructure_file', **params)
+
+def filter_infrastructures(args):
+    """
+    Build the infrastructure query matching the list filters.
+    
+    Args:
+        args: Request arguments (type, etat, epuration_type, capacite_min,
+              capacite_max, q)
+    
+    Returns:
+        Filtered Infrastructure query, without ordering
+    """
+    query = Infrastructure.query
+    
+    for field in ('type', 'etat', 'epuration_type'):
+        value = args.get(field, '').strip()
+        if value:
+            query = query.filter(getattr(Infrastructure, field) == value)
+    
+    capacite_min = args.get('capacite_min', type=float)
+    if capacite_min is not None:
+        query = query.filter(Infrastructure.capacite >= capacite_min)
+    capacite_max = args.get('capacite_max', type=float)
+    if capacite_max is not None:
+        query = query.filter(Infrastructure.capacite <= capacite_max)
+    
+    search_term = args.get('q', '').strip()
+    if search_term:
+        # Escape LIKE wildcards typed by the user
+        escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Infrastructure.nom.ilike(f'%{escaped}%', escape='\\'))
+    
+    return query
+
+def get_type_aggregates(query):
+    """
+    Count infrastructures and sum their capacity per type, in SQL.
+    
+    Args:
+        query: Filtered Infrastructure query
+    
+    Returns:
+        list: One dict per type with count, total, average, min and max capacity
+    """
+    rows = (
+        query.with_entities(
+            Infrastructure.type,
+            func.count(Infrastructure.id),
+            func.sum(Infrastructure.capacite),
+            func.avg(Infrastructure.capacite),
+            func.min(Infrastructure.capacite),
+            func.max(Infrastructure.capacite)
+        )
+        .group_by(Infrastructure.type)
+        .order_by(Infrastructure.type)
+        .all()
+    )
+    return [
+        {
+            'type': infra_type,
+            'count': count,
+            'capacite_totale': total or 0,
+            'capacite_moyenne': round(average, 2) if average is not None else None,
+            'capacite_min': minimum,
+            'capacite_max': maximum
+        } for infra_type, count, total, average, minimum, maximum in rows
+    ]
+
+def get_infrastructure_page(args):
+    """
+    Fetch one keyset page of infrastructures for the list filters and sort.
+    
+    Args:
+        args: Request arguments (filters, sort, order, cursor, limit)
+    
+    Returns:
+        KeysetPage: Infrastructures with the next and previous page cursors
+    
+    Raises:
+        InvalidCursor: If the cursor is malformed
+    """
+    sort_column = INFRASTRUCTURE_SORT_COLUMNS.get(args.get('sort'), Infrastructure.nom)
+    return keyset_page(
+        filter_infrastructures(args),
+        sort_column,
+        Infrastructure.id,
+        cursor=args.get('cursor'),
+        limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        descending=args.get('order') == 'desc'
+    )
+
+def serialize_infrastructure(infrastructure):
+    """Convert an infrastructure to the dict returned by the list API"""
+    return {
+        'id': infrastructure.id,
+        'nom': infrastructure.nom,
+        'type': infrastructure.type,
+        'localisation': infrastructure.localisation,
+        'capacite': infrastructure.capacite,
+        'etat': infrastructure.etat,
+        'epuration_type': infrastructure.epuration_type
+    }
 
 @infrastructures_bp.route('/infrastructures')
 @login_required
 @permission_required(Permission.VIEW_INFRASTRUCTURES)
 def liste_infrastructures():
     """
-    Render the list of infrastructures with filtering capabilities.
+    Render the first page of infrastructures matching the filters.
+    
+    Following pages are loaded from api_infrastructures.
     
     Returns:
         Rendered template with infrastructures and their types
     """
-    # Fetch all infrastructures
-    infrastructures = Infrastructure.query.all()
-    
-    # Predefined infrastructure types
-    infrastructure_types = [
-        "Station d'épuration",
-        "Station de relevage", 
-        "Station de pompage"
-    ]
+    try:
+        page = get_infrastructure_page(request.args)
+    except InvalidCursor:
+        page = get_infrastructure_page({})
     
     return render_template(
         'departement/exploitation/infrastructures/liste_infrastructures.html', 
-        infrastructures=infrastructures,
-        infrastructure_types=infrastructure_types
+        infrastructures=page.items,
+        next_cursor=page.next_cursor,
+        aggregates=get_type_aggregates(filter_infrastructures(request.args)),
+        current_type=request.args.get('type', ''),
+        infrastructure_types=INFRASTRUCTURE_TYPES
     )
 
+@infrastructures_bp.route('/infrastructures/api')
+@login_required
+@permission_required(Permission.VIEW_INFRASTRUCTURES)
+def api_infrastructures():
+    """
+    List infrastructures as JSON with keyset pagination.
+    
+    Query Parameters:
+    - type, etat, epuration_type: Exact match filters
+    - capacite_min, capacite_max: Capacity range
+    - q: Search term on the name
+    - sort: nom (default), type, capacite, etat or id
+    - order: asc (default) or desc
+    - limit: Page size (default 50, max 200)
+    - cursor: next_cursor of the previous page
+    
+    Returns:
+        JSON response with the page items, the next cursor and, on the
+        first page, the per-type aggregates of the filtered set
+    """
+    try:
+        page = get_infrastructure_page(request.args)
+    except InvalidCursor as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    response = {
+        'success': True,
+        'items': [serialize_infrastructure(infrastructure) for infrastructure in page.items],
+        'next_cursor': page.next_cursor,
+        'has_more': page.next_cursor is not None
+    }
+    # Aggregates do not change from page to page, only compute them once
+    if not request.args.get('cursor'):
+        response['aggregates'] = get_type_aggregates(filter_infrastructures(request.args))
+    
+    return jsonify(response), 200
+
 @infrastructures_bp.route('/create', methods=['POST'])
 @login_required
 @permission_required(Permission.CREATE_INFRASTRUCTURE)
@@ -238,6 +557,10 @@ def create_infrastructure():
             }), 400
     
     try:
+        # Parse the uploads first: size limits are enforced while the body is
+        # streamed in, before anything is written to the database
+        uploads = [file for file in request.files.getlist('files') if file and allowed_file(file.filename)]
+        
         # Create new infrastructure instance
         new_infrastructure = Infrastructure(
             nom=data['nom'],
@@ -248,34 +571,26 @@ def create_infrastructure():
             epuration_type=data.get('epuration_type')
         )
         
-        # Add and commit to database to get ID
+        # Flush to get an ID; the row is only committed together with its files
         db.session.add(new_infrastructure)
-        db.session.commit()
+        db.session.flush()
         
         # Handle file uploads
         associated_files = []
-        if 'files' in request.files:
-            for file in request.files.getlist('files'):
-                if file and allowed_file(file.filename):
-                    # Check file size
-                    file.seek(0, os.SEEK_END)
-                    file_size = file.tell()
-                    file.seek(0)
-                    
-                    if file_size > MAX_FILE_SIZE:
-                        db.session.rollback()
-                        return jsonify({
-                            'success': False,
-                            'message': f'Fichier {file.filename} trop volumineux. Limite de 10 Mo.'
-                        }), 400
-                    
-                    # Save file and create record
-                    infrastructure_file = save_infrastructure_file(file, new_infrastructure.id)
-                    if infrastructure_file:
-                        db.session.add(infrastructure_file)
-                        associated_files.append(infrastructure_file)
+        for file in uploads:
+            # Save file and create record
+            infrastructure_file = save_infrastructure_file(file, new_infrastructure.id)
+            if not infrastructure_file:
+                db.session.rollback()
+                discard_new_blobs()
+                return jsonify({
+                    'success': False,
+                    'message': f'Impossible de traiter le fichier {file.filename}.'
+                }), 400
+            db.session.add(infrastructure_file)
+            associated_files.append(infrastructure_file)
         
-        # Commit file records
+        # Commit the infrastructure and its file records together
         db.session.commit()
         
         return jsonify({
@@ -287,6 +602,7 @@ def create_infrastructure():
     
     except SQLAlchemyError as e:
         db.session.rollback()
+        discard_new_blobs()
         return jsonify({
             'success': False, 
             'message': 'Erreur lors de la création de l\'infrastructure',
@@ -298,6 +614,58 @@ def create_infrastructure():
             'message': 'Capacité invalide'
         }), 400
 
+@infrastructures_bp.route('/infrastructures/import', methods=['POST'])
+@login_required
+@permission_required(Permission.CREATE_INFRASTRUCTURE)
+def import_infrastructures_file():
+    """
+    Bulk import infrastructures from an uploaded CSV, JSON, JSON Lines or XLSX file
+    
+    Rows are upserted on nom, invalid rows are skipped and reported.
+    
+    Form Parameters:
+    - file: File to import
+    - dry_run: 'true' to only validate the file
+    
+    Returns:
+        JSON response with the import report
+    """
+    # Import files may be larger than regular attachments, the request body limit still applies
+    request.max_file_size = current_app.config.get('MAX_CONTENT_LENGTH')
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({
+            'success': False,
+            'message': 'Aucun fichier fourni'
+        }), 400
+    
+    try:
+        with UPLOAD_PROCESSING_DURATION.time(kind='infrastructure_import'):
+            report = import_infrastructures(
+                file.stream,
+                detect_format(file.filename),
+                dry_run=request.form.get('dry_run', 'false').lower() == 'true'
+            )
+    except ImportFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error during infrastructure import: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Erreur lors de l\'import des infrastructures',
+            'error': str(e)
+        }), 500
+    
+    current_app.logger.info(
+        f"Infrastructure import {file.filename}: {report['created']} created, "
+        f"{report['updated']} updated, {report['error_count']} errors"
+    )
+    return jsonify({'success': True, **report}), 200
+
 @infrastructures_bp.route('/<int:infrastructure_id>/details')
 @login_required
 @permission_required(Permission.VIEW_INFRASTRUCTURES)
@@ -315,18 +683,30 @@ def get_infrastructure_details(infrastructure_id):
         infrastructure = Infrastructure.query.get_or_404(infrastructure_id)
         
         # Fetch associated files
-        files = infrastructure.infrastructure_files.all()
+        files = infrastructure.infrastructure_files.options(selectinload(InfrastructureFile.variants)).all()
+        file_hashes = get_file_hashes(files)
         file_details = []
         
         for file in files:
+            sha256 = file_hashes.get(file.id)
             file_details.append({
                 'id': file.id,
                 'filename': file.filename,
-                'filepath': file.filepath,
+                'url': build_file_url(file.id, sha256),
                 'file_type': file.file_type,
                 'mime_type': file.mime_type,
                 'file_size': file.file_size,
-                'file_size_human': file.get_file_size_human_readable()
+                'file_size_human': file.get_file_size_human_readable(),
+                'srcset': file.get_srcset(
+                    lambda variant: build_file_url(file.id, sha256, variant.width)
+                ),
+                'variants': [
+                    {
+                        'width': variant.width,
+                        'height': variant.height,
+                        'url': build_file_url(file.id, sha256, variant.width)
+                    } for variant in file.variants
+                ]
             })
         
         return jsonify({
@@ -347,6 +727,53 @@ def get_infrastructure_details(infrastructure_id):
             'error': str(e)
         }), 404
 
+@infrastructures_bp.route('/files/<int:file_id>')
+@infrastructures_bp.route('/files/<int:file_id>/<int:width>w')
+@login_required
+@permission_required(Permission.VIEW_INFRASTRUCTURES)
+def serve_infrastructure_file(file_id, width=None):
+    """
+    Serve an infrastructure file, or one of its resized variants
+    
+    Supports conditional and Range requests. Responses to URLs versioned with
+    the content hash (?v=) are cacheable forever.
+    
+    Args:
+        file_id (int): ID of the InfrastructureFile
+        width (int, optional): Width of the variant to serve
+    
+    Returns:
+        File response, or 404 if the file or variant does not exist
+    """
+    file_record = InfrastructureFile.query.get_or_404(file_id)
+    stored_path = file_record.filepath
+    mime_type = file_record.mime_type
+    download_name = file_record.filename
+    
+    if width is not None:
+        variant = InfrastructureFileVariant.query.filter_by(file_id=file_id, width=width).first_or_404()
+        stored_path = variant.filepath
+        mime_type = 'image/webp'
+        download_name = f"{os.path.splitext(file_record.filename)[0]}_{width}w.webp"
+    
+    disk_path = to_disk_path(stored_path)
+    if not os.path.isfile(disk_path):
+        current_app.logger.warning(f"Stored file missing on disk: {disk_path}")
+        abort(404)
+    
+    sha256 = get_file_hashes([file_record]).get(file_id)
+    etag = None
+    if sha256:
+        etag = f"{sha256}-{width}w" if width is not None else sha256
+    
+    return send_stored_file(
+        disk_path,
+        mime_type,
+        etag=etag,
+        download_name=download_name,
+        immutable=bool(sha256) and request.args.get('v') == sha256[:16]
+    )
+
 @infrastructures_bp.route('/<int:infrastructure_id>/edit', methods=['POST'])
 @login_required
 @permission_required(Permission.EDIT_INFRASTRUCTURE)
@@ -401,6 +828,7 @@ def edit_infrastructure(infrastructure_id):
         
         # Validate and process file deletions
         deleted_file_records = []
+        paths_to_remove = set()
         if deleted_files:
             # Ensure files are integers and belong to this infrastructure
             for file_id in deleted_files:
@@ -419,14 +847,10 @@ def edit_infrastructure(infrastructure_id):
                 except (ValueError, TypeError):
                     current_app.logger.warning(f"Invalid file ID: {file_id}")
             
-            # Delete valid files
+            # Delete valid files; blobs shared with other records are kept
             for file_record in deleted_file_records:
                 try:
-                    # Remove physical file
-                    file_path = os.path.join(current_app.root_path, file_record.filepath.lstrip('/'))
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        current_app.logger.info(f"Deleted physical file: {file_path}")
+                    paths_to_remove |= release_file(file_record)
                     
                     # Remove database record
                     db.session.delete(file_record)
@@ -436,33 +860,33 @@ def edit_infrastructure(infrastructure_id):
         
         # Handle new file uploads
         new_files = []
-        if 'files' in files:
-            for file in files.getlist('files'):
-                if file and allowed_file(file.filename):
-                    # Check file size
-                    file.seek(0, os.SEEK_END)
-                    file_size = file.tell()
-                    file.seek(0)
-                    
-                    if file_size > MAX_FILE_SIZE:
-                        current_app.logger.warning(f"File {file.filename} exceeds size limit")
-                        return jsonify({
-                            'success': False,
-                            'message': f'Fichier {file.filename} trop volumineux. Limite de 10 Mo.'
-                        }), 400
-                    
-                    # Save file and create record
-                    infrastructure_file = save_infrastructure_file(file, infrastructure.id)
-                    if infrastructure_file:
-                        db.session.add(infrastructure_file)
-                        new_files.append(infrastructure_file)
-                        current_app.logger.info(f"Added new file: {infrastructure_file.filename}")
+        for file in files.getlist('files'):
+            if file and allowed_file(file.filename):
+                # Save file and create record
+                infrastructure_file = save_infrastructure_file(file, infrastructure.id)
+                if not infrastructure_file:
+                    db.session.rollback()
+                    discard_new_blobs()
+                    return jsonify({
+                        'success': False,
+                        'message': f'Impossible de traiter le fichier {file.filename}.'
+                    }), 400
+                db.session.add(infrastructure_file)
+                new_files.append(infrastructure_file)
+                current_app.logger.info(f"Added new file: {infrastructure_file.filename}")
         
         # Commit all changes
         db.session.commit()
         
+        # Only touch the disk once the deletions are committed, keeping any
+        # blob that was re-uploaded in the same request
+        for new_file in new_files:
+            paths_to_remove -= {new_file.filepath} | {variant.filepath for variant in new_file.variants}
+        remove_stored_files(paths_to_remove)
+        
         # Fetch all current files after changes
         current_files = InfrastructureFile.query.filter_by(infrastructure_id=infrastructure_id).all()
+        file_hashes = get_file_hashes(current_files)
         
         return jsonify({
             'success': True, 
@@ -474,7 +898,7 @@ def edit_infrastructure(infrastructure_id):
                 {
                     'id': f.id, 
                     'filename': f.filename, 
-                    'filepath': f.filepath, 
+                    'url': build_file_url(f.id, file_hashes.get(f.id)),
                     'file_type': f.file_type
                 } for f in current_files
             ]
@@ -482,6 +906,7 @@ def edit_infrastructure(infrastructure_id):
         
     except SQLAlchemyError as e:
         db.session.rollback()
+        discard_new_blobs()
         current_app.logger.error(f"Database error: {str(e)}")
         return jsonify({
             'success': False, 
@@ -490,6 +915,7 @@ def edit_infrastructure(infrastructure_id):
         }), 500
     except Exception as e:
         db.session.rollback()
+        discard_new_blobs()
         current_app.logger.error(f"Unexpected error: {str(e)}")
         return jsonify({
             'success': False, 
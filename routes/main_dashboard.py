@@ -59,11 +59,12 @@ def get_dashboard_data():
         resolved_incidents = incident_counts['resolved_incidents']
         closed_incidents = incident_counts['closed_incidents']
         pending_incidents = total_incidents - resolved_incidents - closed_incidents
-        recent_incidents = Incident.query.filter(Incident.unit_id.in_([unit.id for unit in Unit.query.filter_by(zone_id=current_user.zone_id).all()])).order_by(Incident.date_incident.desc()).limit(5).all()
+        zone_unit_ids = db.session.query(Unit.id).filter_by(zone_id=current_user.zone_id)
+        recent_incidents = Incident.query.filter(Incident.unit_id.in_(zone_unit_ids.scalar_subquery())).order_by(Incident.date_incident.desc()).limit(5).all()
         
         # Zone statistics
         total_users = User.query.filter_by(zone_id=current_user.zone_id).count()
-        total_units = len(Unit.query.filter_by(zone_id=current_user.zone_id).all())
+        total_units = zone_unit_ids.count()
         total_zones = 1  # Their own zone
         total_centers = Center.query.join(Unit).filter(Unit.zone_id == current_user.zone_id).count()
         
@@ -100,12 +101,6 @@ def dashboard_main():
         Rendered dashboard template with incident counts and user information
     """
     try:
-        # Get recent incidents (last 5)
-        if current_user.role == UserRole.ADMIN:
-            recent_incidents = Incident.query.order_by(Incident.date_incident.desc()).limit(5).all()
-        else:
-            recent_incidents = Incident.query.filter_by(author=current_user).order_by(Incident.date_incident.desc()).limit(5).all()
-        
         # Get statistics
         incident_counts = get_user_incident_counts(current_user)
         total_incidents = incident_counts['total_incidents']
@@ -114,7 +109,6 @@ def dashboard_main():
         pending_incidents = nouveau_incidents
         
         return render_template('dashboard/main_dashboard.html',
-                             recent_incidents=recent_incidents,
                              total_incidents=total_incidents,
                              resolved_incidents=resolved_incidents,
                              pending_incidents=pending_incidents,
@@ -148,15 +142,12 @@ def dashboard():
         Rendered dashboard template with detailed context
     """
     try:
-        # Debug print
-        print(f"DEBUG: Dashboard route called. User: {current_user.username}, Role: {current_user.role}")
-        
         # Get incident counts for the current user
         incident_counts = get_user_incident_counts(current_user)
         
-        # Get user's unit and zone information
-        user_unit = Unit.query.get(current_user.unit_id) if current_user.unit_id else None
-        user_zone = Zone.query.get(current_user.zone_id) if current_user.zone_id else None
+        # Get user's unit and zone information (loaded with the user)
+        user_unit = current_user.assigned_unit
+        user_zone = current_user.assigned_zone
         
         # Prepare context for dashboard rendering
         context = {
@@ -169,7 +160,6 @@ def dashboard():
         }
         
         # Explicitly render the main dashboard template
-        print(f"DEBUG: Rendering dashboard with total incidents: {context['total_incidents']}")
         return render_template('dashboard/main_dashboard.html', 
                              total_incidents=context['total_incidents'],
                              resolved_incidents=context['resolved_incidents'],
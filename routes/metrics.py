@@ -0,0 +1,31 @@
+from flask import Blueprint, Response, request, current_app, abort
+from utils.metrics import collect_metrics, render_metrics
+import hmac
+
+metrics = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Clients allowed when METRICS_TOKEN is not set
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+@metrics.route('/metrics')
+def prometheus_metrics():
+    """
+    Expose the application metrics in the Prometheus text format
+    
+    When METRICS_TOKEN is set, the scraper must send it as a bearer token
+    (authorization.credentials in the Prometheus scrape config). Without a
+    token, the metrics are only served to local scrapers.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            abort(403)
+    elif request.remote_addr not in LOCAL_ADDRESSES:
+        abort(403)
+    
+    return Response(render_metrics(collect_metrics()), content_type=PROMETHEUS_CONTENT_TYPE, headers={
+        'Cache-Control': 'no-store'
+    })
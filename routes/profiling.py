@@ -0,0 +1,138 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, current_app
+from flask_login import login_required
+from utils.decorators import admin_required
+from models import db, RequestProfile
+from utils.pagination import keyset_page, InvalidCursor, DEFAULT_PAGE_SIZE
+from utils.profiling import (
+    format_stats,
+    read_pstats,
+    to_speedscope,
+    remove_profile_file,
+    PROFILE_HEADER,
+    PROFILE_QUERY_PARAMETER
+)
+import json
+import os
+
+profiling = Blueprint('profiling', __name__)
+
+# pstats sort keys offered on the profile page
+STATS_SORT_KEYS = {
+    'cumulative': 'Temps cumulé',
+    'tottime': 'Temps propre',
+    'ncalls': "Nombre d'appels"
+}
+
+def get_profile_or_404(profile_id):
+    return db.get_or_404(RequestProfile, profile_id)
+
+@profiling.route('/admin/profiles')
+@login_required
+@admin_required
+def list_profiles():
+    """
+    List the stored request profiles
+
+    Query Parameters:
+    - sort: 'recent' (default) or 'duration'
+    - route: Only the profiles of one endpoint
+    - cursor: Page cursor
+    """
+    sort = request.args.get('sort', 'recent')
+    query = RequestProfile.query
+    route = request.args.get('route')
+    if route:
+        query = query.filter(RequestProfile.endpoint == route)
+
+    sort_column = RequestProfile.duration_ms if sort == 'duration' else RequestProfile.id
+    try:
+        page = keyset_page(query, sort_column, RequestProfile.id,
+                           cursor=request.args.get('cursor'),
+                           limit=DEFAULT_PAGE_SIZE, descending=True)
+    except InvalidCursor as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('profiling.list_profiles'))
+
+    endpoints = [row.endpoint for row in db.session.query(RequestProfile.endpoint).distinct()
+                 .order_by(RequestProfile.endpoint) if row.endpoint]
+
+    return render_template('admin/profiles/list.html',
+                         profiles=page.items,
+                         next_cursor=page.next_cursor,
+                         sort=sort,
+                         route=route,
+                         endpoints=endpoints,
+                         sample_rate=current_app.config.get('PROFILE_SAMPLE_RATE', 0),
+                         profile_header=PROFILE_HEADER,
+                         profile_parameter=PROFILE_QUERY_PARAMETER)
+
+@profiling.route('/admin/profiles/<int:profile_id>')
+@login_required
+@admin_required
+def view_profile(profile_id):
+    """
+    Show the pstats report of a profile
+
+    Query Parameters:
+    - sort: cumulative (default), tottime or ncalls
+    """
+    profile = get_profile_or_404(profile_id)
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in STATS_SORT_KEYS:
+        sort = 'cumulative'
+
+    try:
+        report = format_stats(profile, sort)
+    except (FileNotFoundError, EOFError, ValueError) as e:
+        current_app.logger.warning(f"Unreadable profile {profile_id}: {e}")
+        report = None
+
+    return render_template('admin/profiles/view.html',
+                         profile=profile,
+                         report=report,
+                         sort=sort,
+                         sort_keys=STATS_SORT_KEYS)
+
+@profiling.route('/admin/profiles/<int:profile_id>/download')
+@login_required
+@admin_required
+def download_profile(profile_id):
+    """
+    Download a profile
+
+    Query Parameters:
+    - format: pstats (default, for pstats/snakeviz) or speedscope (JSON for speedscope.app)
+    """
+    profile = get_profile_or_404(profile_id)
+    fmt = request.args.get('format', 'pstats')
+    basename = os.path.splitext(profile.filename)[0]
+
+    try:
+        if fmt == 'speedscope':
+            body = json.dumps(to_speedscope(profile))
+            mimetype = 'application/json'
+            download_name = f'{basename}.speedscope.json'
+        else:
+            body = read_pstats(profile)
+            mimetype = 'application/octet-stream'
+            download_name = f'{basename}.prof'
+    except FileNotFoundError:
+        flash('Fichier de profil introuvable.', 'danger')
+        return redirect(url_for('profiling.list_profiles'))
+
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={download_name}'
+    })
+
+@profiling.route('/admin/profiles/<int:profile_id>/delete', methods=['POST'])
+@login_required
+@admin_required
+def delete_profile(profile_id):
+    """Delete a profile and its pstats file"""
+    profile = get_profile_or_404(profile_id)
+    filename = profile.filename
+    db.session.delete(profile)
+    db.session.commit()
+    remove_profile_file(filename)
+    flash('Profil supprimé', 'success')
+    return redirect(url_for('profiling.list_profiles'))
@@ -1,23 +1,20 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from models import db, Unit, Zone
+from models import db, Unit, Zone, Center
+from sqlalchemy.orm import selectinload
 from utils.decorators import admin_required
 from utils.permissions import PermissionManager, Permission, UserRole
 
 units = Blueprint('units', __name__)
 
+# The units list only counts the centers of each unit
+UNIT_LIST_LOADER = selectinload(Unit.centers).load_only(Center.id)
+
 @units.route('/admin/units/new', methods=['POST'])
 @login_required
 def new_unit():
-    # Debugging print statements
-    print("DEBUG: new_unit route called")
-    print(f"DEBUG: Form data: {request.form}")
-    print(f"DEBUG: Current user: {current_user.username}")
-    print(f"DEBUG: Current user role: {current_user.role}")
-
     # Check if this is a POST request
     if request.method != 'POST':
-        print("DEBUG: Not a POST request")
         flash('Méthode de requête invalide.', 'danger')
         return redirect(url_for('units.units_list'))
 
@@ -25,7 +22,7 @@ def new_unit():
     current_app.logger.debug(f"new_unit route called")
     current_app.logger.debug(f"Current User: {current_user.username}")
     current_app.logger.debug(f"Current User Role: {current_user.role}")
-    current_app.logger.debug(f"Form Data: {request.form}")
+    current_app.logger.debug(f"Form fields: {sorted(request.form.keys())}")
 
     # Check permission to create units
     if not PermissionManager.has_permission(current_user.role, Permission.CREATE_UNITS):
@@ -171,55 +168,35 @@ def get_zone_units(zone_id):
 @units.route('/list/units')
 @login_required
 def units_list():
-    # Comprehensive debug logging
-    print(f"DEBUG: units_list route called")
-    print(f"DEBUG: Current User - Username: {current_user.username}, Role: {current_user.role}")
-    print(f"DEBUG: Current User ID: {current_user.id}")
-    print(f"DEBUG: Current User Zone ID: {current_user.zone_id}")
-    print(f"DEBUG: Current User Unit ID: {current_user.unit_id}")
-    
     current_app.logger.debug(f"units_list route called. User: {current_user.username}, Role: {current_user.role}")
     
-    # Detailed permission logging
-    print("DEBUG: Checking permissions...")
     has_view_units_permission = PermissionManager.has_permission(current_user.role, Permission.VIEW_ALL_UNITS)
-    print(f"DEBUG: Has VIEW_ALL_UNITS permission: {has_view_units_permission}")
     
     # Check permission to view units
     if not has_view_units_permission:
-        print("DEBUG: User lacks permission to view units")
         current_app.logger.warning(f"User {current_user.username} lacks permission to view units")
         flash('Vous n\'avez pas la permission de voir la liste des unités.', 'danger')
         return redirect(url_for('main_dashboard.dashboard'))
 
-    # Detailed role-based unit retrieval
-    print("DEBUG: Retrieving units based on user role...")
-    
     # Admin and DG see all units and zones
     if current_user.role in [UserRole.ADMIN, UserRole.EMPLOYEUR_DG]:
-        print("DEBUG: User is ADMIN or DG - retrieving all units")
-        units = Unit.query.all()
+        units = Unit.query.options(UNIT_LIST_LOADER).all()
         zones = Zone.query.all()
     # Zone employers see units in their zone
     elif current_user.role == UserRole.EMPLOYEUR_ZONE:
-        print(f"DEBUG: User is ZONE EMPLOYER - retrieving units for zone {current_user.zone_id}")
-        units = Unit.query.filter_by(zone_id=current_user.zone_id).all()
+        units = Unit.query.filter_by(zone_id=current_user.zone_id).options(UNIT_LIST_LOADER).all()
         zones = [Zone.query.get(current_user.zone_id)]
     # Unit officers see their own unit
     elif current_user.role == UserRole.UNIT_OFFICER:
-        print(f"DEBUG: User is UNIT OFFICER - retrieving unit {current_user.unit_id}")
         units = [Unit.query.get(current_user.unit_id)] if current_user.unit_id else []
         zones = [Zone.query.get(current_user.zone_id)] if current_user.zone_id else []
     # Other roles get limited or no access
     else:
-        print(f"DEBUG: User has limited/no access. Role: {current_user.role}")
         current_app.logger.warning(f"User {current_user.username} with role {current_user.role} has no unit access")
         units = []
         zones = []
     
-    print(f"DEBUG: Units found: {len(units)}, Zones found: {len(zones)}")
     current_app.logger.debug(f"Units found: {len(units)}, Zones found: {len(zones)}")
     
     # Ensure we're using the correct template
-    print("DEBUG: Rendering units_management.html")
     return render_template('units/units_management.html', units=units, zones=zones)
@@ -207,10 +207,8 @@ def update_user(user_id):
 @admin_required
 def create_user():
     try:
-        # Debug: Print all form data with more details
-        print("DEBUG: Incoming form data:")
-        for key, value in request.form.items():
-            print(f"{key}: {value}")
+        # Field names only: the form holds the password
+        current_app.logger.debug(f"User creation form fields: {sorted(request.form.keys())}")
         
         # Get form data
         username = request.form.get('username')
@@ -237,7 +235,7 @@ def create_user():
                 missing_fields.append('unit_id')
 
         if missing_fields:
-            print(f"DEBUG: Missing fields for {role} role: {missing_fields}")
+            current_app.logger.debug(f"Missing fields for {role} role: {missing_fields}")
             message = f"Champs requis manquants: {', '.join(missing_fields)}"
             return jsonify({'success': False, 'message': message}), 400
 
@@ -332,7 +330,7 @@ def get_zone_units(zone_id):
         })
 
     except Exception as e:
-        print(f"Error fetching units: {str(e)}")  # Add logging for debugging
+        current_app.logger.error(f"Error fetching units: {str(e)}")
         return jsonify({
             'success': False,
             'message': f"Error fetching units: {str(e)}"
@@ -1,12 +1,18 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify, send_file, current_app, Response, stream_with_context, url_for
 from flask_login import login_required, current_user
+from models import db, Infrastructure, WaterQualityAssessment
 from utils.water_quality import (
+    PARAMETERS,
     assess_water_quality, 
     get_parameter_metadata,
-    generate_pdf_report
+    render_pdf_report
 )
+from utils.data_export import ENCODERS, EXPORT_FORMATS
+from utils.metrics import UPLOAD_PROCESSING_DURATION
 from utils.url_endpoints import *
+from werkzeug.utils import secure_filename
 from datetime import datetime
+import io
 import os
 
 water_quality = Blueprint('water_quality', __name__)
@@ -19,39 +25,109 @@ def water_quality_assessment_route():
     
     Returns:
         Rendered water quality assessment template with parameter metadata
+        and the STEPs samples can be linked to
     """
+    from utils.water_quality_store import get_steps
+    
     return render_template('departement/reuse/water_quality.html', 
                          active_page='water_quality',
-                         parameter_metadata=get_parameter_metadata())
+                         parameter_metadata=get_parameter_metadata(),
+                         steps=get_steps())
 
 @water_quality.route('/reuse/water-quality/assessment/evaluate', methods=['POST'])
 @login_required
 def water_quality_evaluation_route():
     """
-    Assess water quality based on submitted parameters.
+    Assess water quality based on submitted parameters and store the sample
+    with its assessment.
+    
+    Form Parameters:
+    - One field per parameter (ids of PARAMETERS)
+    - infrastructure_id: Optional STEP where the sample was taken
+    - sampled_at: Optional sampling date, now by default
+    - reference: Optional laboratory reference
     
     Returns:
-        JSON response with water quality assessment results
+        JSON response with water quality assessment results, the id of the
+        stored assessment and the URL of its results page
     """
-    # Get form data
-    data = request.form.to_dict()
+    from utils.water_quality_store import record_assessment, parse_sample_date
     
-    # Convert string values to appropriate types
-    for key, value in data.items():
+    # Get form data
+    data = {}
+    for param_id in PARAMETERS:
         try:
-            data[key] = float(value)
+            data[param_id] = float(request.form.get(param_id, ''))
         except ValueError:
-            pass
+            return jsonify({
+                'success': False,
+                'message': f'Valeur invalide ou manquante pour le paramètre {param_id}'
+            }), 400
+    
+    infrastructure_id = request.form.get('infrastructure_id', type=int)
+    if infrastructure_id is not None and db.session.get(Infrastructure, infrastructure_id) is None:
+        return jsonify({
+            'success': False,
+            'message': 'Infrastructure introuvable'
+        }), 400
+    
+    sampled_at = None
+    if request.form.get('sampled_at'):
+        sampled_at = parse_sample_date(request.form['sampled_at'])
+        if sampled_at is None:
+            return jsonify({
+                'success': False,
+                'message': 'Date de prélèvement invalide'
+            }), 400
     
     # Perform water quality assessment
     result = assess_water_quality(data)
+    assessment = record_assessment(
+        result,
+        infrastructure_id=infrastructure_id,
+        sampled_at=sampled_at,
+        reference=request.form.get('reference', '').strip()[:100],
+        user_id=current_user.id
+    )
+    result['assessment_id'] = assessment.id
+    result['results_url'] = url_for('water_quality.water_quality_result', assessment_id=assessment.id)
     return jsonify(result)
 
+@water_quality.route('/reuse/water-quality/results/<int:assessment_id>', endpoint='water_quality_result')
+@login_required
+def water_quality_result_route(assessment_id):
+    """
+    Display a stored water quality assessment.
+    
+    Returns:
+        Rendered water quality results template
+    """
+    from utils.water_quality_store import assessment_result
+    
+    result = assessment_result(db.get_or_404(WaterQualityAssessment, assessment_id))
+    result['parameter_metadata'] = get_parameter_metadata()
+    return render_template('departement/reuse/water_quality_results.html', **result)
+
+@water_quality.route('/reuse/water-quality/results/<int:assessment_id>/pdf', endpoint='download_water_quality_assessment_pdf')
+@login_required
+def download_water_quality_assessment_pdf_route(assessment_id):
+    """
+    Generate and download the PDF report of a stored water quality assessment.
+    
+    Returns:
+        PDF file download
+    """
+    from utils.water_quality_store import assessment_result
+    
+    result = assessment_result(db.get_or_404(WaterQualityAssessment, assessment_id))
+    return send_water_quality_pdf(result, f'Rapport_Qualite_Eau_{assessment_id}.pdf')
+
 @water_quality.route('/reuse/water-quality/results', endpoint='water_quality_results')
 @login_required
 def water_quality_results_route():
     """
-    Display water quality assessment results.
+    Display water quality assessment results computed from the query string
+    (links created before assessments were stored; new ones use water_quality_result).
     
     Returns:
         Rendered water quality results template
@@ -99,28 +175,194 @@ def download_water_quality_pdf_route():
         
         # Generate PDF with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'Rapport_Qualite_Eau_{timestamp}.pdf'
-        pdf_path = generate_pdf_report(result)
-        
-        try:
-            # Send file for download with proper headers
-            response = send_file(
-                pdf_path,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=filename
-            )
-            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
-            return response
-        finally:
-            # Clean up the temporary file after sending
-            try:
-                os.unlink(pdf_path)
-            except:
-                pass
+        return send_water_quality_pdf(result, f'Rapport_Qualite_Eau_{timestamp}.pdf')
     except Exception as e:
         # Log the error (you might want to use a proper logging mechanism)
         print(f"Error generating water quality PDF: {str(e)}")
         return jsonify({"error": "Failed to generate PDF"}), 500
+
+def send_water_quality_pdf(result, filename):
+    """
+    Render the PDF report of an assessment result in memory and send it as a download.
+    
+    Args:
+        result: Assessment result dictionary
+        filename: Name of the downloaded file
+    
+    Returns:
+        PDF file response
+    """
+    # Send the rendered document for download with proper headers
+    response = send_file(
+        io.BytesIO(render_pdf_report(result)),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=filename
+    )
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Expires"] = "0"
+    return response
+
+@water_quality.route('/reuse/water-quality/batch', methods=['POST'])
+@login_required
+def water_quality_batch_route():
+    """
+    Assess every sample of an uploaded laboratory result file (CSV or XLSX).
+    
+    Form Parameters:
+    - file: File with one sample per row and one column per parameter
+    - limit: Samples returned in the results table (500 by default)
+    - format: 'csv' or 'jsonl' to download the results of all the samples instead
+    - store: Store the samples and their assessments (dated by the 'date' column)
+    - infrastructure_id: Optional STEP of the stored samples
+    
+    Returns:
+        JSON response with the summary, the results table and the invalid rows,
+        or the streamed results file
+    """
+    # NumPy is only loaded when a batch is assessed
+    from utils.water_quality_batch import assess_file, detect_format, iter_results, BatchFormatError, RESULT_COLUMNS
+    
+    # Lab files may be larger than regular attachments, the request body limit still applies
+    request.max_file_size = current_app.config.get('MAX_CONTENT_LENGTH')
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({
+            'success': False,
+            'message': 'Aucun fichier fourni'
+        }), 400
+    
+    try:
+        limit = max(int(request.form.get('limit', 500)), 0)
+    except ValueError:
+        limit = 500
+    
+    infrastructure_id = request.form.get('infrastructure_id', type=int)
+    if infrastructure_id is not None and db.session.get(Infrastructure, infrastructure_id) is None:
+        return jsonify({
+            'success': False,
+            'message': 'Infrastructure introuvable'
+        }), 400
+    
+    try:
+        with UPLOAD_PROCESSING_DURATION.time(kind='water_quality_batch'):
+            samples, assessment, summary = assess_file(file.stream, detect_format(file.filename))
+    except BatchFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    current_app.logger.info(
+        f"Water quality batch {file.filename}: {summary['assessed']} samples assessed, "
+        f"{summary['invalid']} invalid"
+    )
+    
+    stored = None
+    if request.form.get('store'):
+        from utils.water_quality_store import store_batch
+        stored = store_batch(iter_results(samples, assessment), summary['rules_version'],
+                             infrastructure_id=infrastructure_id, user_id=current_user.id)
+        current_app.logger.info(f"Water quality batch {file.filename}: {stored['stored']} samples stored")
+    
+    fmt = request.form.get('format')
+    if fmt in ENCODERS:
+        rows = (
+            [row[column] for column in RESULT_COLUMNS]
+            for row in iter_results(samples, assessment)
+        )
+        name = os.path.splitext(secure_filename(file.filename))[0] or 'echantillons'
+        return Response(
+            stream_with_context(ENCODERS[fmt](list(RESULT_COLUMNS), rows)),
+            mimetype=EXPORT_FORMATS[fmt]['mimetype'],
+            headers={
+                'Content-Disposition': f"attachment; filename=evaluation_{name}{EXPORT_FORMATS[fmt]['extension']}",
+                'Cache-Control': 'no-store'
+            }
+        )
+    
+    return jsonify({
+        'success': True,
+        'summary': summary,
+        'columns': list(RESULT_COLUMNS),
+        'results': list(iter_results(samples, assessment, 0, limit)),
+        'truncated': summary['assessed'] > limit,
+        'error_count': samples['error_count'],
+        'errors': samples['errors'],
+        'stored': stored
+    }), 200
+
+@water_quality.route('/reuse/water-quality/trends/<int:infrastructure_id>/parameters')
+@login_required
+def water_quality_parameter_trends_route(infrastructure_id):
+    """
+    Per-parameter series of the samples stored for an infrastructure.
+    
+    Query Parameters:
+    - start, end: Date range (YYYY-MM-DD or YYYY-MM-DDTHH:MM), the last year by default
+    - parameters: Comma-separated parameter ids, all by default
+    - points: Maximum points per series (200 by default), min/mean/max per bucket beyond
+    
+    Returns:
+        JSON response with the timestamps and the series of each parameter
+    """
+    from utils.water_quality_store import parameter_series, parse_trend_range, WaterQualityStoreError
+    
+    infrastructure = db.get_or_404(Infrastructure, infrastructure_id)
+    try:
+        start, end, points = parse_trend_range(request.args)
+        parameters = [param_id for param_id in request.args.get('parameters', '').split(',') if param_id]
+        series = parameter_series(infrastructure.id, start, end, parameters, points)
+    except WaterQualityStoreError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'infrastructure': {'id': infrastructure.id, 'nom': infrastructure.nom},
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        **series
+    }), 200
+
+@water_quality.route('/reuse/water-quality/trends/<int:infrastructure_id>/compliance')
+@login_required
+def water_quality_compliance_trends_route(infrastructure_id):
+    """
+    Rolling compliance rates of the samples stored for an infrastructure.
+    
+    Query Parameters:
+    - start, end: Date range (YYYY-MM-DD or YYYY-MM-DDTHH:MM), the last year by default
+    - window: Rolling window in days (30 by default)
+    - points: Dates at which the rates are computed (200 by default)
+    
+    Returns:
+        JSON response with the compliance rate and the micro rating rates at each date
+    """
+    from utils.water_quality_store import compliance_series, parse_trend_range, WaterQualityStoreError, DEFAULT_WINDOW_DAYS
+    
+    infrastructure = db.get_or_404(Infrastructure, infrastructure_id)
+    try:
+        start, end, points = parse_trend_range(request.args)
+        try:
+            window = int(request.args.get('window', DEFAULT_WINDOW_DAYS))
+        except ValueError:
+            raise WaterQualityStoreError(f"Fenêtre invalide: '{request.args.get('window')}'")
+        series = compliance_series(infrastructure.id, start, end, window, points)
+    except WaterQualityStoreError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'infrastructure': {'id': infrastructure.id, 'nom': infrastructure.nom},
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        **series
+    }), 200
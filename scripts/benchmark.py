@@ -0,0 +1,408 @@
+"""
+Endpoint benchmark: latency percentiles and throughput of the main pages,
+compared against a stored baseline.
+
+The application runs on its own SQLite database (instance/benchmark.db by
+default) and upload directory (instance/benchmark_uploads next to it),
+filled with utils.synthetic_data.generate_dataset. The database is
+reused as long as its dataset parameters are unchanged, and regenerated
+otherwise (or with --regenerate). A 'benchmark_admin' account is added next
+to the synthetic ones.
+
+Two modes, --mode both by default:
+
+- client: the Flask test client, one request at a time. Measures the time
+  spent in the application (routing, queries, templates, PDF rendering).
+- http: the app served by waitress (utils.server settings) on a local port,
+  and --concurrency threads sending requests over keep-alive connections.
+  Adds the server, the sockets and the contention between threads.
+
+Each scenario reports p50/p95/p99/mean latency in ms, requests per second
+and errors (any status other than the expected one). With --baseline, the
+p95 and the throughput of every scenario are compared against the baseline
+file, and the script exits with status 1 when one of them is worse by more
+than --tolerance, or when any request of a scenario fails.
+The baseline depends on the machine: record it (--save-baseline) on the one
+that runs the comparisons.
+
+Usage:
+    python scripts/benchmark.py [--mode both] [--incidents 100000] [--requests 30]
+                                [--concurrency 8] [--only list,dashboard]
+                                [--output results.json] [--baseline benchmarks/baseline.json]
+                                [--save-baseline] [--tolerance 0.25]
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_DATABASE = os.path.join(PROJECT_ROOT, 'instance', 'benchmark.db')
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, 'benchmarks', 'baseline.json')
+
+ADMIN_USERNAME = 'benchmark_admin'
+
+# Sample of the water quality form, within the reuse norms for most parameters
+WATER_SAMPLE = {
+    'coliform_fecal': '250', 'nematodes': '0.5', 'ph': '7.4', 'mes': '28', 'ce': '2.4',
+    'dbo5': '22', 'dco': '75', 'chlorure': '8', 'cadmium': '0.004', 'mercury': '0.0005',
+    'arsenic': '0.03', 'lead': '0.8'
+}
+
+# Latencies below this many ms are never reported as regressions, the noise dominates
+MIN_REGRESSION_MS = 2.0
+
+def scenarios(incident_id):
+    """
+    Benchmarked requests: (name, user, method, path, form data, weight).
+
+    user is 'admin' (sees every incident) or 'unit' (a user of a unit, sees the
+    incidents of its unit); weight divides the request count of slow scenarios.
+    """
+    water_query = urllib.parse.urlencode(WATER_SAMPLE)
+    return [
+        ('list', 'admin', 'GET', '/list', None, 1),
+        ('list_page_50', 'admin', 'GET', '/list?page=50', None, 1),
+        ('list_sort_date_asc', 'admin', 'GET', '/list?sort=date_asc', None, 1),
+        ('list_sort_gravite', 'admin', 'GET', '/list?sort=gravite', None, 1),
+        ('list_sort_status', 'admin', 'GET', '/list?sort=status', None, 1),
+        ('list_sort_unit', 'admin', 'GET', '/list?sort=unit', None, 1),
+        ('list_status_en_cours', 'admin', 'GET', '/list?status=En+cours', None, 1),
+        ('list_search', 'admin', 'GET', '/list?search=Oran', None, 1),
+        ('list_zone', 'admin', 'GET', '/list?zone=1', None, 1),
+        ('list_unit', 'admin', 'GET', '/list?unit=1', None, 1),
+        ('list_unit_user', 'unit', 'GET', '/list', None, 1),
+        ('dashboard', 'admin', 'GET', '/dashboard', None, 1),
+        ('dashboard_unit_user', 'unit', 'GET', '/dashboard', None, 1),
+        ('statistiques', 'admin', 'GET', '/departement/statistiques', None, 1),
+        ('statistiques_unit_user', 'unit', 'GET', '/departement/statistiques', None, 1),
+        ('view_incident', 'admin', 'GET', f'/incident/{incident_id}', None, 1),
+        ('export_incident_pdf', 'admin', 'GET', f'/incident/{incident_id}/export_pdf', None, 2),
+        ('export_all_pdf_unit_user', 'unit', 'GET', '/incidents/export/all/pdf', None, 40),
+        ('water_quality_evaluate', 'admin', 'POST', '/reuse/water-quality/assessment/evaluate', WATER_SAMPLE, 1),
+        ('water_quality_results', 'admin', 'GET', f'/reuse/water-quality/results?{water_query}', None, 1),
+        ('water_quality_pdf', 'admin', 'GET', f'/reuse/water-quality/download-pdf?{water_query}', None, 2),
+        ('infrastructures', 'admin', 'GET', '/infrastructures', None, 1),
+        ('admin_table_incidents', 'admin', 'GET', '/admin/database/table/incidents', None, 1),
+    ]
+
+def percentile(sorted_values, fraction):
+    """Linear interpolation between the closest ranks"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None
+    }
+
+def prepare_database(app, dataset, regenerate):
+    """Generate the synthetic dataset unless the database already holds the same one"""
+    from models import db, User, Incident
+    from utils.permissions import UserRole
+    from utils.synthetic_data import generate_dataset, SYNTHETIC_PASSWORD
+
+    database = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    manifest = database + '.json'
+    current = None
+    if os.path.exists(database) and os.path.exists(manifest):
+        with open(manifest) as handle:
+            current = json.load(handle)
+    if regenerate or current != dataset:
+        for path in (database, manifest):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(app.config['UPLOAD_DIR'], ignore_errors=True)
+        os.makedirs(os.path.dirname(database), exist_ok=True)
+        print(f"Generating the dataset in {database} ({dataset['incidents']} incidents)...")
+        with app.app_context():
+            db.create_all()
+            counts = generate_dataset(**dataset)
+            admin_user = User(username=ADMIN_USERNAME, role=UserRole.ADMIN)
+            admin_user.set_password(SYNTHETIC_PASSWORD)
+            db.session.add(admin_user)
+            db.session.commit()
+        print(f"  done in {counts['elapsed_seconds']} s")
+        with open(manifest, 'w') as handle:
+            json.dump(dataset, handle, indent=2)
+
+    with app.app_context():
+        unit_user = User.query.filter(
+            User.role == UserRole.UTILISATEUR, User.username.like('synth_%')
+        ).order_by(User.id).first()
+        incident_count = Incident.query.count()
+        # An incident in the middle of the table, neither the newest nor the oldest rows
+        incident = Incident.query.order_by(Incident.id).offset(incident_count // 2).first()
+        db.engine.dispose()
+    return {
+        'admin': (ADMIN_USERNAME, SYNTHETIC_PASSWORD),
+        'unit': (unit_user.username, SYNTHETIC_PASSWORD)
+    }, incident.id
+
+def run_client(app, accounts, selected, requests_count, warmup):
+    """Sequential requests through the Flask test client"""
+    clients = {}
+    for role, (username, password) in accounts.items():
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': password})
+        if response.status_code != 302:
+            raise RuntimeError(f"Login of {username} failed ({response.status_code})")
+        clients[role] = client
+
+    results = {}
+    for name, role, method, path, data, weight in selected:
+        client = clients[role]
+        count = max(requests_count // weight, 3)
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for index in range(warmup + count):
+            request_started = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            response.get_data()
+            elapsed = time.perf_counter() - request_started
+            response.close()
+            if index < warmup:
+                started = time.perf_counter()
+                continue
+            if response.status_code != 200:
+                errors += 1
+            latencies.append(elapsed)
+        results[name] = summarize(latencies, errors, time.perf_counter() - started)
+        print_row(name, results[name])
+    return results
+
+def _http_login(port, username, password):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request('POST', '/login', urllib.parse.urlencode({'username': username, 'password': password}),
+                       {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    if response.status != 302:
+        raise RuntimeError(f"Login of {username} failed ({response.status})")
+    return '; '.join(value.split(';')[0] for key, value in response.getheaders() if key.lower() == 'set-cookie')
+
+def run_http(app, accounts, selected, requests_count, warmup, concurrency):
+    """Concurrent requests over keep-alive connections to a local waitress server"""
+    from waitress import create_server
+    from utils.server import waitress_options
+
+    # 'Task queue depth' warnings on every burst, the latencies already show the queueing
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+    options = waitress_options()
+    options['threads'] = max(options['threads'], concurrency)
+    server = create_server(app, host='127.0.0.1', port=0, **options)
+    port = server.effective_port
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    try:
+        cookies = {role: _http_login(port, *credentials) for role, credentials in accounts.items()}
+        results = {}
+        for name, role, method, path, data, weight in selected:
+            body = urllib.parse.urlencode(data) if data else None
+            headers = {'Cookie': cookies[role]}
+            if body:
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            count = max(requests_count * concurrency // weight, concurrency)
+            results[name] = _http_scenario(port, method, path, body, headers, count, warmup, concurrency)
+            print_row(name, results[name])
+        return results
+    finally:
+        server.close()
+
+def _http_scenario(port, method, path, body, headers, count, warmup, concurrency):
+    tickets = itertools.count()
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker(measure):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        own, own_errors = [], 0
+        while next(tickets) < (count if measure else warmup * concurrency):
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                continue
+            own.append(time.perf_counter() - started)
+            if response.status != 200:
+                own_errors += 1
+            if response.will_close:
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        connection.close()
+        if measure:
+            with lock:
+                latencies.extend(own)
+                errors[0] += own_errors
+
+    def run_threads(measure):
+        threads = [threading.Thread(target=worker, args=(measure,)) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    if warmup:
+        run_threads(False)
+        tickets = itertools.count()
+    started = time.perf_counter()
+    run_threads(True)
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+def print_row(name, result):
+    def cell(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+    print(f"  {name:<28}{cell(result['p50_ms'])}{cell(result['p95_ms'])}{cell(result['p99_ms'])}"
+          f"{cell(result['throughput_rps'])}{result['errors']:>7}")
+
+def print_header(title):
+    print(f"\n{title}")
+    print(f"  {'scenario':<28}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>7}")
+
+def compare(results, baseline, tolerance):
+    """Scenarios whose p95 or throughput is worse than the baseline by more than tolerance, or with errors"""
+    regressions = []
+    for mode, scenarios_results in results['modes'].items():
+        reference = baseline.get('modes', {}).get(mode, {})
+        for name, result in scenarios_results.items():
+            before = reference.get(name)
+            if not before:
+                continue
+            if (result['p95_ms'] is not None and before.get('p95_ms')
+                    and result['p95_ms'] > before['p95_ms'] * (1 + tolerance)
+                    and result['p95_ms'] - before['p95_ms'] > MIN_REGRESSION_MS):
+                regressions.append((mode, name, 'p95_ms', before['p95_ms'], result['p95_ms']))
+            if (result['throughput_rps'] is not None and before.get('throughput_rps')
+                    and result['throughput_rps'] < before['throughput_rps'] * (1 - tolerance)):
+                regressions.append((mode, name, 'throughput_rps', before['throughput_rps'], result['throughput_rps']))
+            if result['errors']:
+                regressions.append((mode, name, 'errors', before.get('errors', 0), result['errors']))
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='SQLite file of the benchmark dataset')
+    parser.add_argument('--regenerate', action='store_true', help='Regenerate the dataset even if unchanged')
+    parser.add_argument('--incidents', type=int, default=100000, help='Incidents of the dataset')
+    parser.add_argument('--zones', type=int, default=10, help='Zones of the dataset')
+    parser.add_argument('--infrastructures', type=int, default=500, help='Infrastructures of the dataset')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the dataset')
+    parser.add_argument('--requests', type=int, default=30,
+                        help='Measured requests per scenario (per thread in http mode, fewer for the PDF exports)')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per scenario (per thread)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads in http mode')
+    parser.add_argument('--only', help='Comma separated scenario names (or prefixes) to run')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help=f'Compare against this results file (e.g. {os.path.relpath(DEFAULT_BASELINE, PROJECT_ROOT)})')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results to the --baseline file instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed degradation of p95 and throughput against the baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_FILE', '')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from app import create_app
+
+    database = os.path.abspath(args.database)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        # The synthetic files belong to this database, not to the app's upload directory
+        'UPLOAD_DIR': os.path.splitext(database)[0] + '_uploads',
+        'PROFILING_ENABLED': False
+    })
+    dataset = {
+        'zones': args.zones,
+        'incidents': args.incidents,
+        'infrastructures': args.infrastructures,
+        'seed': args.seed
+    }
+    accounts, incident_id = prepare_database(app, dataset, args.regenerate)
+
+    selected = scenarios(incident_id)
+    if args.only:
+        prefixes = [prefix.strip() for prefix in args.only.split(',') if prefix.strip()]
+        selected = [scenario for scenario in selected if any(scenario[0].startswith(prefix) for prefix in prefixes)]
+        if not selected:
+            parser.error(f"No scenario matches --only {args.only}")
+
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'dataset': dataset,
+        'settings': {'requests': args.requests, 'warmup': args.warmup, 'concurrency': args.concurrency},
+        'modes': {}
+    }
+    if args.mode in ('client', 'both'):
+        print_header('Test client (sequential)')
+        results['modes']['client'] = run_client(app, accounts, selected, args.requests, args.warmup)
+    if args.mode in ('http', 'both'):
+        print_header(f'HTTP, waitress ({args.concurrency} concurrent connections)')
+        results['modes']['http'] = run_http(app, accounts, selected, args.requests, args.warmup, args.concurrency)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline and args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        if baseline.get('dataset') != dataset:
+            print(f"\nWarning: the baseline was measured on another dataset ({baseline.get('dataset')})")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (revision {baseline.get('revision')}):")
+            for mode, name, metric, before, after in regressions:
+                print(f"  {mode:<7}{name:<28}{metric:<16}{before:>10} -> {after}")
+            sys.exit(1)
+        print(f"\nNo regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == '__main__':
+    main()
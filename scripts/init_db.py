@@ -6,12 +6,17 @@ from werkzeug.security import generate_password_hash
 # Add the parent directory to the Python path so we can import our models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app, db
-from models import Unit, User, Zone, Center
+from flask import current_app, has_app_context
+from app import create_app
+from models import db, Unit, User, Zone, Center
 from utils.permissions import UserRole
 
+def get_app():
+    """The running application (flask init-db), or a new one when run as a script"""
+    return current_app._get_current_object() if has_app_context() else create_app()
+
 def init_database():
-    with app.app_context():
+    with get_app().app_context():
         # Create all tables
         db.create_all()
 
@@ -0,0 +1,143 @@
+"""
+PDF report benchmark: reports rendered per second.
+
+Renders --reports water quality reports (assessments of seeded random
+samples) and --reports incident reports of --incidents incidents each,
+in memory, and reports for each kind:
+
+- the first report, which also decodes the logo (get_logo)
+- reports per second and the p50/p95 render time of the following ones,
+  one at a time and with --threads concurrent renders
+- the size of a report
+
+Incidents are plain records with the fields the report prints, no
+database is needed.
+
+Usage:
+    python scripts/pdf_benchmark.py [--reports 200] [--incidents 20] [--threads 4] [--seed 42] [--output pdf.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.water_quality import PARAMETERS, assess_water_quality
+from utils.pdf_generator import render_incident_pdf, render_water_quality_pdf
+
+# (low, high) of the uniform draw of each parameter, around its thresholds
+SAMPLE_RANGES = {
+    'coliform_fecal': (0, 1500),
+    'nematodes': (0, 1.5),
+    'ph': (6.0, 9.0),
+    'mes': (0, 40),
+    'ce': (0, 4),
+    'dbo5': (0, 40),
+    'dco': (0, 120),
+    'chlorure': (0, 12),
+    'cadmium': (0, 0.06),
+    'mercury': (0, 0.0025),
+    'arsenic': (0, 0.55),
+    'lead': (0, 0.06)
+}
+
+WILAYAS = ['Alger', 'Blida', 'Tipaza', 'Boumerdès', 'Oran', 'Sétif']
+
+def water_quality_results(rng, count):
+    return [
+        assess_water_quality({
+            param_id: round(rng.uniform(*SAMPLE_RANGES[param_id]), 4) for param_id in PARAMETERS
+        })
+        for _ in range(count)
+    ]
+
+def incident_lists(rng, count, per_report):
+    return [
+        [
+            SimpleNamespace(
+                wilaya=rng.choice(WILAYAS),
+                commune=f'Commune {rng.randint(1, 40)}',
+                localite=f'Cité {rng.randint(1, 200)}',
+                nature_cause='Obstruction du collecteur principal par des dépôts ' * rng.randint(1, 3),
+                date_incident=datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 500000)),
+                mesures_prises=rng.choice([None, 'Curage et désobstruction du réseau']),
+                impact='Débordement sur la voie publique'
+            )
+            for _ in range(per_report)
+        ]
+        for _ in range(count)
+    ]
+
+def measure(render, inputs, threads):
+    """First render, then the others one at a time and with `threads` concurrent renders"""
+    started = time.perf_counter()
+    document = render(inputs[0])
+    first = time.perf_counter() - started
+
+    durations = []
+    started = time.perf_counter()
+    for item in inputs[1:]:
+        call_started = time.perf_counter()
+        render(item)
+        durations.append(time.perf_counter() - call_started)
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(render, inputs[1:]))
+    concurrent = time.perf_counter() - started
+
+    durations.sort()
+    return {
+        'first_ms': round(first * 1000, 1),
+        'p50_ms': round(statistics.median(durations) * 1000, 2),
+        'p95_ms': round(durations[int(len(durations) * 0.95)] * 1000, 2),
+        'reports_per_second': round(len(durations) / sequential, 1),
+        'concurrent_reports_per_second': round(len(durations) / concurrent, 1),
+        'size_kb': round(len(document) / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reports', type=int, default=200, help='Reports rendered per kind')
+    parser.add_argument('--incidents', type=int, default=20, help='Incidents per incident report')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent renders of the threaded run')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the samples and incidents')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reports = max(args.reports, 2)
+    report = {
+        'reports': reports,
+        'threads': args.threads,
+        'water_quality': measure(render_water_quality_pdf, water_quality_results(rng, reports), args.threads),
+        'incidents': measure(
+            lambda incidents: render_incident_pdf(incidents, 'Unité de Benchmark'),
+            incident_lists(rng, reports, args.incidents),
+            args.threads
+        )
+    }
+
+    for kind, label in (('water_quality', 'Water quality report'), ('incidents', f'Incident report ({args.incidents} incidents)')):
+        results = report[kind]
+        print(f"{label}, {results['size_kb']} KB")
+        print(f"  first report            {results['first_ms']:>8} ms")
+        print(f"  p50 / p95               {results['p50_ms']:>8} / {results['p95_ms']} ms")
+        print(f"  reports/s               {results['reports_per_second']:>8}")
+        print(f"  reports/s ({args.threads} threads)   {results['concurrent_reports_per_second']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+if __name__ == '__main__':
+    main()
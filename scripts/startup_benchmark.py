@@ -0,0 +1,143 @@
+"""
+Startup benchmark: cold-start time and memory of one worker.
+
+Each run starts a fresh interpreter with `python -X importtime`, creates the
+application and reports:
+
+- the wall time of the imports and of create_app()
+- the resident memory (RSS) of the process once the app is created, i.e. what
+  every worker pays before serving its first request
+- the RSS after the lazily imported modules (reportlab, Pillow, requests, NumPy) are
+  loaded, i.e. a worker that has produced a PDF, processed an image,
+  called the AI API and assessed a water quality batch
+- the slowest imports (cumulative time, from -X importtime)
+
+Usage:
+    python scripts/startup_benchmark.py [--runs 5] [--top 15] [--output startup.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the views import on first use
+LAZY_MODULES = ('utils.pdf_generator', 'PIL.Image', 'requests', 'openpyxl', 'utils.water_quality_batch')
+
+STARTUP_MARKER = 'startup-benchmark: app created'
+
+# Runs in the child interpreter, prints one JSON line on stdout
+CHILD_SCRIPT = '''
+import json, os, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({'PROFILING_ENABLED': False})
+created = time.perf_counter()
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+rss_app = rss_kb()
+loaded_at_startup = [name for name in %r if name in sys.modules]
+# The import times after this line are not part of the startup
+sys.stderr.write(%r + '\\n')
+sys.stderr.flush()
+import importlib
+for name in %r:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'rss_app_kb': rss_app,
+    'rss_loaded_kb': rss_kb(),
+    'loaded_at_startup': loaded_at_startup
+}))
+''' % (LAZY_MODULES, STARTUP_MARKER, LAZY_MODULES)
+
+def parse_importtime(stderr):
+    """{module: cumulative microseconds} of the startup imports, from the -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if line == STARTUP_MARKER:
+            break
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative_us)
+    return modules
+
+def run_once():
+    env = dict(os.environ, LOG_FILE='', LOG_LEVEL='WARNING', PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{result.stderr[-2000:]}")
+    measures = json.loads(result.stdout.strip().splitlines()[-1])
+    measures['imports'] = parse_importtime(result.stderr)
+    return measures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Interpreters started (the median is reported)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports listed')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    def median(key):
+        return statistics.median(run[key] for run in runs)
+
+    imports = {}
+    for run in runs:
+        for name, cumulative_us in run['imports'].items():
+            imports.setdefault(name, []).append(cumulative_us)
+    slowest = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in imports.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    loaded_at_startup = sorted({name for run in runs for name in run['loaded_at_startup']})
+
+    results = {
+        'runs': args.runs,
+        'python': sys.version.split()[0],
+        'import_ms': round(median('import_ms'), 1),
+        'create_app_ms': round(median('create_app_ms'), 1),
+        'startup_ms': round(median('import_ms') + median('create_app_ms'), 1),
+        'rss_app_mb': round(median('rss_app_kb') / 1024, 1),
+        'rss_loaded_mb': round(median('rss_loaded_kb') / 1024, 1),
+        'lazy_modules_loaded_at_startup': loaded_at_startup,
+        'slowest_imports_ms': [[name, round(ms, 1)] for name, ms in slowest]
+    }
+
+    print(f"Startup (median of {args.runs}): {results['startup_ms']} ms "
+          f"(imports {results['import_ms']} ms, create_app {results['create_app_ms']} ms)")
+    print(f"Worker RSS: {results['rss_app_mb']} MB after startup, "
+          f"{results['rss_loaded_mb']} MB with {', '.join(LAZY_MODULES)} loaded")
+    if loaded_at_startup:
+        print(f"Warning: imported at startup: {', '.join(loaded_at_startup)}")
+    print('Slowest imports (cumulative ms):')
+    for name, ms in results['slowest_imports_ms']:
+        print(f"  {ms:8.1f}  {name}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Water quality batch benchmark: vectorised batch assessment against the
+one-sample-at-a-time assess_water_quality.
+
+Generates --samples random samples (seeded, spread around the thresholds so
+every rating and violation occurs), writes them as a CSV file in memory and
+reports the time of:
+
+- load_samples: parsing the CSV into NumPy columns
+- assess_batch: the vectorised ratings and violations
+- summarize_batch: the aggregated summary
+- iter_results: converting every result back to Python dicts
+- assess_water_quality called once per sample (the single form path)
+- assess_water_quality on --repeated distinct samples assessed again and
+  again (the results page and PDF of the same sample), with the memo
+  disabled and enabled
+
+Every sample is checked to get the same rating, allowed crops, restrictions
+and violations from both paths.
+
+Usage:
+    python scripts/water_quality_benchmark.py [--samples 100000] [--seed 42] [--repeated 1000] [--xlsx] [--output wq.json]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.water_quality import assess_water_quality, assessment_memo, get_rules, RATING_CLASSIFICATIONS
+from utils.water_quality_batch import (
+    PARAMETERS, load_samples, assess_batch, summarize_batch, iter_results
+)
+
+# (low, high) of the uniform draw of each parameter, around its thresholds
+SAMPLE_RANGES = {
+    'coliform_fecal': (0, 1500),
+    'nematodes': (0, 1.5),
+    'ph': (6.0, 9.0),
+    'mes': (0, 40),
+    'ce': (0, 4),
+    'dbo5': (0, 40),
+    'dco': (0, 120),
+    'chlorure': (0, 12),
+    'cadmium': (0, 0.06),
+    'mercury': (0, 0.0025),
+    'arsenic': (0, 0.55),
+    'lead': (0, 0.06)
+}
+
+def generate_samples(count, seed):
+    """{parameter: list of values}, rounded like lab results"""
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for param_id in PARAMETERS:
+        low, high = SAMPLE_RANGES[param_id]
+        # Mostly compliant samples, as in real lab results
+        values = np.where(rng.random(count) < 0.85, rng.uniform(low, (low + high) * 0.6, count), rng.uniform(low, high, count))
+        samples[param_id] = np.round(values, 4).tolist()
+    return samples
+
+def to_csv(samples, count):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(('reference', 'date') + PARAMETERS)
+    for index in range(count):
+        writer.writerow([f'E{index + 1:06d}', '2025-01-15'] + [samples[param_id][index] for param_id in PARAMETERS])
+    return buffer.getvalue().encode('utf-8')
+
+def to_xlsx(samples, count):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(('reference', 'date') + PARAMETERS)
+    for index in range(count):
+        sheet.append([f'E{index + 1:06d}', '2025-01-15'] + [samples[param_id][index] for param_id in PARAMETERS])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=100000, help='Samples generated')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the samples')
+    parser.add_argument('--repeated', type=int, default=1000, help='Distinct samples of the repeated assessments')
+    parser.add_argument('--xlsx', action='store_true', help='Also time the loading of the samples as an XLSX workbook')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    samples = generate_samples(args.samples, args.seed)
+    content = to_csv(samples, args.samples)
+    # Compile the rules (and import what get_rules needs) before anything is timed
+    get_rules()
+
+    loaded, load_seconds = timed(load_samples, io.BytesIO(content), 'csv')
+    assessment, assess_seconds = timed(assess_batch, loaded['columns'])
+    summary, summary_seconds = timed(summarize_batch, loaded, assessment)
+    results, rows_seconds = timed(lambda: list(iter_results(loaded, assessment)))
+
+    assessment_memo.clear()
+    started = time.perf_counter()
+    single = [
+        assess_water_quality({param_id: samples[param_id][index] for param_id in PARAMETERS})
+        for index in range(args.samples)
+    ]
+    single_seconds = time.perf_counter() - started
+
+    # The same samples over and over: every call after the first of a sample hits the memo
+    repeated = [
+        {param_id: samples[param_id][index] for param_id in PARAMETERS}
+        for index in range(min(args.repeated, args.samples))
+    ] * (args.samples // max(min(args.repeated, args.samples), 1))
+    maxsize = assessment_memo.maxsize
+    assessment_memo.maxsize = 0
+    assessment_memo.clear()
+    _, unmemoized_seconds = timed(lambda: [assess_water_quality(data) for data in repeated])
+    assessment_memo.maxsize = maxsize
+    assessment_memo.clear()
+    before = assessment_memo.info()
+    _, memoized_seconds = timed(lambda: [assess_water_quality(data) for data in repeated])
+    after = assessment_memo.info()
+    memo = {key: after[key] - before[key] for key in ('hits', 'misses')}
+
+    mismatches = 0
+    for batch_result, single_result in zip(results, single):
+        if (RATING_CLASSIFICATIONS[batch_result['rating']] is not single_result['rating_info']
+                or batch_result['allowed_crops'] != single_result['allowed_crops']
+                or set(batch_result['restrictions']) != set(single_result['restrictions'])
+                or batch_result['violations'] != single_result['violations']):
+            mismatches += 1
+
+    report = {
+        'samples': args.samples,
+        'csv_mb': round(len(content) / (1024 * 1024), 2),
+        'load_csv_ms': round(load_seconds * 1000, 1),
+        'assess_batch_ms': round(assess_seconds * 1000, 2),
+        'summarize_ms': round(summary_seconds * 1000, 2),
+        'iter_results_ms': round(rows_seconds * 1000, 1),
+        'single_loop_ms': round(single_seconds * 1000, 1),
+        'repeated_calls': len(repeated),
+        'repeated_unmemoized_us': round(unmemoized_seconds / max(len(repeated), 1) * 1e6, 2),
+        'repeated_memoized_us': round(memoized_seconds / max(len(repeated), 1) * 1e6, 2),
+        'memo_hit_rate': round(memo['hits'] / max(memo['hits'] + memo['misses'], 1), 4),
+        'assess_speedup': round(single_seconds / assess_seconds, 1) if assess_seconds else None,
+        'end_to_end_speedup': round(single_seconds / (load_seconds + assess_seconds + summary_seconds), 2),
+        'samples_per_second': round(args.samples / (load_seconds + assess_seconds + summary_seconds)),
+        'compliance_rate': summary['compliance_rate'],
+        'mismatches': mismatches
+    }
+    if args.xlsx:
+        workbook = to_xlsx(samples, args.samples)
+        _, xlsx_seconds = timed(load_samples, io.BytesIO(workbook), 'xlsx')
+        report['load_xlsx_ms'] = round(xlsx_seconds * 1000, 1)
+
+    print(f"{args.samples} samples ({report['csv_mb']} MB of CSV)")
+    print(f"  load_samples (CSV)      {report['load_csv_ms']:>10} ms")
+    if args.xlsx:
+        print(f"  load_samples (XLSX)     {report['load_xlsx_ms']:>10} ms")
+    print(f"  assess_batch            {report['assess_batch_ms']:>10} ms")
+    print(f"  summarize_batch         {report['summarize_ms']:>10} ms")
+    print(f"  iter_results (all)      {report['iter_results_ms']:>10} ms")
+    print(f"  assess_water_quality x{args.samples}  {report['single_loop_ms']} ms")
+    print(f"  {report['repeated_calls']} repeated assessments: {report['repeated_unmemoized_us']} us/call without the memo, "
+          f"{report['repeated_memoized_us']} us/call with it (hit rate {report['memo_hit_rate']})")
+    print(f"Vectorised assessment {report['assess_speedup']}x faster than the loop, "
+          f"{report['end_to_end_speedup']}x including the CSV parsing "
+          f"({report['samples_per_second']} samples/s)")
+    print(f"Results differing from assess_water_quality: {mismatches}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
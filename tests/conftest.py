@@ -0,0 +1,48 @@
+"""
+Fixtures shared by the tests: an application on an in-memory SQLite
+database filled with a small synthetic dataset, and a client logged in as
+an administrator.
+"""
+
+import os
+
+import pytest
+
+from app import create_app
+from models import db, User
+from utils.permissions import UserRole
+from utils.synthetic_data import generate_dataset
+
+ADMIN_USERNAME = 'test_admin'
+ADMIN_PASSWORD = 'test_password'
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """Application with the synthetic dataset: 4 units, 60 incidents, 30 infrastructures with files"""
+    # Keep the test logs out of ona_debug.log
+    os.environ.setdefault('LOG_FILE', str(tmp_path_factory.mktemp('logs') / 'tests.log'))
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'UPLOAD_DIR': str(tmp_path_factory.mktemp('uploads')),
+        'PROFILING_ENABLED': False
+    })
+    with app.app_context():
+        db.create_all()
+        generate_dataset(
+            zones=2, units_per_zone=2, centers_per_unit=1, users_per_unit=2,
+            incidents=60, infrastructures=30, files_per_infrastructure=2
+        )
+        admin = User(username=ADMIN_USERNAME, role=UserRole.ADMIN)
+        admin.set_password(ADMIN_PASSWORD)
+        db.session.add(admin)
+        db.session.commit()
+    return app
+
+@pytest.fixture
+def admin_client(app):
+    """Test client logged in as the administrator"""
+    client = app.test_client()
+    response = client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,17 @@
+"""
+Streamed CSV / JSON Lines exports.
+"""
+
+import pytest
+
+@pytest.mark.parametrize('url, content_type', [
+    ('/admin/database/table/incidents/export', 'text/csv; charset=utf-8'),
+    ('/list/export?format=csv', 'text/csv; charset=utf-8'),
+    ('/admin/database/table/incidents/export?format=jsonl', 'application/x-ndjson'),
+])
+def test_export_content_type(admin_client, url, content_type):
+    response = admin_client.get(url)
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == content_type
+    assert response.data
@@ -0,0 +1,36 @@
+"""
+Infrastructure import: files that cannot be read are rejected with a form
+error, not a server error.
+"""
+
+import io
+
+import pytest
+
+@pytest.mark.parametrize('filename, content', [
+    # Excel "CSV (séparateur: point-virgule)" export, encoded in cp1252
+    ('infrastructures.csv', 'nom;type;localisation;capacite\nSTEP Béjaïa;STEP;Béjaïa;12000\n'.encode('cp1252')),
+    ('infrastructures.jsonl', '{"nom": "STEP Béjaïa", "type": "STEP", "localisation": "Béjaïa", "capacite": 12000}\n'.encode('cp1252')),
+], ids=['csv', 'jsonl'])
+def test_import_rejects_non_utf8_file(admin_client, filename, content):
+    response = admin_client.post(
+        '/infrastructures/import',
+        data={'file': (io.BytesIO(content), filename), 'dry_run': 'true'},
+        content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 400
+    assert response.is_json
+    assert 'UTF-8' in response.get_json()['message']
+
+def test_import_reads_utf8_csv(admin_client):
+    """Same file saved as Excel "CSV UTF-8", with a byte order mark"""
+    content = '\ufeffnom;type;localisation;capacite\nSTEP Béjaïa;STEP;Béjaïa;12000\n'.encode('utf-8')
+    response = admin_client.post(
+        '/infrastructures/import',
+        data={'file': (io.BytesIO(content), 'infrastructures.csv'), 'dry_run': 'true'},
+        content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 1
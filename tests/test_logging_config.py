@@ -0,0 +1,46 @@
+"""
+Background log writer: log calls never wait, and records of other
+processes reach this process' writer through the log receiver.
+"""
+
+import logging
+import queue
+from logging.handlers import SocketHandler
+
+from utils import logging_config
+
+def make_record(message):
+    return logging.makeLogRecord({'name': 'tests', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': message})
+
+def test_full_queue_drops_and_counts_records():
+    records = queue.Queue(2)
+    handler = logging_config._QueueHandler(records)
+
+    for index in range(5):
+        handler.enqueue(make_record(f'record {index}'))
+    assert records.qsize() == 2
+    assert handler.dropped == 3
+
+    # The writer caught up: the count is logged before the next record
+    records.get_nowait()
+    records.get_nowait()
+    handler.enqueue(make_record('record 5'))
+    assert handler.dropped == 0
+    assert '3 log records dropped' in records.get_nowait().getMessage()
+    assert records.get_nowait().getMessage() == 'record 5'
+
+def test_receiver_forwards_records_to_the_writer(tmp_path, monkeypatch):
+    records = queue.Queue()
+    monkeypatch.setattr(logging_config, '_queue_handler', logging_config._QueueHandler(records))
+    socket_path = logging_config.start_log_receiver(str(tmp_path))
+    try:
+        sender = SocketHandler(socket_path, None)
+        sender.handle(make_record('from a worker'))
+        sender.close()
+
+        record = records.get(timeout=5)
+    finally:
+        logging_config.stop_log_receiver()
+
+    assert record.getMessage() == 'from a worker'
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,53 @@
+"""
+Prometheus metrics: access to /metrics and snapshots of exited workers.
+"""
+
+import json
+
+from utils import metrics
+
+def test_metrics_are_served_to_local_scrapers(app):
+    response = app.test_client().get('/metrics')
+
+    assert response.status_code == 200
+    assert 'ona_http_requests_total' in response.get_data(as_text=True)
+
+def test_metrics_are_refused_to_remote_clients_without_token(app):
+    response = app.test_client().get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+
+    assert response.status_code == 403
+
+def test_metrics_token_is_required_when_set(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-secret')
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 403
+    response = client.get(
+        '/metrics', headers={'Authorization': 'Bearer scrape-secret'},
+        environ_base={'REMOTE_ADDR': '203.0.113.7'}
+    )
+    assert response.status_code == 200
+
+def _write_worker_snapshot(metrics_dir, pid, requests):
+    snapshot = {
+        'ona_http_requests_total': {
+            'type': 'counter', 'help': 'HTTP requests handled', 'labelnames': ['method', 'endpoint', 'status'],
+            'buckets': [], 'samples': [[['GET', 'index', '200'], requests]]
+        }
+    }
+    (metrics_dir / f'{metrics.SNAPSHOT_PREFIX}{pid}.json').write_text(json.dumps(snapshot))
+
+def test_exited_workers_are_folded_into_one_snapshot(app, tmp_path, monkeypatch):
+    for pid, requests in ((101, 3), (102, 4), (103, 5)):
+        _write_worker_snapshot(tmp_path, pid, requests)
+
+    metrics.retire_snapshot(str(tmp_path), 101)
+    metrics.retire_snapshot(str(tmp_path), 102)
+    metrics.retire_snapshot(str(tmp_path), 104)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['metrics_103.json', metrics.EXITED_SNAPSHOT]
+    monkeypatch.setitem(app.config, 'METRICS_DIR', str(tmp_path))
+    with app.app_context():
+        total = metrics.collect_metrics()
+    samples = total['ona_http_requests_total']['samples']
+    assert samples[('GET', 'index', '200')] == 12
@@ -0,0 +1,31 @@
+"""
+Request profiling: one request per process is profiled at a time.
+"""
+
+import pytest
+
+from utils import profiling
+
+@pytest.fixture
+def profiling_app(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILING_ENABLED', True)
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', str(tmp_path))
+    return app
+
+def test_requested_profile_is_stored(profiling_app, admin_client):
+    response = admin_client.get('/dashboard?_profile=1')
+
+    assert response.status_code == 200
+    assert 'X-Profile-Id' in response.headers
+    assert not profiling._profiler_lock.locked()
+
+def test_request_is_served_while_another_is_profiled(profiling_app, admin_client):
+    # Another thread of the process holds the profiler
+    assert profiling._profiler_lock.acquire(blocking=False)
+    try:
+        response = admin_client.get('/dashboard?_profile=1')
+    finally:
+        profiling._profiler_lock.release()
+
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
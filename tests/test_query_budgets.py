@@ -0,0 +1,45 @@
+"""
+Query budgets of the hot endpoints.
+
+Each page is requested once first (schema introspection and other
+per-process caches are filled on the first request), then the statements
+of a second request are counted with assert_max_queries. The budgets are
+the counts of the eager loading declared per endpoint: a relationship
+loaded lazily per row adds one query per listed row and fails the test.
+"""
+
+import pytest
+
+from utils.query_stats import assert_max_queries
+
+@pytest.mark.parametrize('url, budget', [
+    # Count, page of incidents with their authors and units, filter zones and units
+    ('/list', 5),
+    ('/list?page=3', 5),
+    ('/list?sort=date_asc', 5),
+    # Incident counts of the user
+    ('/dashboard', 4),
+    # First keyset page and the aggregates per type
+    ('/infrastructures', 3),
+    # Schema version check, count and page of rows
+    ('/admin/database/table/incidents', 6),
+    ('/admin/database/table/users', 5),
+    ('/admin/database/table/infrastructures_files', 4),
+])
+def test_query_budget(admin_client, url, budget):
+    assert admin_client.get(url).status_code == 200
+
+    with assert_max_queries(budget):
+        response = admin_client.get(url)
+    assert response.status_code == 200
+
+def test_incident_list_does_not_query_per_row(admin_client):
+    """A page of ten incidents runs the same statements as an empty page"""
+    admin_client.get('/list')
+
+    with assert_max_queries(100) as full_page:
+        admin_client.get('/list')
+    with assert_max_queries(100) as empty_page:
+        # 60 incidents, 10 per page
+        admin_client.get('/list?page=7')
+    assert full_page.count == empty_page.count
@@ -0,0 +1,32 @@
+"""
+Water quality rule engine: the classification follows the order of the
+grades of a rule set, whatever their names.
+"""
+
+import copy
+
+from utils.water_quality import DEFAULT_RULE_SET, CompiledRules
+
+def ratings(rules):
+    return {(outcome['micro_rating'], outcome['physico_rating']): outcome['rating'] for outcome in rules.outcomes}
+
+def test_default_rules_classification():
+    assert ratings(CompiledRules(DEFAULT_RULE_SET)) == {
+        ('A', 'OK'): 'high', ('A', 'FAIL'): 'low',
+        ('B', 'OK'): 'medium', ('B', 'FAIL'): 'low',
+        ('C', 'OK'): 'low', ('C', 'FAIL'): 'low'
+    }
+
+def test_renamed_grades_keep_their_classification():
+    names = {'A': 'Excellente', 'B': 'Bonne', 'C': 'Insuffisante'}
+    rule_set = copy.deepcopy(DEFAULT_RULE_SET)
+    rule_set['grades'] = [names[grade] for grade in rule_set['grades']]
+    for rule in rule_set['rules']:
+        if rule['kind'] == 'grade':
+            rule['grade'] = names[rule['grade']]
+    for crop in rule_set['crops']:
+        crop['micro'] = names[crop['micro']]
+
+    renamed = ratings(CompiledRules(rule_set, version=-1))
+
+    assert renamed == {(names[grade], physico): rating for (grade, physico), rating in ratings(CompiledRules(DEFAULT_RULE_SET)).items()}
@@ -0,0 +1,446 @@
+"""
+Content-addressed storage for uploaded infrastructure files.
+
+Uploads are hashed while they are copied to disk and stored once under
+<upload root>/blobs/<sha256[:2]>/<sha256>.<ext>, however many infrastructures
+they are attached to. InfrastructureFile rows reference a blob through its
+filepath and FileBlob.ref_count tracks how many of them do.
+
+The upload root (UPLOAD_DIR, instance/uploads by default) is outside the
+static folder: files are only delivered by the permission-checked
+/files/<id> endpoint. Stored paths are relative to it ('/uploads/blobs/...').
+Uploads of earlier versions live under static/uploads and keep their
+'/static/uploads/...' path until 'flask relocate-uploads' moves them.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, FileBlob, InfrastructureFile, InfrastructureFileVariant
+
+# Read size used when copying upload streams to disk
+CHUNK_SIZE = 64 * 1024
+
+# Directory of the blob store, relative to the upload root
+BLOB_DIR = 'blobs'
+
+# Prefix of the stored paths of files under the upload root
+STORED_PREFIX = '/uploads/'
+
+# Public directory (relative to the app root) of the uploads of earlier
+# versions, and the stored path prefix of the files still in it
+LEGACY_UPLOAD_DIR = os.path.join('static', 'uploads')
+LEGACY_PREFIX = '/static/uploads/'
+
+# Prefix of the temporary files written while an upload is being hashed
+TEMP_PREFIX = '.upload_'
+
+# Session.info keys listing the blob files and fan-out directories created since the last commit
+NEW_FILES_KEY = 'new_blob_files'
+NEW_DIRS_KEY = 'new_blob_dirs'
+
+@event.listens_for(Session, 'after_commit')
+def forget_new_blobs(session):
+    """Once committed, blob files written in the transaction are no longer discardable"""
+    if session.in_nested_transaction():
+        # Savepoint released (see create_blob), the transaction may still roll back
+        return
+    session.info.pop(NEW_FILES_KEY, None)
+    session.info.pop(NEW_DIRS_KEY, None)
+
+def get_upload_root():
+    """Get the absolute directory holding the uploaded files (UPLOAD_DIR, defaults to instance/uploads)"""
+    return os.path.abspath(current_app.config.get('UPLOAD_DIR') or os.path.join(current_app.instance_path, 'uploads'))
+
+def get_blob_dir(sha256=None):
+    """
+    Get the absolute directory of the blob store, or of one blob's fan-out folder.
+
+    Args:
+        sha256: Optional blob hash
+
+    Returns:
+        str: Absolute directory path
+    """
+    blob_root = os.path.join(get_upload_root(), BLOB_DIR)
+    if sha256 is None:
+        return blob_root
+    return os.path.join(blob_root, sha256[:2])
+
+def to_stored_path(disk_path):
+    """Convert an absolute path under the upload root to the stored '/uploads/...' form"""
+    relative_path = os.path.relpath(disk_path, get_upload_root())
+    if relative_path.startswith(os.pardir):
+        # Legacy upload under the app root
+        return '/' + os.path.relpath(disk_path, current_app.root_path).replace('\\', '/')
+    return STORED_PREFIX + relative_path.replace('\\', '/')
+
+def to_disk_path(stored_path):
+    """Convert a stored '/uploads/...' (or legacy '/static/...') path back to an absolute path"""
+    if stored_path.startswith(STORED_PREFIX):
+        return os.path.join(get_upload_root(), stored_path[len(STORED_PREFIX):])
+    return os.path.join(current_app.root_path, stored_path.lstrip('/'))
+
+def spool_and_hash(stream, directory=None):
+    """
+    Copy a stream to a temporary file in the blob store while hashing it.
+
+    Args:
+        stream: Readable binary stream
+        directory: Directory for the temporary file (defaults to the blob root)
+
+    Returns:
+        tuple: (temporary file path, sha256 hex digest, size in bytes)
+    """
+    directory = directory or get_blob_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    temp_fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=directory)
+    try:
+        with os.fdopen(temp_fd, 'wb') as output:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                output.write(chunk)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+    return temp_path, digest.hexdigest(), size
+
+def get_upload_digest(file):
+    """
+    Get the hash and size computed while an upload was streamed in.
+
+    Args:
+        file (FileStorage): Uploaded file
+
+    Returns:
+        tuple: (sha256 hex digest, size) or (None, None) if the upload was not hashed
+    """
+    stream = file.stream
+    if isinstance(getattr(stream, 'sha256', None), str):
+        return stream.sha256, stream.size
+    return None, None
+
+def reserve_blob_dir(sha256):
+    """
+    Get (and create) the directory a new blob is about to be written to.
+
+    A directory created here is recorded on the current session, so that
+    discard_new_blobs() removes it again if it is left empty.
+    """
+    blob_dir = get_blob_dir(sha256)
+    if not os.path.isdir(blob_dir):
+        os.makedirs(blob_dir, exist_ok=True)
+        db.session.info.setdefault(NEW_DIRS_KEY, []).append(blob_dir)
+    return blob_dir
+
+def link_blob_file(temp_path, disk_path):
+    """
+    Move a complete temporary file to its path in the blob store, unless that
+    path already exists.
+
+    The link is atomic: when two requests store the same content, only the one
+    that created the file records it for discard_new_blobs(), so a rollback
+    never removes a file another request relies on.
+
+    Args:
+        temp_path: Temporary file on the same file system
+        disk_path: Final path of the blob file
+
+    Returns:
+        bool: Whether the file was created by this call
+    """
+    try:
+        os.link(temp_path, disk_path)
+    except FileExistsError:
+        # Same path, same content: already stored by another request
+        return False
+    finally:
+        os.remove(temp_path)
+    db.session.info.setdefault(NEW_FILES_KEY, []).append(disk_path)
+    return True
+
+def write_blob_file(disk_path, write):
+    """
+    Write one file of a blob (the original or a variant) through a temporary file.
+
+    Args:
+        disk_path: Final path of the blob file
+        write: Callable filling the binary file object it is given
+
+    Returns:
+        int: Size of the stored file in bytes
+    """
+    temp_fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=os.path.dirname(disk_path))
+    try:
+        with os.fdopen(temp_fd, 'wb') as output:
+            write(output)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    link_blob_file(temp_path, disk_path)
+    return os.path.getsize(disk_path)
+
+def discard_new_blobs():
+    """Remove from disk the blob files (and fan-out directories) created since the last commit"""
+    for disk_path in db.session.info.pop(NEW_FILES_KEY, []):
+        try:
+            os.remove(disk_path)
+            current_app.logger.info(f"Discarded uncommitted blob file: {disk_path}")
+        except FileNotFoundError:
+            pass
+    for blob_dir in db.session.info.pop(NEW_DIRS_KEY, []):
+        try:
+            os.rmdir(blob_dir)
+        except OSError:
+            # Not empty: it holds files of other blobs
+            pass
+
+def store_stream(stream, disk_path):
+    """Copy an upload stream to its final location in the blob store"""
+    stream.seek(0)
+    return write_blob_file(disk_path, lambda output: shutil.copyfileobj(stream, output, CHUNK_SIZE))
+
+def find_blob(sha256):
+    """Return the FileBlob stored for a hash, or None"""
+    return FileBlob.query.filter_by(sha256=sha256).first()
+
+def create_blob(sha256, filepath, mime_type, file_size):
+    """
+    Register a newly stored blob with a single reference.
+
+    The row is inserted in a savepoint: if another request stored the same
+    content meanwhile, the unique sha256 rejects it and a reference is added
+    to that blob instead.
+
+    Returns:
+        FileBlob: Blob record of the content
+    """
+    blob = FileBlob(
+        sha256=sha256,
+        filepath=filepath,
+        mime_type=mime_type,
+        file_size=file_size,
+        ref_count=1
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        current_app.logger.info(f"Blob {sha256} stored concurrently, adding a reference")
+        return acquire_blob(find_blob(sha256))
+    return blob
+
+def acquire_blob(blob):
+    """Add a reference to an existing blob"""
+    blob.ref_count = (blob.ref_count or 0) + 1
+    return blob
+
+def get_blob_variants(blob):
+    """
+    Get the resized variants already generated for an image blob.
+
+    Args:
+        blob: FileBlob of an image
+
+    Returns:
+        list or None: Variant dicts copied from a file sharing the blob, None if unknown
+    """
+    sibling = InfrastructureFile.query.filter_by(filepath=blob.filepath).first()
+    if not sibling or not sibling.variants:
+        return None
+    return [
+        {
+            'width': variant.width,
+            'height': variant.height,
+            'filepath': variant.filepath,
+            'file_size': variant.file_size
+        } for variant in sibling.variants
+    ]
+
+def release_file(file_record):
+    """
+    Drop a file record's reference on its blob.
+
+    Args:
+        file_record: InfrastructureFile about to be deleted
+
+    Returns:
+        set: Stored paths that can be removed from disk once the deletion is committed
+    """
+    stored_paths = {file_record.filepath} | {variant.filepath for variant in file_record.variants}
+
+    blob = FileBlob.query.filter_by(filepath=file_record.filepath).first()
+    if not blob:
+        # Legacy upload stored per infrastructure
+        return stored_paths
+
+    blob.ref_count = max((blob.ref_count or 0) - 1, 0)
+    if blob.ref_count:
+        return set()
+
+    db.session.delete(blob)
+    return stored_paths
+
+def remove_stored_files(stored_paths):
+    """
+    Remove stored files from disk, ignoring the ones already gone.
+
+    Args:
+        stored_paths: Iterable of '/static/...' paths
+    """
+    for stored_path in stored_paths:
+        disk_path = to_disk_path(stored_path)
+        try:
+            os.remove(disk_path)
+            current_app.logger.info(f"Deleted physical file: {disk_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            current_app.logger.error(f"Error deleting file {disk_path}: {e}")
+
+def collect_garbage(min_age=3600, dry_run=False):
+    """
+    Remove unreferenced blobs and stray files from the upload root.
+
+    Blob reference counts are recomputed from InfrastructureFile rows, blobs
+    no longer referenced are dropped, then every file under the upload root
+    that no InfrastructureFile or variant points to is deleted (e.g. files
+    left behind by failed or rolled back edits). The legacy static/uploads
+    directory is shared by every database of the checkout and never swept.
+
+    Args:
+        min_age: Files modified more recently than this many seconds are kept,
+                 so uploads still in flight are not collected
+        dry_run: Only report what would be removed
+
+    Returns:
+        dict: Summary with removed blob count, removed files and freed bytes
+    """
+    referenced = {path for (path,) in db.session.query(InfrastructureFile.filepath)}
+    referenced |= {path for (path,) in db.session.query(InfrastructureFileVariant.filepath)}
+
+    # Recount references and drop blobs nobody points to
+    ref_counts = dict(
+        db.session.query(InfrastructureFile.filepath, func.count(InfrastructureFile.id))
+        .group_by(InfrastructureFile.filepath)
+    )
+    blobs_removed = 0
+    for blob in FileBlob.query.all():
+        blob.ref_count = ref_counts.get(blob.filepath, 0)
+        if not blob.ref_count:
+            db.session.delete(blob)
+            blobs_removed += 1
+
+    # Sweep files on disk that no record points to
+    cutoff = time.time() - min_age
+    files_removed = []
+    bytes_freed = 0
+    for dirpath, _, filenames in os.walk(get_upload_root()):
+        for name in filenames:
+            disk_path = os.path.join(dirpath, name)
+            stored_path = to_stored_path(disk_path)
+            if stored_path in referenced or name == '.gitkeep':
+                continue
+            stat = os.stat(disk_path)
+            if stat.st_mtime > cutoff:
+                continue
+            files_removed.append(stored_path)
+            bytes_freed += stat.st_size
+            if not dry_run:
+                os.remove(disk_path)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    return {
+        'blobs_removed': blobs_removed,
+        'files_removed': files_removed,
+        'bytes_freed': bytes_freed
+    }
+
+def relocate_legacy_uploads(dry_run=False):
+    """
+    Move the files of earlier versions out of the public static folder.
+
+    Every file under static/uploads referenced by this database is moved to
+    the same relative path under the upload root, and the stored paths of the
+    blobs, files and variants pointing to it are rewritten from
+    '/static/uploads/...' to '/uploads/...'. Files no row references may
+    belong to another database of the checkout and are left in place.
+
+    Args:
+        dry_run: Only report what would be moved
+
+    Returns:
+        dict: Summary with the moved files, the files left in place and the updated rows
+    """
+    legacy_root = os.path.join(current_app.root_path, LEGACY_UPLOAD_DIR)
+    upload_root = get_upload_root()
+    referenced = set()
+    for model in (FileBlob, InfrastructureFile, InfrastructureFileVariant):
+        referenced |= {
+            path for (path,) in db.session.query(model.filepath).filter(model.filepath.startswith(LEGACY_PREFIX))
+        }
+    moves = [
+        (to_disk_path(path), os.path.join(upload_root, path[len(LEGACY_PREFIX):]))
+        for path in sorted(referenced) if os.path.isfile(to_disk_path(path))
+    ]
+    moved_sources = {source for source, _ in moves}
+    files_left = [
+        to_stored_path(os.path.join(dirpath, name))
+        for dirpath, _, filenames in os.walk(legacy_root)
+        for name in filenames
+        if name != '.gitkeep' and os.path.join(dirpath, name) not in moved_sources
+    ]
+
+    rows_updated = 0
+    for model in (FileBlob, InfrastructureFile, InfrastructureFileVariant):
+        legacy_rows = model.query.filter(model.filepath.startswith(LEGACY_PREFIX))
+        if dry_run:
+            rows_updated += legacy_rows.count()
+            continue
+        rows_updated += legacy_rows.update(
+            {model.filepath: STORED_PREFIX + func.substr(model.filepath, len(LEGACY_PREFIX) + 1)},
+            synchronize_session=False
+        )
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        # Files first, put back if a move fails so the rows keep matching the disk
+        moved = []
+        try:
+            for source, target in moves:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(source, target)
+                moved.append((source, target))
+        except OSError:
+            db.session.rollback()
+            for source, target in reversed(moved):
+                shutil.move(target, source)
+            raise
+        db.session.commit()
+
+    return {
+        'files_moved': [to_stored_path(source) for source, _ in moves],
+        'files_left': files_left,
+        'rows_updated': rows_updated
+    }
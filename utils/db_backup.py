@@ -0,0 +1,277 @@
+"""
+Online backups of the SQLite database.
+
+Copies go through the SQLite backup API (sqlite3.Connection.backup), which
+reads a consistent snapshot a few pages at a time, so writers are only
+blocked for the duration of one step instead of a whole file copy. Backups
+are compressed with zstd when the optional 'zstandard' package is
+installed, gzip otherwise.
+"""
+
+import gzip
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from flask import current_app
+
+from models import db
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, gzip is used instead
+    zstandard = None
+
+# Pages copied per backup step (4 KB pages: 1 MB per step) and pause between steps
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+# Databases up to this size are snapshotted in memory when streamed to a client,
+# larger ones go through a temporary file
+IN_MEMORY_BACKUP_MAX = 64 * 1024 * 1024
+
+# Read size when compressing a snapshot
+CHUNK_SIZE = 1024 * 1024
+
+BACKUP_PREFIX = 'OnaDB_backup_'
+
+COMPRESSION_FORMATS = {
+    'zstd': {'extension': '.zst', 'mimetype': 'application/zstd'},
+    'gzip': {'extension': '.gz', 'mimetype': 'application/gzip'}
+}
+
+class BackupError(Exception):
+    """Raised when a backup cannot be created or read"""
+
+def default_format():
+    """zstd when available, gzip otherwise"""
+    return 'zstd' if zstandard else 'gzip'
+
+def check_format(fmt):
+    """
+    Validate a compression format name.
+
+    Raises:
+        BackupError: If the format is unknown or zstd is not installed
+    """
+    if fmt not in COMPRESSION_FORMATS:
+        raise BackupError(f"Format de compression inconnu: {fmt}")
+    if fmt == 'zstd' and not zstandard:
+        raise BackupError("Le format zstd nécessite le paquet 'zstandard'")
+    return fmt
+
+def get_database_path():
+    """
+    Get the path of the SQLite database file.
+
+    Raises:
+        BackupError: If the database is not a SQLite file
+    """
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise BackupError("Seules les bases SQLite sur disque peuvent être sauvegardées")
+    if not os.path.exists(url.database):
+        raise BackupError("Base de données introuvable.")
+    return url.database
+
+def get_backup_dir():
+    """Directory of the scheduled backups (BACKUP_DIR setting)"""
+    return current_app.config.get('BACKUP_DIR') or os.path.join(current_app.instance_path, 'backups')
+
+def snapshot_database(destination, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """
+    Copy the live database into another SQLite connection with the backup API.
+
+    Args:
+        destination: sqlite3 connection receiving the copy
+        pages: Pages copied per step
+        sleep: Seconds between steps, leaving the lock to writers
+
+    Returns:
+        sqlite3.Connection: The destination connection
+    """
+    started = time.monotonic()
+
+    def log_progress(status, remaining, total):
+        current_app.logger.debug(f"Database backup: {total - remaining}/{total} pages copied")
+
+    source = sqlite3.connect(f'file:{quote(get_database_path())}?mode=ro', uri=True)
+    try:
+        source.backup(destination, pages=pages, progress=log_progress, sleep=sleep)
+    finally:
+        source.close()
+
+    current_app.logger.info(f"Database snapshot taken in {time.monotonic() - started:.2f}s")
+    return destination
+
+def open_compressor(output, fmt):
+    """Wrap a binary stream in a compressing writer (closing it leaves output open)"""
+    if fmt == 'zstd':
+        return zstandard.ZstdCompressor(level=10).stream_writer(output, closefd=False)
+    return gzip.GzipFile(fileobj=output, mode='wb', compresslevel=6)
+
+def open_decompressor(path):
+    """Open a backup file for reading, decompressing it according to its extension"""
+    if path.endswith(COMPRESSION_FORMATS['zstd']['extension']):
+        if not zstandard:
+            raise BackupError("Le format zstd nécessite le paquet 'zstandard'")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    if path.endswith(COMPRESSION_FORMATS['gzip']['extension']):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def iter_compressed(source, fmt):
+    """
+    Compress a readable stream chunk by chunk.
+
+    Yields:
+        bytes: Compressed chunks
+    """
+    buffer = io.BytesIO()
+    compressor = open_compressor(buffer, fmt)
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        compressor.write(chunk)
+        if buffer.tell():
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    compressor.close()
+    yield buffer.getvalue()
+
+def iter_backup(fmt):
+    """
+    Take a snapshot of the database and yield it compressed.
+
+    Small databases are snapshotted into memory and never touch the disk,
+    larger ones into a temporary directory removed once the snapshot is sent.
+
+    Yields:
+        bytes: Compressed chunks of the database file
+    """
+    check_format(fmt)
+    if os.path.getsize(get_database_path()) <= IN_MEMORY_BACKUP_MAX:
+        snapshot = snapshot_database(sqlite3.connect(':memory:'))
+        try:
+            data = snapshot.serialize()
+        finally:
+            snapshot.close()
+        yield from iter_compressed(io.BytesIO(data), fmt)
+        return
+
+    with tempfile.TemporaryDirectory(prefix='ona_backup_') as temp_dir:
+        temp_path = os.path.join(temp_dir, 'snapshot.db')
+        snapshot_database(sqlite3.connect(temp_path)).close()
+        # The file is closed before the directory is removed, also when the
+        # generator is closed early: Windows cannot delete an open file
+        with open(temp_path, 'rb') as source:
+            yield from iter_compressed(source, fmt)
+
+def create_backup(backup_dir=None, fmt=None):
+    """
+    Write a compressed backup file.
+
+    Args:
+        backup_dir: Target directory (defaults to BACKUP_DIR)
+        fmt: 'zstd' or 'gzip' (defaults to the best available)
+
+    Returns:
+        str: Path of the backup file
+    """
+    fmt = check_format(fmt or default_format())
+    backup_dir = backup_dir or get_backup_dir()
+    os.makedirs(backup_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = os.path.join(
+        backup_dir, f"{BACKUP_PREFIX}{timestamp}.db{COMPRESSION_FORMATS[fmt]['extension']}"
+    )
+
+    # Written under a temporary name so an interrupted backup never looks complete
+    partial_path = backup_path + '.partial'
+    try:
+        with open(partial_path, 'wb') as output:
+            for chunk in iter_backup(fmt):
+                output.write(chunk)
+        os.replace(partial_path, backup_path)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    current_app.logger.info(f"Database backup written to {backup_path}")
+    return backup_path
+
+def list_backups(backup_dir=None):
+    """Backup files of a directory, most recent first"""
+    backup_dir = backup_dir or get_backup_dir()
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [
+        name for name in os.listdir(backup_dir)
+        if name.startswith(BACKUP_PREFIX) and not name.endswith('.partial')
+    ]
+    # Timestamps in the names sort chronologically
+    return [os.path.join(backup_dir, name) for name in sorted(names, reverse=True)]
+
+def rotate_backups(keep, backup_dir=None):
+    """
+    Delete the oldest backups beyond the retention count.
+
+    Returns:
+        list: Paths removed
+    """
+    removed = list_backups(backup_dir)[keep:]
+    for path in removed:
+        os.remove(path)
+        current_app.logger.info(f"Old database backup removed: {path}")
+    return removed
+
+def verify_backup(path):
+    """
+    Restore a backup into a temporary file and run PRAGMA integrity_check on it.
+
+    Args:
+        path: Backup file (.db, .db.gz or .db.zst)
+
+    Returns:
+        dict: ok flag, integrity_check messages and number of tables
+
+    Raises:
+        BackupError: If the file cannot be read
+    """
+    with tempfile.TemporaryDirectory(prefix='ona_restore_') as temp_dir:
+        restored_path = os.path.join(temp_dir, 'restored.db')
+        try:
+            with open_decompressor(path) as source, open(restored_path, 'wb') as output:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+        except Exception as e:
+            # OSError / EOFError from gzip, ZstdError from zstandard
+            raise BackupError(f"Sauvegarde illisible: {e}")
+
+        connection = sqlite3.connect(restored_path)
+        try:
+            messages = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+            table_count = connection.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'"
+            ).fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            messages, table_count = [str(e)], 0
+        finally:
+            connection.close()
+
+    return {
+        'ok': messages == ['ok'],
+        'messages': messages,
+        'table_count': table_count
+    }
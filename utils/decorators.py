@@ -4,8 +4,6 @@ from flask_login import current_user
 from utils.permissions import UserRole  # Ensure this import is correct
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def admin_required(f):
@@ -0,0 +1,88 @@
+"""
+HTTP delivery of stored upload files.
+
+Files are served with a strong ETag and honour conditional and Range
+requests. When the app runs behind a front proxy, the byte transfer can be
+handed over to it:
+
+- USE_X_SENDFILE (Flask setting): Apache / lighttpd read the file from the
+  X-Sendfile header.
+- X_ACCEL_REDIRECT_PREFIX: nginx internal location mapped on the upload root
+  (UPLOAD_DIR, instance/uploads by default), e.g.
+  ``location /protected-uploads/ { internal; alias /app/instance/uploads/; }``
+"""
+
+import os
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+
+from utils.blob_store import get_upload_root
+
+# Cache lifetime of versioned file URLs, whose content never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def build_accel_redirect_path(disk_path):
+    """
+    Map a file under the upload root to the nginx internal location serving it.
+
+    Returns:
+        str or None: URL-quoted internal path, None if the file is outside the upload root
+    """
+    relative_path = os.path.relpath(disk_path, get_upload_root())
+    if relative_path.startswith(os.pardir):
+        return None
+    prefix = current_app.config['X_ACCEL_REDIRECT_PREFIX'].rstrip('/')
+    return quote(f"{prefix}/{relative_path.replace(os.sep, '/')}")
+
+def send_stored_file(disk_path, mimetype, etag=None, download_name=None, immutable=False):
+    """
+    Build the response delivering a stored file.
+
+    Args:
+        disk_path: Absolute path of the file
+        mimetype: Content type of the file
+        etag: Strong validator (e.g. the content hash), computed from the file stat if None
+        download_name: File name suggested in Content-Disposition
+        immutable: Whether the requested URL always designates these exact bytes
+
+    Returns:
+        Response: 200/206/304 response, or an empty one carrying the
+                  proxy offload header
+    """
+    accel_path = None
+    if current_app.config.get('X_ACCEL_REDIRECT_PREFIX'):
+        accel_path = build_accel_redirect_path(disk_path)
+
+    if accel_path:
+        # nginx streams the body and handles Range, conditional requests are answered here
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_path
+        if download_name:
+            response.headers.set('Content-Disposition', 'inline', filename=download_name)
+        if etag:
+            response.set_etag(etag)
+        response.last_modified = int(os.path.getmtime(disk_path))
+        response = response.make_conditional(request)
+    else:
+        # Range and If-None-Match are handled by Werkzeug; USE_X_SENDFILE
+        # turns the body into an X-Sendfile header
+        response = send_file(
+            disk_path,
+            mimetype=mimetype,
+            download_name=download_name,
+            conditional=True,
+            etag=etag or True
+        )
+
+    # Files sit behind a permission check: keep them out of shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = None
+        response.cache_control.no_cache = True
+    return response
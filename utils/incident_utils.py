@@ -1,4 +1,4 @@
-from models import Incident, Unit, UserRole
+from models import db, Incident, Unit, UserRole
 from typing import Dict, Union
 from extensions import cache
 import functools
@@ -71,10 +71,9 @@ def get_user_incident_counts(user, include_author=False):
     
     elif user.role == UserRole.EMPLOYEUR_ZONE:
         # For zone-level users, filter by zone's units
-        zone_units = Unit.query.filter_by(zone_id=user.zone_id).all()
-        unit_ids = [unit.id for unit in zone_units]
+        zone_unit_ids = db.session.query(Unit.id).filter_by(zone_id=user.zone_id)
         
-        total_query = Incident.query.filter(Incident.unit_id.in_(unit_ids))
+        total_query = Incident.query.filter(Incident.unit_id.in_(zone_unit_ids.scalar_subquery()))
         resolved_query = total_query.filter(Incident.status == 'Résolu')
         nouveau_query = total_query.filter(Incident.status == 'En cours')
     
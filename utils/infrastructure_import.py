@@ -0,0 +1,297 @@
+"""
+Bulk import of infrastructures from CSV, JSON / JSON Lines and XLSX files.
+
+Rows are read one at a time, validated against the Infrastructure columns
+and written in batches: one SELECT finds the names already present, then a
+single executemany INSERT and a single executemany UPDATE per batch. A row
+whose nom already exists updates that infrastructure (upsert on nom).
+
+CSV, JSON Lines and XLSX files are streamed. A JSON document is parsed
+whole before its first row, so large imports should use JSON Lines.
+"""
+
+import csv
+import io
+import json
+import os
+import unicodedata
+
+from sqlalchemy import bindparam, insert, select, update
+
+from models import db, Infrastructure
+
+# Rows written per executemany round trip
+DEFAULT_BATCH_SIZE = 1000
+
+# Per-row errors kept in the report, the remaining ones are only counted
+MAX_REPORTED_ERRORS = 1000
+
+SUPPORTED_FORMATS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.xlsx': 'xlsx'
+}
+
+IMPORTED_FIELDS = ('nom', 'type', 'localisation', 'capacite', 'etat', 'epuration_type')
+REQUIRED_FIELDS = ('nom', 'type', 'localisation', 'capacite')
+
+# Header spellings accepted besides the column names
+HEADER_ALIASES = {
+    'name': 'nom',
+    'location': 'localisation',
+    'capacity': 'capacite',
+    'state': 'etat',
+    'status': 'etat',
+    'type_epuration': 'epuration_type',
+    "type_d'epuration": 'epuration_type'
+}
+
+class ImportFormatError(ValueError):
+    """Raised when the file format is unsupported or its structure unreadable"""
+
+def detect_format(filename):
+    """
+    Get the import format from a file name.
+
+    Raises:
+        ImportFormatError: If the extension is not supported
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in SUPPORTED_FORMATS:
+        raise ImportFormatError(
+            f"Format non supporté: '{extension or filename}'. "
+            f"Formats acceptés: {', '.join(sorted(SUPPORTED_FORMATS))}"
+        )
+    return SUPPORTED_FORMATS[extension]
+
+def normalize_header(header):
+    """Map a column header to an Infrastructure field name ('Capacité' -> 'capacite')"""
+    text = unicodedata.normalize('NFKD', str(header or '')).encode('ascii', 'ignore').decode('ascii')
+    key = text.strip().lower().replace(' ', '_')
+    return HEADER_ALIASES.get(key, key)
+
+def iter_csv_rows(stream):
+    """Yield (line, row) from a CSV stream, the delimiter (',' or ';') is sniffed"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        headers = [normalize_header(header) for header in next(reader, [])]
+        for row in reader:
+            if any(cell.strip() for cell in row):
+                yield reader.line_num, dict(zip(headers, row))
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"Fichier CSV illisible (encodage UTF-8 attendu, « CSV UTF-8 » dans Excel): {e}")
+    finally:
+        # Leave the underlying stream open for the caller
+        text.detach()
+
+def iter_json_rows(stream):
+    """
+    Yield (index, row) from a JSON document.
+
+    Accepts a list of objects or an object holding one list, such as
+    config/sample_infrastructures.json. The whole document is loaded in
+    memory before the first row, use JSON Lines to stream large imports.
+    """
+    try:
+        document = json.load(stream)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ImportFormatError(f'JSON invalide: {e}')
+    if isinstance(document, dict):
+        lists = [value for value in document.values() if isinstance(value, list)]
+        if len(lists) != 1:
+            raise ImportFormatError('Le document JSON doit contenir une liste d\'infrastructures')
+        document = lists[0]
+    if not isinstance(document, list):
+        raise ImportFormatError('Le document JSON doit contenir une liste d\'infrastructures')
+    for index, row in enumerate(document, start=1):
+        yield index, row
+
+def iter_jsonl_rows(stream):
+    """Yield (line, row) from a JSON Lines stream, one object per line"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    try:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = ImportFormatError(f'JSON invalide: {e}')
+            yield line_number, row
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"Fichier JSON Lines illisible (encodage UTF-8 attendu): {e}")
+    finally:
+        # Leave the underlying stream open for the caller
+        text.detach()
+
+def iter_xlsx_rows(stream):
+    """Yield (line, row) from the first sheet of a workbook, read in read-only mode"""
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f'Classeur XLSX illisible: {e}')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = [normalize_header(header) for header in next(rows, ())]
+        for line_number, row in enumerate(rows, start=2):
+            if any(cell not in (None, '') for cell in row):
+                yield line_number, dict(zip(headers, row))
+    finally:
+        workbook.close()
+
+ROW_READERS = {
+    'csv': iter_csv_rows,
+    'json': iter_json_rows,
+    'jsonl': iter_jsonl_rows,
+    'xlsx': iter_xlsx_rows
+}
+
+def validate_row(raw):
+    """
+    Validate and convert one imported row.
+
+    Args:
+        raw: Mapping read from the file
+
+    Returns:
+        tuple: (values dict, list of error messages)
+    """
+    if isinstance(raw, Exception):
+        return None, [str(raw)]
+    if not isinstance(raw, dict):
+        return None, ['Ligne invalide: un objet est attendu']
+
+    raw = {normalize_header(key): value for key, value in raw.items()}
+    columns = Infrastructure.__table__.columns
+    values = {}
+    errors = []
+
+    for field in IMPORTED_FIELDS:
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            if field in REQUIRED_FIELDS:
+                errors.append(f"Champ '{field}' obligatoire")
+            continue
+
+        if field == 'capacite':
+            try:
+                value = float(str(value).replace(' ', '').replace(',', '.'))
+            except ValueError:
+                errors.append(f"Capacité invalide: '{value}'")
+                continue
+            if value < 0:
+                errors.append('La capacité doit être positive')
+                continue
+        else:
+            value = str(value)
+            max_length = columns[field].type.length
+            if max_length and len(value) > max_length:
+                errors.append(f"Champ '{field}' trop long (max {max_length} caractères)")
+                continue
+        values[field] = value
+
+    values.setdefault('etat', 'Opérationnel')
+    return values, errors
+
+def _write_batch(batch):
+    """
+    Upsert one batch of validated rows on nom.
+
+    Returns:
+        tuple: (created count, updated count)
+    """
+    table = Infrastructure.__table__
+    existing = dict(
+        db.session.execute(
+            select(table.c.nom, table.c.id).where(table.c.nom.in_(list(batch)))
+        ).all()
+    )
+
+    # executemany needs the same keys in every row, missing optional fields
+    # are written as NULL (an update fully replaces the existing values)
+    rows = {nom: {field: values.get(field) for field in IMPORTED_FIELDS} for nom, values in batch.items()}
+    inserts = [row for nom, row in rows.items() if nom not in existing]
+    updates = [{**row, 'b_id': existing[nom]} for nom, row in rows.items() if nom in existing]
+
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .values({field: bindparam(field) for field in IMPORTED_FIELDS}),
+            updates
+        )
+    return len(inserts), len(updates)
+
+def import_infrastructures(stream, file_format, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    Import infrastructures from a file stream.
+
+    Valid rows are upserted on nom, invalid ones are skipped and reported.
+    Everything is committed in one transaction at the end.
+
+    Args:
+        stream: Binary file stream
+        file_format: One of 'csv', 'json', 'jsonl', 'xlsx'
+        batch_size: Rows per executemany round trip
+        dry_run: Validate and count without keeping any change
+
+    Returns:
+        dict: Report with created, updated, skipped, error_count and errors
+              (list of {'line', 'nom', 'errors'})
+
+    Raises:
+        ImportFormatError: If the file structure cannot be read
+    """
+    report = {'created': 0, 'updated': 0, 'skipped': 0, 'error_count': 0, 'errors': []}
+    batch = {}
+
+    def flush():
+        created, updated = _write_batch(batch)
+        report['created'] += created
+        report['updated'] += updated
+        batch.clear()
+
+    try:
+        for line, raw in ROW_READERS[file_format](stream):
+            values, errors = validate_row(raw)
+            if errors:
+                report['skipped'] += 1
+                report['error_count'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    nom = raw.get('nom') if isinstance(raw, dict) else None
+                    report['errors'].append({'line': line, 'nom': nom, 'errors': errors})
+                continue
+
+            if values['nom'] in batch:
+                # Duplicate name within the batch: the last row wins
+                report['skipped'] += 1
+            batch[values['nom']] = values
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return report
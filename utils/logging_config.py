@@ -0,0 +1,309 @@
+"""
+Logging configuration.
+
+Log calls only put records on an in-memory queue (QueueHandler); a
+QueueListener thread formats them and writes them to the rotating log file
+and to the console, so requests never wait on disk I/O. When the writer
+falls behind by QUEUE_SIZE records, new records are dropped and their count
+is logged once the queue has room again.
+
+Rotation renames the file, which is only safe with a single writer: under
+gunicorn with several workers, the master process is the only one writing
+the log file. It receives the workers' records on a Unix socket in a
+private temporary directory (start_log_receiver), and each worker's writer
+thread sends its records there (configure_logging(forward_to=...)).
+
+Environment variables:
+
+- LOG_LEVEL: root level (INFO by default)
+- LOG_LEVELS: per-logger levels, e.g. "routes.incidents=DEBUG,sqlalchemy.engine=WARNING"
+- LOG_FILE: log file (ona_debug.log), empty to log to the console only
+- LOG_FORMAT: 'text' or 'json' (one JSON object per line)
+- LOG_ROTATION: 'size' (LOG_MAX_BYTES, 10 MB by default) or 'time' (LOG_ROTATE_WHEN, midnight)
+- LOG_BACKUP_COUNT: rotated files kept (7)
+- LOG_DEBUG_SAMPLE_RATE: share of DEBUG records kept (1.0 keeps them all)
+- LOG_RATE_LIMIT / LOG_RATE_INTERVAL: at most LOG_RATE_LIMIT DEBUG records
+  per call site every LOG_RATE_INTERVAL seconds (0 disables the limit)
+"""
+
+import atexit
+import json
+import logging
+import os
+import pickle
+import queue
+import random
+import shutil
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import (
+    QueueHandler, QueueListener, RotatingFileHandler, SocketHandler, TimedRotatingFileHandler
+)
+
+from flask import has_request_context, request
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Records waiting for the writer thread; beyond this, records are dropped instead of growing memory
+QUEUE_SIZE = 10000
+
+# Socket of the log receiver, in its private directory
+RECEIVER_SOCKET = 'log.sock'
+
+# Attributes of every LogRecord, the others were passed with extra= and go to the JSON output
+RESERVED_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+_receiver = None
+
+class RequestContextFilter(logging.Filter):
+    """Add the method, path and endpoint of the current request to each record"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.http_method = request.method
+            record.http_path = request.path
+            record.endpoint = request.endpoint
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep only a share of the DEBUG records"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `limit` DEBUG records through per call site every `interval`
+    seconds. The number of dropped records is appended to the next record
+    let through from the same call site.
+    """
+
+    def __init__(self, limit, interval):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.limit:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window['start'] >= self.interval:
+                suppressed = window['suppressed'] if window else 0
+                window = self._windows[key] = {'start': now, 'count': 0, 'suppressed': 0}
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            if window['count'] >= self.limit:
+                window['suppressed'] += 1
+                return False
+            window['count'] += 1
+            return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName
+        }
+        for name, value in vars(record).items():
+            if name not in RESERVED_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(QueueHandler):
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        # Never waits: a record that does not fit is dropped and counted
+        try:
+            if self.dropped:
+                self._enqueue_dropped_count()
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _enqueue_dropped_count(self):
+        with self._dropped_lock:
+            count, self.dropped = self.dropped, 0
+        try:
+            self.queue.put_nowait(logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': f"{count} log records dropped: the log writer fell behind"
+            }))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += count
+            raise
+
+    def prepare(self, record):
+        # Keep the raw record: formatting is left to the writer thread's handlers,
+        # only the message arguments and exception are resolved here
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _parse_levels(value):
+    """'a=DEBUG,b.c=WARNING' -> {'a': 'DEBUG', 'b.c': 'WARNING'}"""
+    levels = {}
+    for item in (value or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def _build_file_handler(path):
+    backup_count = int(os.getenv('LOG_BACKUP_COUNT', 7))
+    if os.getenv('LOG_ROTATION', 'size') == 'time':
+        return TimedRotatingFileHandler(
+            path, when=os.getenv('LOG_ROTATE_WHEN', 'midnight'), backupCount=backup_count, encoding='utf-8'
+        )
+    return RotatingFileHandler(
+        path, maxBytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)), backupCount=backup_count, encoding='utf-8'
+    )
+
+def configure_logging(forward_to=None):
+    """
+    Route every log record through the background writer.
+
+    Safe to call more than once: the previous listener is stopped and the
+    root handlers are replaced.
+
+    Args:
+        forward_to: Socket of a log receiver (see start_log_receiver): the
+                    writer sends the records there instead of writing them
+
+    Returns:
+        QueueListener: The running writer
+    """
+    global _listener, _queue_handler
+    stop_logging()
+
+    if forward_to:
+        handlers = [SocketHandler(forward_to, None)]
+    else:
+        formatter = JsonFormatter() if os.getenv('LOG_FORMAT', 'text') == 'json' else logging.Formatter(TEXT_FORMAT)
+        handlers = [logging.StreamHandler()]
+        log_file = os.getenv('LOG_FILE', 'ona_debug.log')
+        if log_file:
+            handlers.append(_build_file_handler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))))
+    queue_handler.addFilter(RateLimitFilter(
+        int(os.getenv('LOG_RATE_LIMIT', 20)), float(os.getenv('LOG_RATE_INTERVAL', 10))
+    ))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    _queue_handler = queue_handler
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for name, level in _parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging():
+    """Flush the queued records and stop the writer thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
+
+class _LogRecordStreamHandler(socketserver.StreamRequestHandler):
+    """Records of one connection, as sent by SocketHandler: a 4-byte length, then a pickled dict"""
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            record = logging.makeLogRecord(pickle.loads(self.rfile.read(struct.unpack('>L', header)[0])))
+            # Filters already ran in the sending process, go straight to this process' writer
+            queue_handler = _queue_handler
+            if queue_handler is not None:
+                queue_handler.enqueue(record)
+
+class _LogRecordReceiver(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def start_log_receiver(directory=None):
+    """
+    Receive the log records of other processes and write them with this
+    process' writer.
+
+    The socket is created in a new private directory (mode 0700): only
+    processes of the same user can send records.
+
+    Returns:
+        str: Socket to pass to configure_logging(forward_to=...)
+    """
+    global _receiver
+    stop_log_receiver()
+    socket_dir = tempfile.mkdtemp(prefix='ona_logs_', dir=directory)
+    _receiver = _LogRecordReceiver(os.path.join(socket_dir, RECEIVER_SOCKET), _LogRecordStreamHandler)
+    threading.Thread(target=_receiver.serve_forever, name='log-receiver', daemon=True).start()
+    return _receiver.server_address
+
+def get_log_receiver():
+    """Socket of this process' log receiver (inherited by forked workers), None when not started"""
+    return _receiver.server_address if _receiver is not None else None
+
+def stop_log_receiver():
+    """Stop the log receiver and remove its socket"""
+    global _receiver
+    if _receiver is not None:
+        _receiver.shutdown()
+        _receiver.server_close()
+        shutil.rmtree(os.path.dirname(_receiver.server_address), ignore_errors=True)
+        _receiver = None
+
+atexit.register(stop_logging)
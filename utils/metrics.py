@@ -0,0 +1,405 @@
+"""
+Prometheus metrics.
+
+Counters and histograms are kept in the memory of each process and
+exposed at /metrics in the Prometheus text format (version 0.0.4).
+
+With several gunicorn/waitress worker processes, set METRICS_DIR to a
+directory shared by the workers (a tmpfs such as /dev/shm is best): each
+process writes a snapshot of its metrics there (metrics_<pid>.json) at most
+every METRICS_FLUSH_INTERVAL seconds, and /metrics sums the snapshots of
+all processes, whichever worker answers the scrape. The directory should
+be emptied when the server starts (clear_metrics_dir), and the snapshot of
+a worker that exited folded into the exited workers' totals
+(retire_snapshot), so that counters keep its requests while the directory
+holds one file per running process.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, request
+
+# Latency buckets in seconds, from a few ms to slow PDF / AI calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Default of the METRICS_FLUSH_INTERVAL setting
+DEFAULT_FLUSH_INTERVAL = 5
+
+SNAPSHOT_PREFIX = 'metrics_'
+
+# Totals of the processes that exited, see retire_snapshot
+EXITED_SNAPSHOT = f'{SNAPSHOT_PREFIX}exited.json'
+
+class Metric:
+    """Metric with a fixed set of label names, holding one value per label combination"""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def labels(self, **labels):
+        """Counter bound to one label combination, for hot paths (labels checked once)"""
+        return BoundCounter(self, self._key(labels))
+
+class BoundCounter:
+    """One label combination of a Counter"""
+
+    def __init__(self, counter, key):
+        self._counter = counter
+        self._key = key
+
+    def inc(self, amount=1):
+        counter = self._counter
+        with counter._lock:
+            counter._values[self._key] = counter._values.get(self._key, 0) + amount
+
+    @property
+    def value(self):
+        return self._counter._values.get(self._key, 0)
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, the last one is +Inf
+                state = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block, even when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+class Registry:
+    """Metrics of the application"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.last_flush = 0.0
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def snapshot(self):
+        """JSON-serializable values of every metric"""
+        return {
+            name: {
+                'type': metric.metric_type,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', [])),
+                'samples': metric.snapshot()
+            }
+            for name, metric in self._metrics.items()
+        }
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+REGISTRY = Registry()
+
+# Requests
+HTTP_REQUESTS = Counter(
+    'ona_http_requests_total', 'HTTP requests handled', ('method', 'endpoint', 'status'))
+HTTP_REQUEST_DURATION = Histogram(
+    'ona_http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'status'))
+
+# Database
+DB_QUERIES = Counter(
+    'ona_db_queries_total', 'SQL statements executed by requests', ('endpoint',))
+DB_QUERY_DURATION = Counter(
+    'ona_db_query_duration_seconds_total', 'Time spent in SQL statements by requests', ('endpoint',))
+
+# extensions.cache
+CACHE_REQUESTS = Counter(
+    'ona_cache_requests_total', 'Cache lookups', ('result',))
+
+# utils.water_quality assessment memo
+WATER_QUALITY_MEMO_REQUESTS = Counter(
+    'ona_water_quality_memo_requests_total', 'Water quality assessment memo lookups', ('result',))
+
+# PDF reports
+PDF_RENDER_DURATION = Histogram(
+    'ona_pdf_render_duration_seconds', 'PDF report generation time', ('report',))
+
+# External APIs (Mistral)
+EXTERNAL_REQUEST_DURATION = Histogram(
+    'ona_external_request_duration_seconds', 'External API call latency', ('service', 'outcome'))
+EXTERNAL_REQUEST_ERRORS = Counter(
+    'ona_external_request_errors_total', 'Failed external API calls', ('service', 'error'))
+
+# Uploads
+UPLOAD_PROCESSING_DURATION = Histogram(
+    'ona_upload_processing_duration_seconds', 'Uploaded file processing time', ('kind',))
+
+def observe_duration(histogram, **labels):
+    """Decorator observing the duration of each call of a function"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with histogram.time(**labels):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+@contextmanager
+def observe_external_call(service):
+    """
+    Time a call to an external API and count its failures.
+
+    The block sets call['status'] to the HTTP status it received, statuses
+    of 400 and above count as errors, as do exceptions (which are re-raised).
+    """
+    call = {'status': None}
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield call
+        status = call['status']
+        if status is not None and status >= 400:
+            EXTERNAL_REQUEST_ERRORS.inc(service=service, error=f'http_{status}')
+        else:
+            outcome = 'success'
+    except Exception as e:
+        EXTERNAL_REQUEST_ERRORS.inc(service=service, error=type(e).__name__)
+        raise
+    finally:
+        EXTERNAL_REQUEST_DURATION.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+def instrument_cache(app, cache):
+    """Count the hits and misses of a Flask-Caching cache (None is a miss)"""
+    backend = app.extensions['cache'][cache]
+    original_get = backend.get
+
+    @wraps(original_get)
+    def counted_get(key):
+        value = original_get(key)
+        CACHE_REQUESTS.inc(result='miss' if value is None else 'hit')
+        return value
+
+    backend.get = counted_get
+
+def _merge(total, snapshot):
+    for name, metric in snapshot.items():
+        merged = total.setdefault(name, dict(metric, samples={}))
+        for key, value in metric['samples']:
+            key = tuple(key)
+            if metric['type'] == 'histogram':
+                current = merged['samples'].get(key)
+                if current is None or len(current['buckets']) != len(value['buckets']):
+                    merged['samples'][key] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+                    continue
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                current['sum'] += value['sum']
+                current['count'] += value['count']
+            else:
+                merged['samples'][key] = merged['samples'].get(key, 0) + value
+    return total
+
+def _to_snapshot(total):
+    """Merged metrics back to the snapshot layout"""
+    return {
+        name: dict(metric, samples=[[list(key), value] for key, value in metric['samples'].items()])
+        for name, metric in total.items()
+    }
+
+def _write_snapshot(path, snapshot):
+    # Written under a temporary name so a scrape never reads half a file
+    partial_path = f'{path}.{threading.get_ident()}.partial'
+    with open(partial_path, 'w') as output:
+        json.dump(snapshot, output)
+    os.replace(partial_path, path)
+
+def get_metrics_dir():
+    return current_app.config.get('METRICS_DIR')
+
+def flush_metrics(force=False):
+    """Write this process's snapshot to METRICS_DIR, at most every METRICS_FLUSH_INTERVAL seconds"""
+    metrics_dir = get_metrics_dir()
+    if not metrics_dir:
+        return
+    now = time.monotonic()
+    interval = current_app.config.get('METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    if not force and now - REGISTRY.last_flush < interval:
+        return
+    REGISTRY.last_flush = now
+
+    os.makedirs(metrics_dir, exist_ok=True)
+    _write_snapshot(os.path.join(metrics_dir, f'{SNAPSHOT_PREFIX}{os.getpid()}.json'), REGISTRY.snapshot())
+
+def collect_metrics():
+    """Metrics of every process sharing METRICS_DIR, or of this process only"""
+    metrics_dir = get_metrics_dir()
+    if not metrics_dir:
+        return _merge({}, REGISTRY.snapshot())
+
+    flush_metrics(force=True)
+    total = {}
+    for name in sorted(os.listdir(metrics_dir)):
+        if not name.startswith(SNAPSHOT_PREFIX) or not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, name)) as snapshot:
+                _merge(total, json.load(snapshot))
+        except (OSError, ValueError) as e:
+            current_app.logger.warning(f"Unreadable metrics snapshot {name}: {e}")
+    return total
+
+def retire_snapshot(metrics_dir, pid):
+    """
+    Fold the snapshot of an exited process into EXITED_SNAPSHOT and remove it.
+
+    Called by the one process watching the workers (the gunicorn master), so
+    EXITED_SNAPSHOT has a single writer.
+    """
+    if not metrics_dir:
+        return
+    path = os.path.join(metrics_dir, f'{SNAPSHOT_PREFIX}{pid}.json')
+    exited_path = os.path.join(metrics_dir, EXITED_SNAPSHOT)
+    try:
+        with open(path) as snapshot:
+            retired = json.load(snapshot)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        # Torn by a crash: only the totals of that process are lost
+        os.remove(path)
+        return
+
+    total = {}
+    if os.path.exists(exited_path):
+        with open(exited_path) as snapshot:
+            _merge(total, json.load(snapshot))
+    _write_snapshot(exited_path, _to_snapshot(_merge(total, retired)))
+    os.remove(path)
+
+def clear_metrics_dir(metrics_dir):
+    """Remove the snapshots left by previous server runs"""
+    if not metrics_dir or not os.path.isdir(metrics_dir):
+        return
+    for name in os.listdir(metrics_dir):
+        if name.startswith(SNAPSHOT_PREFIX):
+            os.remove(os.path.join(metrics_dir, name))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+def render_metrics(metrics):
+    """Format collected metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric['labelnames']
+        for key, value in sorted(metric['samples'].items()):
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                bounds = list(metric['buckets']) + [float('inf')]
+                for bound, count in zip(bounds, value['buckets']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labelnames, key, [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(labelnames, key)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+def start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+def record_request_metrics(response):
+    """Count the request, its latency and its SQL statements"""
+    started = g.get('metrics_started')
+    if started is None:
+        return response
+    # Unmatched URLs share one label value, the raw path would be unbounded
+    endpoint = request.endpoint or 'unmatched'
+    status = str(response.status_code)
+
+    HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=status)
+    HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, status=status)
+
+    counter = g.get('query_counter')
+    if counter is not None and counter.count:
+        DB_QUERIES.inc(counter.count, endpoint=endpoint)
+        DB_QUERY_DURATION.inc(counter.duration_ms / 1000, endpoint=endpoint)
+
+    try:
+        flush_metrics()
+    except OSError as e:
+        current_app.logger.warning(f"Could not write the metrics snapshot: {e}")
+    return response
+
+def init_metrics(app, cache=None):
+    """Register the request hooks and instrument the cache"""
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    if cache is not None:
+        instrument_cache(app, cache)
@@ -0,0 +1,169 @@
+"""
+Keyset (seek) pagination helpers.
+
+Instead of OFFSET, each page starts right after the last row of the previous
+one: the client sends back an opaque cursor holding that row's sort key and
+primary key, and the next page is fetched with a range condition that can be
+answered from an index however deep the page is.
+"""
+
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+from models import db
+
+# Page size bounds for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+def _to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _from_json(value, column):
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(values):
+    """
+    Encode the key values of a row as an opaque URL-safe cursor.
+
+    Args:
+        values: Sequence of key values (sort column first, primary key last)
+
+    Returns:
+        str: Cursor token
+    """
+    payload = json.dumps([_to_json(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, columns):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        token: Cursor token
+        columns: Key columns, used to restore the value types
+
+    Returns:
+        list: Key values
+
+    Raises:
+        InvalidCursor: If the token is malformed or does not match the columns
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError('cursor length mismatch')
+        return [_from_json(value, column) for value, column in zip(values, columns)]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'Curseur de pagination invalide: {e}')
+
+def keyset_condition(columns, values, descending=False, nullable=False):
+    """
+    Build the condition selecting rows strictly after a key in sort order.
+
+    (a, b) > (x, y) is expanded to a > x OR (a = x AND b > y) so that it
+    works on every backend and keeps using the (a, b) index.
+
+    With nullable=True the first column may hold NULLs, which are ordered
+    first in ascending order and last in descending order (see keyset_order).
+    """
+    if nullable:
+        (column, id_column), (value, last_id) = columns, values
+        if descending:
+            if value is None:
+                return and_(column.is_(None), id_column < last_id)
+            return or_(column < value, and_(column == value, id_column < last_id), column.is_(None))
+        if value is None:
+            return or_(and_(column.is_(None), id_column > last_id), column.is_not(None))
+        return or_(column > value, and_(column == value, id_column > last_id))
+
+    clauses = []
+    for position, (column, value) in enumerate(zip(columns, values)):
+        previous = [c == v for c, v in zip(columns[:position], values[:position])]
+        step = column < value if descending else column > value
+        clauses.append(and_(*previous, step))
+    return or_(*clauses)
+
+def keyset_order(columns, descending=False, nullable=False):
+    """ORDER BY clauses matching keyset_condition"""
+    order = [column.desc() if descending else column.asc() for column in columns]
+    if nullable:
+        order[0] = order[0].nulls_last() if descending else order[0].nulls_first()
+    return order
+
+class KeysetPage(namedtuple('KeysetPage', ['items', 'next_cursor', 'prev_cursor'])):
+    """One page of rows with the cursors of the following and preceding pages (None at the ends)"""
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE,
+                descending=False, nullable=False, backwards=False):
+    """
+    Fetch one page of a query ordered by (sort_column, id_column).
+
+    Args:
+        query: Filtered ORM query or Core select (without ORDER BY / LIMIT)
+        sort_column: Column the client sorts on
+        id_column: Unique tie-breaker, usually the primary key
+        cursor: Cursor of the page boundary, None for the first page
+        limit: Page size, capped to MAX_PAGE_SIZE
+        descending: Sort direction
+        nullable: Whether sort_column may hold NULLs
+        backwards: Fetch the page before the cursor instead of the one after it
+
+    Returns:
+        KeysetPage: Rows in sort order with the next and previous page cursors
+
+    Raises:
+        InvalidCursor: If the cursor cannot be decoded
+    """
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    columns = [sort_column, id_column] if sort_column is not id_column else [id_column]
+    nullable = nullable and len(columns) == 2
+    # A previous page is read in reverse order from the cursor, then flipped back
+    reverse = descending != backwards
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.filter(keyset_condition(columns, values, reverse, nullable))
+
+    # One extra row tells whether another page follows
+    query = query.order_by(*keyset_order(columns, reverse, nullable)).limit(limit + 1)
+    rows = query.all() if isinstance(query, Query) else db.session.execute(query).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows, None, None)
+
+    def row_cursor(row):
+        return encode_cursor([getattr(row, column.key) for column in columns])
+
+    if backwards:
+        next_cursor = row_cursor(rows[-1])
+        prev_cursor = row_cursor(rows[0]) if has_more else None
+    else:
+        next_cursor = row_cursor(rows[-1]) if has_more else None
+        prev_cursor = row_cursor(rows[0]) if cursor else None
+    return KeysetPage(rows, next_cursor, prev_cursor)
@@ -1,12 +1,64 @@
+"""
+PDF reports (incidents and water quality).
+
+Everything a report reuses is prepared once per process: the logo is
+decoded once into an ImageReader (get_logo), and the paragraph and table
+styles are module-level objects (ReportLab only reads them while building).
+Reports are rendered in memory (render_incident_pdf, render_water_quality_pdf)
+so routes send them without a temporary file.
+"""
+
+from reportlab import rl_config
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape, letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, mm
+from reportlab.lib.utils import ImageReader
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from datetime import datetime
+from functools import lru_cache
+import io
 import os
 import tempfile
-from .water_quality import PARAMETER_METADATA
+from .water_quality import PARAMETER_METADATA, get_rules, describe_norms
+from .metrics import observe_duration, PDF_RENDER_DURATION
+
+# Images are stored as binary Flate streams: the default ASCII85 text encoding
+# runs in pure Python without ReportLab's C extension and cost more than the
+# rest of a water quality report
+rl_config.useA85 = 0
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'images')
+LOGO_PATHS = (
+    os.path.join(IMAGES_DIR, 'ona_logoFull.png'),
+    os.path.join(os.path.dirname(IMAGES_DIR), 'img', 'ona_logo.png')
+)
+
+@lru_cache(maxsize=None)
+def get_logo(path=LOGO_PATHS[0]):
+    """
+    Decode a logo once for every report.
+
+    Returns:
+        ImageReader: The decoded image, None if the file is missing or unreadable
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        reader = ImageReader(path)
+        # Decode the pixels now rather than in the first report
+        reader.getRGBData()
+        return reader
+    except Exception as e:
+        print(f"Could not load logo from {path}: {e}")
+        return None
+
+class CachedImage(Image):
+    """Image flowable drawing an ImageReader returned by get_logo"""
+
+    def __init__(self, reader, width, height, **kwargs):
+        super().__init__(reader.fileName, width=width, height=height, lazy=1, **kwargs)
+        self._img = reader
 
 def clean_unit_name(unit_text):
     """Clean and format the unit name"""
@@ -46,8 +98,85 @@ def create_paragraph_style(name, font_name='Helvetica', font_size=10, text_color
         wordWrap='CJK'  # Improved word wrapping
     )
 
+# Incident report styles
+INCIDENT_TITLE_STYLE = create_paragraph_style(
+    'CustomTitle',
+    font_name='Helvetica',
+    font_size=14,
+    alignment=0,  # Left alignment
+    space_after=2
+)
+INCIDENT_REPORT_TITLE_STYLE = create_paragraph_style(
+    'ReportTitle',
+    font_name='Helvetica-Bold',
+    font_size=16,
+    alignment=1,  # Center
+    space_before=20,
+    space_after=20
+)
+INCIDENT_DATE_STYLE = create_paragraph_style('DateStyle', font_size=10, alignment=0)
+INCIDENT_CELL_STYLE = create_paragraph_style(
+    'CellStyle',
+    font_size=9,
+    leading=12,
+    alignment=4  # Justified alignment
+)
+INCIDENT_HEADER_STYLE = create_paragraph_style(
+    'HeaderStyle',
+    font_name='Helvetica-Bold',
+    font_size=10,
+    alignment=1  # Center alignment
+)
+INCIDENT_HEADER_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+    ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+INCIDENT_HEADER_TEXT_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+INCIDENT_TABLE_STYLE = TableStyle([
+    # Header style - using the exact color from the image
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8cb2e3')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    
+    # Grid
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BOX', (0, 0), (-1, -1), 1, colors.black),
+    
+    # Alignment
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    
+    # Font
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    
+    # Padding
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('LEFTPADDING', (0, 0), (-1, -1), 4),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+    
+    # Minimum row height
+    ('MINROWHEIGHT', (0, 0), (-1, -1), 40),
+])
+
+def render_incident_pdf(incidents, unit=None):
+    """
+    Render the PDF report of incidents in memory.
+    
+    Returns:
+        bytes: The PDF document
+    """
+    buffer = io.BytesIO()
+    create_incident_pdf(incidents, buffer, unit)
+    return buffer.getvalue()
+
+@observe_duration(PDF_RENDER_DURATION, report='incidents')
 def create_incident_pdf(incidents, output_path, unit=None):
-    """Generate a PDF report for incidents"""
+    """Generate a PDF report for incidents, output_path is a path or a binary file object"""
     # Document setup
     doc = SimpleDocTemplate(
         output_path,
@@ -59,18 +188,7 @@ def create_incident_pdf(incidents, output_path, unit=None):
     )
     
     elements = []
-    
-    # Custom styles
-    title_style = create_paragraph_style(
-        'CustomTitle',
-        font_name='Helvetica',
-        font_size=14,
-        alignment=0,  # Left alignment
-        space_after=2
-    )
-    
-    # Header with logo
-    logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'images', 'ona_logoFull.png')
+    title_style = INCIDENT_TITLE_STYLE
     
     # Create header content
     header_text = [
@@ -84,10 +202,9 @@ def create_incident_pdf(incidents, output_path, unit=None):
             header_text.append([Paragraph(f"UNITE DE {cleaned_unit.upper()}", title_style)])
     
     # Create header table with logo
-    if os.path.exists(logo_path):
-        img = Image(logo_path)
-        img.drawHeight = 2.0 * inch
-        img.drawWidth = 2.0 * inch
+    logo = get_logo()
+    if logo:
+        img = CachedImage(logo, 2.0 * inch, 2.0 * inch)
         
         header_table_data = [
             [
@@ -97,45 +214,25 @@ def create_incident_pdf(incidents, output_path, unit=None):
         ]
         
         header_table = Table(header_table_data, colWidths=[400, 200])
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+        header_table.setStyle(INCIDENT_HEADER_TABLE_STYLE)
         
         elements.append(header_table)
     else:
         header_table = Table(header_text)
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+        header_table.setStyle(INCIDENT_HEADER_TEXT_STYLE)
         elements.append(header_table)
     
     # Add title "Rapport des Incidents"
-    title_style = create_paragraph_style(
-        'ReportTitle',
-        font_name='Helvetica-Bold',
-        font_size=16,
-        alignment=1,  # Center
-        space_before=20,
-        space_after=20
-    )
-    elements.append(Paragraph("Rapport des Incidents", title_style))
+    elements.append(Paragraph("Rapport des Incidents", INCIDENT_REPORT_TITLE_STYLE))
     
     # Add generation date
-    date_style = create_paragraph_style('DateStyle', font_size=10, alignment=0)
+    date_style = INCIDENT_DATE_STYLE
     generation_date = datetime.now().strftime("%Y-%m-%d %H:%M")
     elements.append(Paragraph(f"Généré le {generation_date}", date_style))
     elements.append(Spacer(1, 10))
     
-    # Create cell styles for content
-    cell_style = create_paragraph_style(
-        'CellStyle',
-        font_size=9,
-        leading=12,
-        alignment=4  # Justified alignment
-    )
+    # Cell style for content
+    cell_style = INCIDENT_CELL_STYLE
     
     # Table headers
     headers = [
@@ -150,13 +247,7 @@ def create_incident_pdf(incidents, output_path, unit=None):
     ]
     
     # Convert headers to Paragraph objects
-    header_style = create_paragraph_style(
-        'HeaderStyle',
-        font_name='Helvetica-Bold',
-        font_size=10,
-        alignment=1  # Center alignment
-    )
-    headers = [Paragraph(h, header_style) for h in headers]
+    headers = [Paragraph(h, INCIDENT_HEADER_STYLE) for h in headers]
     
     # Table data with proper text wrapping
     data = [headers]
@@ -182,40 +273,69 @@ def create_incident_pdf(incidents, output_path, unit=None):
     # Create table with row heights
     table = Table(data, colWidths=col_widths, repeatRows=1)
     
-    # Table style
-    table_style = TableStyle([
-        # Header style - using the exact color from the image
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8cb2e3')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        
-        # Alignment
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        
-        # Font
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        
-        # Padding
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        
-        # Minimum row height
-        ('MINROWHEIGHT', (0, 0), (-1, -1), 40),
-    ])
-    
-    table.setStyle(table_style)
+    table.setStyle(INCIDENT_TABLE_STYLE)
     elements.append(table)
     
     # Build PDF
     doc.build(elements)
 
+# Water quality report styles
+_sample_styles = getSampleStyleSheet()
+
+WATER_QUALITY_TITLE_STYLE = _sample_styles['Title'].clone('Title')
+WATER_QUALITY_TITLE_STYLE.fontSize = 16
+WATER_QUALITY_TITLE_STYLE.textColor = colors.darkblue
+
+WATER_QUALITY_SUBTITLE_STYLE = _sample_styles['Heading2'].clone('Subtitle')
+WATER_QUALITY_SUBTITLE_STYLE.fontSize = 14
+WATER_QUALITY_SUBTITLE_STYLE.textColor = colors.darkblue
+
+WATER_QUALITY_NORMAL_STYLE = _sample_styles['Normal'].clone('Normal')
+WATER_QUALITY_NORMAL_STYLE.fontSize = 10
+
+# Date style
+WATER_QUALITY_DATE_STYLE = _sample_styles['Normal'].clone('Date')
+WATER_QUALITY_DATE_STYLE.fontSize = 10
+WATER_QUALITY_DATE_STYLE.alignment = 2  # Right alignment
+
+# Footer style
+WATER_QUALITY_FOOTER_STYLE = _sample_styles['Normal'].clone('Footer')
+WATER_QUALITY_FOOTER_STYLE.fontSize = 8
+WATER_QUALITY_FOOTER_STYLE.textColor = colors.darkblue
+WATER_QUALITY_FOOTER_STYLE.alignment = 1  # Center alignment
+
+# Norms style
+WATER_QUALITY_NORMS_STYLE = _sample_styles['Normal'].clone('NormsStyle')
+WATER_QUALITY_NORMS_STYLE.fontSize = 9
+WATER_QUALITY_NORMS_STYLE.leading = 12
+
+# Parameter, crop, restriction and violation tables
+WATER_QUALITY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.Color(0.2, 0.4, 0.6, 0.5)),  # Softer blue background
+    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0,0), (-1,0), 10),
+    ('BOTTOMPADDING', (0,0), (-1,0), 6),
+    ('BACKGROUND', (0,1), (-1,-1), colors.Color(0.9, 0.9, 1, 0.5)),  # Light blue background
+    ('GRID', (0,0), (-1,-1), 1, colors.Color(0.7, 0.7, 0.7)),  # Soft grey grid
+    ('FONTSIZE', (0,1), (-1,-1), 9)
+])
+
+def render_water_quality_pdf(result_data):
+    """
+    Render the PDF report of a water quality assessment in memory.
+    
+    Args:
+        result_data: Dictionary containing water quality assessment results
+    Returns:
+        bytes: The PDF document
+    """
+    buffer = io.BytesIO()
+    build_water_quality_pdf(result_data, buffer)
+    return buffer.getvalue()
+
 def generate_water_quality_pdf(result_data, output_path=None):
     """
     Generate a professional PDF report for water quality assessment.
@@ -230,64 +350,39 @@ def generate_water_quality_pdf(result_data, output_path=None):
         # Create a temporary file with .pdf extension
         temp_fd, output_path = tempfile.mkstemp(suffix='.pdf', prefix='Rapport_Qualite_Eau_')
         os.close(temp_fd)  # Close the file descriptor as we'll use the path
+    build_water_quality_pdf(result_data, output_path)
+    return output_path
+
+@observe_duration(PDF_RENDER_DURATION, report='water_quality')
+def build_water_quality_pdf(result_data, output):
+    """
+    Build the water quality report into output, a path or a binary file object.
     
+    Args:
+        result_data: Dictionary containing water quality assessment results
+        output: Path or binary file object receiving the PDF
+    """
     # Create PDF document
-    doc = SimpleDocTemplate(output_path, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = styles['Title'].clone('Title')
-    title_style.fontSize = 16
-    title_style.textColor = colors.darkblue
-    
-    subtitle_style = styles['Heading2'].clone('Subtitle')
-    subtitle_style.fontSize = 14
-    subtitle_style.textColor = colors.darkblue
-    
-    normal_style = styles['Normal'].clone('Normal')
-    normal_style.fontSize = 10
-
-    # Date style
-    date_style = styles['Normal'].clone('Date')
-    date_style.fontSize = 10
-    date_style.alignment = 2  # Right alignment
+    doc = SimpleDocTemplate(output, pagesize=letter)
     
-    # Footer style
-    footer_style = styles['Normal'].clone('Footer')
-    footer_style.fontSize = 8
-    footer_style.textColor = colors.darkblue
-    footer_style.alignment = 1  # Center alignment
+    title_style = WATER_QUALITY_TITLE_STYLE
+    subtitle_style = WATER_QUALITY_SUBTITLE_STYLE
+    normal_style = WATER_QUALITY_NORMAL_STYLE
+    date_style = WATER_QUALITY_DATE_STYLE
+    footer_style = WATER_QUALITY_FOOTER_STYLE
     
     story = []
 
-    # Add Header
-    logo_paths = [
-        os.path.join(os.path.dirname(__file__), '..', 'static', 'images', 'ona_logoFull.png'),
-        os.path.join(os.path.dirname(__file__), '..', 'static', 'img', 'ona_logo.png')
-    ]
-    
+    # Add Header, the logo keeps its aspect ratio
     logo_added = False
-    for logo_path in logo_paths:
-        try:
-            if os.path.exists(logo_path):
-                from PIL import Image as PILImage
-                
-                # Open image and maintain aspect ratio
-                pil_img = PILImage.open(logo_path)
-                original_width, original_height = pil_img.size
-                
-                # Calculate new dimensions maintaining aspect ratio
-                max_width = 2*inch
-                aspect_ratio = original_width / original_height
-                new_height = max_width / aspect_ratio
-                
-                # Create ReportLab Image with correct dimensions
-                logo = Image(logo_path, width=max_width, height=new_height)
-                story.append(logo)
-                logo_added = True
-                break
-        except Exception as e:
-            print(f"Could not add logo from {logo_path}: {e}")
+    for logo_path in LOGO_PATHS:
+        logo = get_logo(logo_path)
+        if logo:
+            original_width, original_height = logo.getSize()
+            max_width = 2*inch
+            story.append(CachedImage(logo, max_width, max_width * original_height / original_width))
+            logo_added = True
+            break
     
     if not logo_added:
         # Add a text placeholder if no logo is found
@@ -303,6 +398,16 @@ def generate_water_quality_pdf(result_data, output_path=None):
     story.append(title)
     story.append(Spacer(1, 12))
 
+    # Sample information, for stored assessments
+    if result_data.get('sampled_at'):
+        sample_text = f"Prélèvement du {result_data['sampled_at'].strftime('%d/%m/%Y %H:%M')}"
+        if result_data.get('infrastructure_name'):
+            sample_text += f" - {result_data['infrastructure_name']}"
+        if result_data.get('reference'):
+            sample_text += f" (référence {result_data['reference']})"
+        story.append(Paragraph(sample_text, normal_style))
+        story.append(Spacer(1, 12))
+
     # General Classification
     rating_info = result_data.get('rating_info', {})
     classification_text = Paragraph(f"Classification Générale: {rating_info.get('title', 'N/A')}", subtitle_style)
@@ -326,23 +431,12 @@ def generate_water_quality_pdf(result_data, output_path=None):
                 ])
 
     parameter_table = Table(parameter_data, colWidths=[3*inch, 1.5*inch, 1*inch])
-    parameter_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.Color(0.2, 0.4, 0.6, 0.5)),  # Softer blue background
-        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,0), 10),
-        ('BOTTOMPADDING', (0,0), (-1,0), 6),
-        ('BACKGROUND', (0,1), (-1,-1), colors.Color(0.9, 0.9, 1, 0.5)),  # Light blue background
-        ('GRID', (0,0), (-1,-1), 1, colors.Color(0.7, 0.7, 0.7)),  # Soft grey grid
-        ('FONTSIZE', (0,1), (-1,-1), 9)
-    ]))
+    parameter_table.setStyle(WATER_QUALITY_TABLE_STYLE)
     story.append(parameter_table)
     story.append(Spacer(1, 12))
 
     # Helper function to create consistent tables
-    def create_styled_table(title, data_list, styles_sheet):
+    def create_styled_table(title, data_list):
         # Create table data
         table_data = [[title]]
         for item in data_list or [f'Aucun {title.lower()}']:
@@ -350,18 +444,7 @@ def generate_water_quality_pdf(result_data, output_path=None):
         
         # Create table
         table = Table(table_data, colWidths=[6*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.Color(0.2, 0.4, 0.6, 0.5)),  # Softer blue background
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,0), 10),
-            ('BOTTOMPADDING', (0,0), (-1,0), 6),
-            ('BACKGROUND', (0,1), (-1,-1), colors.Color(0.9, 0.9, 1, 0.5)),  # Light blue background
-            ('GRID', (0,0), (-1,-1), 1, colors.Color(0.7, 0.7, 0.7)),  # Soft grey grid
-            ('FONTSIZE', (0,1), (-1,-1), 9)
-        ]))
+        table.setStyle(WATER_QUALITY_TABLE_STYLE)
         return table
 
     # Water Quality Norms and Standards Section
@@ -369,61 +452,42 @@ def generate_water_quality_pdf(result_data, output_path=None):
     story.append(norms_title)
     story.append(Spacer(1, 12))
 
-    # Detailed Norms Content
-    norms_content = [
-        "1. Paramètres Microbiologiques:",
-        "   - Coliformes fécaux : Maximum 0 CFU/100ml pour l'irrigation",
-        "   - Nématodes : Maximum 1 œuf/L selon les normes OMS",
-        "",
-        "2. Paramètres Physiques:",
-        "   - pH : Entre 6.5 et 8.5 (acceptable pour l'irrigation)",
-        "   - Conductivité Électrique (CE) : < 3 dS/m pour une irrigation sans risque",
-        "   - Matières En Suspension (MES) : < 50 mg/L",
-        "",
-        "3. Paramètres Chimiques:",
-        "   - DBO5 : < 30 mg/L (indiquant une faible charge organique)",
-        "   - DCO : < 100 mg/L (niveau acceptable de pollution organique)",
-        "   - Chlorures : < 350 meq/L pour minimiser les risques de salinité",
-        "",
-        "4. Éléments Toxiques (Limites Maximales):",
-        "   - Cadmium : < 0.01 mg/L",
-        "   - Mercure : < 0.001 mg/L",
-        "   - Arsenic : < 0.1 mg/L",
-        "   - Plomb : < 0.1 mg/L",
-        "",
+    # Detailed Norms Content, from the rule set that assessed the sample
+    rules = get_rules(result_data.get('rules_version'))
+    norms_content = []
+    for number, (group_title, lines) in enumerate(describe_norms(rules), start=1):
+        norms_content.append(f"{number}. {group_title}:")
+        norms_content.extend(f"   - {line}" for line in lines)
+        norms_content.append("")
+    norms_content += [
         "Recommandations Générales :",
         "- Toujours traiter l'eau avant utilisation",
         "- Effectuer des tests réguliers de qualité de l'eau",
         "- Consulter les autorités locales pour des normes spécifiques"
     ]
 
-    # Create Paragraph style for norms
-    norms_style = styles['Normal'].clone('NormsStyle')
-    norms_style.fontSize = 9
-    norms_style.leading = 12
-
     # Add norms content
     for line in norms_content:
-        story.append(Paragraph(line, norms_style))
+        story.append(Paragraph(line, WATER_QUALITY_NORMS_STYLE))
     
     story.append(Spacer(1, 12))
 
     # Allowed Crops
     crops_text = Paragraph("Cultures Autorisées:", subtitle_style)
     story.append(crops_text)
-    story.append(create_styled_table('Cultures', result_data.get('allowed_crops', []), styles))
+    story.append(create_styled_table('Cultures', result_data.get('allowed_crops', [])))
     story.append(Spacer(1, 12))
 
     # Restrictions
     restrictions_text = Paragraph("Restrictions:", subtitle_style)
     story.append(restrictions_text)
-    story.append(create_styled_table('Restrictions', result_data.get('restrictions', []), styles))
+    story.append(create_styled_table('Restrictions', result_data.get('restrictions', [])))
     story.append(Spacer(1, 12))
 
     # Violations
     violations_text = Paragraph("Paramètres Hors Normes:", subtitle_style)
     story.append(violations_text)
-    story.append(create_styled_table('Violations', result_data.get('violations', ['Tous les paramètres sont conformes']), styles))
+    story.append(create_styled_table('Violations', result_data.get('violations', ['Tous les paramètres sont conformes'])))
 
     # Add Footer with governmental details
     story.append(Spacer(1, 20))
@@ -440,5 +504,3 @@ def generate_water_quality_pdf(result_data, output_path=None):
 
     # Build PDF
     doc.build(story)
-    
-    return output_path
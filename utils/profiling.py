@@ -0,0 +1,260 @@
+"""
+Opt-in request profiling.
+
+A request is profiled with cProfile when:
+
+- an administrator asks for it with the X-Profile: 1 header or the
+  ?_profile=1 query parameter,
+- or it is drawn by PROFILE_SAMPLE_RATE (0 by default, 0.01 profiles one
+  request in a hundred).
+
+One request per process is profiled at a time: since Python 3.12 a
+cProfile profiler is process wide and a second one cannot be enabled, so a
+request drawn while another one is profiled is served without profiling.
+
+The statistics are dumped as a pstats file in PROFILE_DIR and described by
+a RequestProfile row; the PROFILE_RETENTION most recent profiles are kept.
+They can be read in the admin area, or downloaded for snakeviz / pstats or
+as speedscope JSON (https://www.speedscope.app).
+"""
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app, g, request
+from flask_login import current_user
+from sqlalchemy import delete, insert, select
+
+from models import db, RequestProfile
+from utils.permissions import UserRole
+from utils.query_stats import SKIP_OPTION
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAMETER = '_profile'
+
+# Defaults of the PROFILE_SAMPLE_RATE and PROFILE_RETENTION settings
+DEFAULT_SAMPLE_RATE = 0.0
+DEFAULT_RETENTION = 200
+
+# Endpoints never profiled: static files and the profile pages themselves
+EXCLUDED_ENDPOINT_PREFIXES = ('static', 'profiling.')
+
+# Deepest caller chain rebuilt for the speedscope export
+MAX_STACK_DEPTH = 64
+
+# Held by the request being profiled in this process
+_profiler_lock = threading.Lock()
+
+def get_profile_dir():
+    """Directory of the pstats dumps (PROFILE_DIR setting)"""
+    return current_app.config.get('PROFILE_DIR') or os.path.join(current_app.instance_path, 'profiles')
+
+def _requested_by_admin():
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAMETER)
+    if flag not in ('1', 'true'):
+        return False
+    return current_user.is_authenticated and UserRole.is_admin(current_user.role)
+
+def get_profile_trigger():
+    """'requested', 'sampled' or None when the current request is not profiled"""
+    endpoint = request.endpoint or ''
+    if endpoint.startswith(EXCLUDED_ENDPOINT_PREFIXES):
+        return None
+    if _requested_by_admin():
+        return 'requested'
+    sample_rate = current_app.config.get('PROFILE_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return None
+
+def start_profiler():
+    if not current_app.config.get('PROFILING_ENABLED', True):
+        return
+    trigger = get_profile_trigger()
+    if trigger is None:
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        current_app.logger.debug(f"Not profiling {request.path}: another request is being profiled")
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another profiling tool (debugger, coverage) is active
+        _profiler_lock.release()
+        current_app.logger.debug(f"Not profiling {request.path}: {e}")
+        return
+    g.profile = {'profiler': profiler, 'trigger': trigger, 'started': time.perf_counter()}
+
+def _disable_profiler():
+    """Stop the request's profiler and let another request be profiled"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile['profiler'].disable()
+        _profiler_lock.release()
+    return profile
+
+def stop_profiler(response):
+    """Stop the request's profiler and store its statistics"""
+    profile = _disable_profiler()
+    if profile is None:
+        return response
+    duration_ms = (time.perf_counter() - profile['started']) * 1000
+
+    try:
+        profile_id = save_profile(profile['profiler'], profile['trigger'], duration_ms, response.status_code)
+        response.headers['X-Profile-Id'] = str(profile_id)
+    except Exception as e:
+        current_app.logger.warning(f"Could not store the profile of {request.path}: {e}")
+    return response
+
+def release_profiler(exception=None):
+    """Stop a profiler left running when the response was never processed"""
+    _disable_profiler()
+
+def save_profile(profiler, trigger, duration_ms, status_code):
+    """
+    Dump a profiler's statistics and record them.
+
+    Returns:
+        int: Id of the RequestProfile row
+    """
+    profile_dir = get_profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+    filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.prof"
+    profiler.dump_stats(os.path.join(profile_dir, filename))
+
+    # Separate connection: the request's session may hold uncommitted state
+    with db.engine.connect().execution_options(**{SKIP_OPTION: True}) as conn:
+        profile_id = conn.execute(insert(RequestProfile.__table__).values(
+            method=request.method,
+            path=request.full_path.rstrip('?')[:500],
+            endpoint=request.endpoint,
+            status_code=status_code,
+            duration_ms=duration_ms,
+            trigger=trigger,
+            filename=filename,
+            created_at=datetime.utcnow()
+        )).inserted_primary_key[0]
+        removed = _expired_profiles(conn)
+        conn.commit()
+
+    for name in removed:
+        remove_profile_file(name)
+    return profile_id
+
+def _expired_profiles(conn):
+    """Delete the rows beyond PROFILE_RETENTION, returning their file names"""
+    retention = current_app.config.get('PROFILE_RETENTION', DEFAULT_RETENTION)
+    table = RequestProfile.__table__
+    expired = conn.execute(
+        select(table.c.id, table.c.filename).order_by(table.c.id.desc()).offset(retention)
+    ).all()
+    if expired:
+        conn.execute(delete(table).where(table.c.id.in_([row.id for row in expired])))
+    return [row.filename for row in expired]
+
+def get_profile_path(profile):
+    return os.path.join(get_profile_dir(), profile.filename)
+
+def remove_profile_file(filename):
+    path = os.path.join(get_profile_dir(), filename)
+    if os.path.exists(path):
+        os.remove(path)
+
+def load_stats(profile):
+    """
+    Load the statistics of a stored profile.
+
+    Raises:
+        FileNotFoundError: If the pstats file was removed
+    """
+    return pstats.Stats(get_profile_path(profile))
+
+def format_stats(profile, sort='cumulative', limit=60):
+    """pstats report of a stored profile, as printed by print_stats"""
+    output = io.StringIO()
+    stats = load_stats(profile)
+    stats.stream = output
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+def read_pstats(profile):
+    """Raw pstats dump, readable by pstats.Stats, snakeviz or gprof2dot"""
+    with open(get_profile_path(profile), 'rb') as dump:
+        return dump.read()
+
+def _frame_name(function):
+    filename, line, name = function
+    return {'name': name, 'file': filename, 'line': line}
+
+def to_speedscope(profile):
+    """
+    Convert a stored profile to the speedscope file format.
+
+    cProfile keeps per-function totals and callers, not stacks: each
+    function's own time becomes one sample whose stack follows its heaviest
+    callers up to the root. Self times (sandwich view) are exact, the flame
+    graph is an approximation.
+
+    Returns:
+        dict: speedscope JSON document
+    """
+    stats = marshal.loads(read_pstats(profile))
+    frames = []
+    frame_index = {}
+
+    def index_of(function):
+        if function not in frame_index:
+            frame_index[function] = len(frames)
+            frames.append(_frame_name(function))
+        return frame_index[function]
+
+    samples = []
+    weights = []
+    for function, (_, _, self_time, _, callers) in stats.items():
+        if self_time <= 0:
+            continue
+        stack = [function]
+        seen = {function}
+        current_callers = callers
+        while current_callers and len(stack) < MAX_STACK_DEPTH:
+            # callers: {caller: (calls, primitive calls, self time, cumulative time)}
+            caller = max(current_callers, key=lambda c: current_callers[c][3])
+            if caller in seen:
+                break
+            stack.append(caller)
+            seen.add(caller)
+            current_callers = stats[caller][4] if caller in stats else None
+        samples.append([index_of(f) for f in reversed(stack)])
+        weights.append(self_time)
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f'{profile.method} {profile.path}',
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        }],
+        'name': f'{profile.method} {profile.path}',
+        'exporter': 'ONA SPARK'
+    }
+
+def init_profiling(app):
+    """Register the profiling hooks"""
+    app.before_request(start_profiler)
+    app.after_request(stop_profiler)
+    app.teardown_request(release_profiler)
@@ -0,0 +1,340 @@
+"""
+SQL statement instrumentation.
+
+Every statement sent through an SQLAlchemy engine is timed with the
+before/after_cursor_execute events:
+
+- the latest ones are kept in a ring buffer (QUERY_LOG_SIZE entries),
+- count, total and max time are aggregated per statement text,
+- statements slower than SLOW_QUERY_THRESHOLD_MS are written to the
+  slow_queries table when the app context that ran them ends,
+- each request counts its own statements (QueryCounter): the total goes
+  out in a Server-Timing header, and a statement run N_PLUS_ONE_THRESHOLD
+  times or more with different parameters is logged as a likely N+1.
+
+assert_max_queries() uses the same counter to bound the number of queries
+of a block of code in tests.
+
+Statistics live in the memory of each process: with several workers, each
+one reports its own share of the traffic.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+
+from models import db, SlowQuery
+
+# Defaults of the QUERY_LOG_SIZE, SLOW_QUERY_THRESHOLD_MS and N_PLUS_ONE_THRESHOLD settings
+DEFAULT_QUERY_LOG_SIZE = 500
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 100
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+# Distinct parameter sets remembered per statement by a QueryCounter
+MAX_TRACKED_PARAMETERS = 50
+
+# Distinct statements aggregated, later ones are only counted as untracked
+MAX_TRACKED_STATEMENTS = 1000
+
+# Bound parameters longer than this (once serialized) are not persisted
+MAX_PARAMETERS_LENGTH = 2000
+
+# Execution option marking statements that must not be recorded
+SKIP_OPTION = 'skip_query_stats'
+
+# Statements EXPLAIN QUERY PLAN is allowed to run on
+EXPLAINABLE_PREFIXES = ('select', 'with', 'insert', 'update', 'delete')
+
+class QueryStats:
+    """Ring buffer and per-statement aggregates, shared by the threads of a process"""
+
+    def __init__(self, log_size=DEFAULT_QUERY_LOG_SIZE):
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=log_size)
+        self.statements = {}
+        self.untracked = 0
+        self.started_at = datetime.utcnow()
+
+    def resize(self, log_size):
+        with self._lock:
+            self.recent = deque(self.recent, maxlen=log_size)
+
+    def record(self, statement, duration_ms, endpoint):
+        key = statement_key(statement)
+        with self._lock:
+            self.recent.append({
+                'key': key,
+                'statement': statement,
+                'duration_ms': duration_ms,
+                'endpoint': endpoint,
+                'at': datetime.utcnow()
+            })
+            stats = self.statements.get(key)
+            if stats is None:
+                if len(self.statements) >= MAX_TRACKED_STATEMENTS:
+                    self.untracked += 1
+                    return
+                stats = self.statements[key] = {
+                    'key': key,
+                    'statement': statement,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0
+                }
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+
+    def top_statements(self, limit=50):
+        """Aggregates sorted by total time, with their mean duration"""
+        with self._lock:
+            ranked = sorted(self.statements.values(), key=lambda stats: stats['total_ms'], reverse=True)
+            return [
+                dict(stats, mean_ms=stats['total_ms'] / stats['count'])
+                for stats in ranked[:limit]
+            ]
+
+    def recent_statements(self, limit=100):
+        """Latest statements, most recent first"""
+        with self._lock:
+            return list(reversed(self.recent))[:limit]
+
+    def get_statement(self, key):
+        with self._lock:
+            stats = self.statements.get(key)
+            return stats['statement'] if stats else None
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.statements.clear()
+            self.untracked = 0
+            self.started_at = datetime.utcnow()
+
+query_stats = QueryStats()
+
+class QueryCounter:
+    """Statements run during one request (or one assert_max_queries block)"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        self.statements = {}
+
+    def record(self, statement, parameters, duration_ms):
+        self.count += 1
+        self.duration_ms += duration_ms
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = {'count': 0, 'parameters': set()}
+        stats['count'] += 1
+        if len(stats['parameters']) < MAX_TRACKED_PARAMETERS:
+            stats['parameters'].add(repr(parameters))
+
+    def repeated_statements(self, threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+        """
+        Statements run at least threshold times with different parameters,
+        the usual sign of a lazy load inside a loop (N+1).
+
+        Returns:
+            list: (statement, count) pairs, most repeated first
+        """
+        repeated = [
+            (statement, stats['count'])
+            for statement, stats in self.statements.items()
+            if stats['count'] >= threshold and len(stats['parameters']) > 1
+        ]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+# Counters of the running assert_max_queries blocks
+_active_counters = []
+
+def statement_key(statement):
+    """Short stable identifier of a statement text"""
+    return hashlib.sha1(statement.encode('utf-8')).hexdigest()[:16]
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return None
+
+def _settings():
+    return current_app.config if has_app_context() else {}
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_times')
+    if not start_times:
+        return
+    duration_ms = (time.perf_counter() - start_times.pop()) * 1000
+    if conn.get_execution_options().get(SKIP_OPTION):
+        return
+
+    for counter in _active_counters:
+        counter.record(statement, parameters, duration_ms)
+    if has_request_context() and 'query_counter' in g:
+        g.query_counter.record(statement, parameters, duration_ms)
+
+    config = _settings()
+    if not config.get('QUERY_STATS_ENABLED', True):
+        return
+
+    endpoint = _current_endpoint()
+    query_stats.record(statement, duration_ms, endpoint)
+
+    threshold = config.get('SLOW_QUERY_THRESHOLD_MS', DEFAULT_SLOW_QUERY_THRESHOLD_MS)
+    if duration_ms >= threshold and has_app_context():
+        # Persisted once the app context ends, outside of the current transaction
+        g.setdefault('slow_queries', []).append({
+            'statement': statement,
+            'parameters': serialize_parameters(parameters, executemany),
+            'duration_ms': duration_ms,
+            'endpoint': endpoint,
+            'created_at': datetime.utcnow()
+        })
+
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timer(exception_context):
+    # after_cursor_execute is not called for failed statements
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start_times'):
+        connection.info['query_start_times'].pop()
+
+def serialize_parameters(parameters, executemany=False):
+    """JSON of the bound parameters, None when too large or not serializable"""
+    if executemany or not parameters:
+        return None
+    try:
+        serialized = json.dumps(parameters, default=str)
+    except (TypeError, ValueError):
+        return None
+    return serialized if len(serialized) <= MAX_PARAMETERS_LENGTH else None
+
+def flush_slow_queries(exception=None):
+    """Write the slow statements recorded during the app context to slow_queries"""
+    slow_queries = g.pop('slow_queries', None)
+    if not slow_queries:
+        return
+    try:
+        with db.engine.connect().execution_options(**{SKIP_OPTION: True}) as conn:
+            conn.execute(insert(SlowQuery.__table__), slow_queries)
+            conn.commit()
+    except Exception as e:
+        current_app.logger.warning(f"Could not persist {len(slow_queries)} slow queries: {e}")
+
+def start_query_counter():
+    g.query_counter = QueryCounter()
+    g.request_started = time.perf_counter()
+
+def report_query_counter(response):
+    """Log the request's query count and likely N+1 patterns, add the Server-Timing header"""
+    counter = g.get('query_counter')
+    if counter is None:
+        return response
+
+    config = current_app.config
+    repeated = counter.repeated_statements(
+        config.get('N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+    )
+    current_app.logger.debug(
+        f"{request.method} {request.path}: {counter.count} queries in {counter.duration_ms:.1f}ms"
+    )
+    for statement, count in repeated:
+        current_app.logger.warning(
+            f"Possible N+1 on {request.endpoint}: statement run {count} times - {' '.join(statement.split())[:300]}"
+        )
+
+    if config.get('SERVER_TIMING_ENABLED', True):
+        total_ms = (time.perf_counter() - g.request_started) * 1000
+        timings = [
+            f'db;dur={counter.duration_ms:.1f};desc="{counter.count} queries"',
+            f'app;dur={total_ms:.1f}'
+        ]
+        if repeated:
+            timings.append(f'n-plus-one;desc="{len(repeated)} repeated statements"')
+        response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+def init_query_stats(app):
+    """Apply the instrumentation settings and register the per-request hooks"""
+    query_stats.resize(app.config.get('QUERY_LOG_SIZE', DEFAULT_QUERY_LOG_SIZE))
+    app.before_request(start_query_counter)
+    app.after_request(report_query_counter)
+    app.teardown_appcontext(flush_slow_queries)
+
+@contextmanager
+def assert_max_queries(limit):
+    """
+    Fail when the enclosed block runs more than limit statements.
+
+    Meant for tests of hot endpoints, requests made with the Flask test
+    client inside the block are counted:
+
+        with assert_max_queries(5):
+            client.get('/incidents/list')
+
+    Yields:
+        QueryCounter: Statements counted so far
+
+    Raises:
+        AssertionError: If more than limit statements ran, listing them
+    """
+    counter = QueryCounter()
+    _active_counters.append(counter)
+    try:
+        yield counter
+    finally:
+        _active_counters.remove(counter)
+
+    if counter.count > limit:
+        details = '\n'.join(
+            f"  {stats['count']}x {' '.join(statement.split())[:200]}"
+            for statement, stats in sorted(
+                counter.statements.items(), key=lambda item: item[1]['count'], reverse=True
+            )
+        )
+        raise AssertionError(f"{counter.count} queries executed, {limit} expected at most:\n{details}")
+
+def explain_query_plan(statement, parameters=None):
+    """
+    Run EXPLAIN QUERY PLAN on a recorded statement.
+
+    Missing bound parameters are replaced by NULL, which is enough for SQLite
+    to choose its indexes.
+
+    Args:
+        statement: SQL text as recorded (qmark placeholders)
+        parameters: Optional list of bound parameters
+
+    Returns:
+        list: Plan rows as dicts (id, parent, detail)
+
+    Raises:
+        ValueError: If the statement is not a single DML/SELECT statement
+    """
+    stripped = statement.strip().rstrip(';')
+    if not stripped.lower().startswith(EXPLAINABLE_PREFIXES) or ';' in stripped:
+        raise ValueError('Seules les requêtes SELECT / INSERT / UPDATE / DELETE peuvent être expliquées')
+    if db.engine.dialect.name != 'sqlite':
+        raise ValueError('EXPLAIN QUERY PLAN est spécifique à SQLite')
+
+    placeholders = stripped.count('?')
+    if not isinstance(parameters, (list, tuple)) or len(parameters) != placeholders:
+        parameters = [None] * placeholders
+
+    with db.engine.connect().execution_options(**{SKIP_OPTION: True}) as conn:
+        # exec_driver_sql keeps the qmark placeholders of the recorded text
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {stripped}', tuple(parameters)).all()
+    return [{'id': row[0], 'parent': row[1], 'detail': row[3]} for row in rows]
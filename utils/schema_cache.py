@@ -0,0 +1,102 @@
+"""
+In-memory cache of the database schema for the database admin.
+
+Table names, columns, foreign keys and reflected Table objects are read from
+the catalog once and served from memory afterwards. On SQLite the cache is
+checked against PRAGMA schema_version, a counter SQLite bumps on every
+schema change, so DDL run by another process (migrations, another worker's
+add_column) is noticed on the next request. invalidate_schema_cache() drops
+it explicitly after a change made by this process.
+"""
+
+import copy
+import threading
+
+import sqlalchemy as sa
+from flask import g, has_app_context
+from sqlalchemy import inspect, text
+
+from models import db
+
+class SchemaCache:
+    """Lazily filled schema metadata, reset when the schema version changes"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self, version=None):
+        self._version = version
+        self._inspector = None
+        self._table_names = None
+        self._columns = {}
+        self._foreign_keys = {}
+        self._metadata = sa.MetaData()
+
+    def _schema_version(self):
+        if db.engine.dialect.name != 'sqlite':
+            return None
+        return db.session.execute(text('PRAGMA schema_version')).scalar()
+
+    def _validate(self):
+        """Drop the cached schema if the database schema changed since it was read"""
+        # Checked once per request
+        if has_app_context():
+            if g.get('schema_version_checked'):
+                return
+            g.schema_version_checked = True
+        version = self._schema_version()
+        if version is not None and version != self._version:
+            self._reset(version)
+
+    def _get_inspector(self):
+        if self._inspector is None:
+            self._inspector = inspect(db.engine)
+        return self._inspector
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def get_table_names(self):
+        with self._lock:
+            self._validate()
+            if self._table_names is None:
+                self._table_names = self._get_inspector().get_table_names()
+            return list(self._table_names)
+
+    def has_table(self, table_name):
+        return table_name in self.get_table_names()
+
+    def get_columns(self, table_name):
+        """Column dicts as returned by Inspector.get_columns (copies, safe to modify)"""
+        with self._lock:
+            self._validate()
+            if table_name not in self._columns:
+                self._columns[table_name] = self._get_inspector().get_columns(table_name)
+            return copy.deepcopy(self._columns[table_name])
+
+    def get_foreign_keys(self, table_name):
+        """Referenced table of each single-column foreign key: {column: table}"""
+        with self._lock:
+            self._validate()
+            if table_name not in self._foreign_keys:
+                self._foreign_keys[table_name] = {
+                    fk['constrained_columns'][0]: fk['referred_table']
+                    for fk in self._get_inspector().get_foreign_keys(table_name)
+                }
+            return dict(self._foreign_keys[table_name])
+
+    def get_table(self, table_name):
+        """Reflected Table object"""
+        with self._lock:
+            self._validate()
+            if table_name not in self._metadata.tables:
+                sa.Table(table_name, self._metadata, autoload_with=db.engine)
+            return self._metadata.tables[table_name]
+
+schema_cache = SchemaCache()
+
+def invalidate_schema_cache():
+    """Forget the cached schema, to be called after altering tables"""
+    schema_cache.invalidate()
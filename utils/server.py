@@ -0,0 +1,110 @@
+"""
+Production server settings, shared by gunicorn.conf.py (Linux) and wsgi.py
+(waitress, also on Windows). See docs/deployment.md.
+
+Environment variables:
+
+- WEB_CONCURRENCY: gunicorn worker processes (2 x CPUs + 1 by default, at most MAX_DEFAULT_WORKERS)
+- SERVER_THREADS: threads per worker (gunicorn: 4, waitress: 4 x CPUs, at least 8)
+- SERVER_BACKLOG: pending connections the socket queues before refusing new ones (512)
+- SERVER_TIMEOUT: seconds a connection may stay idle, and a gunicorn worker may stay
+  silent before it is killed (60, above the 45 s read timeout of the Mistral calls)
+- SERVER_KEEPALIVE: seconds an idle keep-alive connection is kept by gunicorn (5)
+- MAX_REQUESTS / MAX_REQUESTS_JITTER: gunicorn workers are replaced after this many
+  requests (1000, plus a random 0-100 so they do not all restart together)
+- WORKER_MAX_RSS_MB: gunicorn workers are replaced once their resident memory
+  exceeds this (512 MB, 0 disables the check)
+"""
+
+import os
+
+# Cap of the default worker count: every worker holds its own SQLite connections and caches
+MAX_DEFAULT_WORKERS = 8
+
+# Resident memory is read every RSS_CHECK_INTERVAL requests of a worker
+RSS_CHECK_INTERVAL = 20
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+def cpu_count():
+    """CPUs this process may run on (container limits included when the platform exposes them)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def worker_count():
+    return _env_int('WEB_CONCURRENCY', min(2 * cpu_count() + 1, MAX_DEFAULT_WORKERS))
+
+def gunicorn_threads():
+    return _env_int('SERVER_THREADS', 4)
+
+def waitress_threads():
+    # A single process: the threads also cover the time spent waiting on SQLite and Mistral
+    return _env_int('SERVER_THREADS', max(4 * cpu_count(), 8))
+
+def backlog():
+    return _env_int('SERVER_BACKLOG', 512)
+
+def timeout():
+    return _env_int('SERVER_TIMEOUT', 60)
+
+def keepalive():
+    return _env_int('SERVER_KEEPALIVE', 5)
+
+def max_requests():
+    return _env_int('MAX_REQUESTS', 1000)
+
+def max_requests_jitter():
+    return _env_int('MAX_REQUESTS_JITTER', 100)
+
+def max_rss_mb():
+    return _env_int('WORKER_MAX_RSS_MB', 512)
+
+def waitress_options():
+    """Keyword arguments of waitress.serve"""
+    threads = waitress_threads()
+    return {
+        'threads': threads,
+        'backlog': backlog(),
+        'channel_timeout': timeout(),
+        # Connections beyond this wait in the backlog instead of piling up on the threads
+        'connection_limit': max(threads * 4, 100),
+        'cleanup_interval': 10,
+        'url_scheme': 'http',
+        'ident': None
+    }
+
+def rss_mb():
+    """Resident memory of this process in MB, None when it cannot be read"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def bootstrap_database(app):
+    """
+    Create the missing tables and the default admin account.
+
+    Run once per server start, before the workers are forked; 'flask db upgrade'
+    and 'flask init-db' remain the way to migrate or seed a database.
+    """
+    from models import db, User
+    from utils.permissions import UserRole
+
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(username='admin').first():
+            admin_user = User(
+                username='admin',
+                role=UserRole.ADMIN
+            )
+            admin_user.set_password('admin')
+            db.session.add(admin_user)
+            db.session.commit()
+            app.logger.warning("Default admin account created (admin / admin), change its password")
+        # The forked workers must not reuse the connections opened here
+        db.engine.dispose()
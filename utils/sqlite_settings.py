@@ -0,0 +1,33 @@
+"""
+SQLite connection settings.
+
+The database file is switched to write-ahead logging (WAL). With the
+default rollback journal, a writer waiting to commit keeps every new reader
+out of the database: under concurrent traffic, a slow-query insert or any
+other write made reads wait for the 5 s busy timeout and fail with
+'database is locked'. In WAL mode readers and the writer no longer block
+each other. WAL does not work on network file systems: set SQLITE_WAL=false
+to keep the rollback journal there.
+"""
+
+from sqlalchemy import event
+
+from models import db
+
+def set_wal_mode(dbapi_connection, connection_record):
+    """Switch the database to WAL (persistent, a no-op once the file is in WAL mode)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode = WAL')
+    finally:
+        cursor.close()
+
+def init_sqlite(app):
+    """Apply the SQLite settings to the connections of a file database"""
+    if not app.config.get('SQLITE_WAL', True):
+        return
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return
+    event.listen(engine, 'connect', set_wal_mode)
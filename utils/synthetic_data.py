@@ -0,0 +1,461 @@
+"""
+Synthetic dataset for scale testing and benchmarks.
+
+generate_dataset() creates zones, units, centers, users, incidents and
+infrastructures (with PDF files) in bulk. Everything is drawn from one
+random.Random(seed) and dated relative to REFERENCE_DATE, so the same
+arguments always produce the same rows on the same database.
+
+Rows are written with executemany core INSERTs of batch_size rows on a
+single connection, with primary keys assigned here (after the current
+maximum id) so no row has to be read back. A million incidents take a few
+minutes on SQLite.
+
+Used by 'flask generate-data' and by the benchmarks (scripts/benchmark.py).
+"""
+
+import hashlib
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from models import db, Zone, Unit, Center, User, Incident, Infrastructure, InfrastructureFile, FileBlob
+from utils.blob_store import get_blob_dir, to_stored_path
+from utils.permissions import UserRole
+from utils.query_stats import SKIP_OPTION
+
+DEFAULT_SEED = 42
+
+# Rows per executemany round trip (and per commit)
+DEFAULT_BATCH_SIZE = 5000
+
+# Incident dates are spread over the DATE_SPAN_DAYS days before this date
+REFERENCE_DATE = datetime(2025, 1, 1)
+DATE_SPAN_DAYS = 3 * 365
+
+# Password of every generated account
+SYNTHETIC_PASSWORD = 'synthetic'
+
+# Prefix of the generated codes and usernames, used to detect a previous run
+CODE_PREFIX = 'SY'
+USERNAME_PREFIX = 'synth_'
+
+# Wilayas with an approximate centre and a few communes
+WILAYAS = [
+    ('Alger', 36.75, 3.06, ['Bab El Oued', 'Hussein Dey', 'Bir Mourad Raïs', 'El Harrach', 'Baraki']),
+    ('Oran', 35.70, -0.63, ['Es Senia', 'Bir El Djir', 'Arzew', 'Aïn El Turk']),
+    ('Constantine', 36.36, 6.61, ['El Khroub', 'Hamma Bouziane', 'Didouche Mourad', 'Aïn Smara']),
+    ('Annaba', 36.90, 7.76, ['El Bouni', 'El Hadjar', 'Sidi Amar', 'Berrahal']),
+    ('Blida', 36.47, 2.83, ['Boufarik', 'Larbaa', 'Ouled Yaïch', 'Mouzaïa']),
+    ('Tizi Ouzou', 36.71, 4.05, ['Azazga', 'Draâ Ben Khedda', 'Tigzirt', 'Larbaâ Nath Irathen']),
+    ('Béjaïa', 36.75, 5.08, ['Akbou', 'El Kseur', 'Amizour', 'Sidi Aïch']),
+    ('Sétif', 36.19, 5.41, ['El Eulma', 'Aïn Arnat', 'Bougaâ', 'Aïn Oulmene']),
+    ('Médéa', 36.26, 2.75, ['Berrouaghia', 'Ksar El Boukhari', 'Tablat', 'Ouzera']),
+    ('Tlemcen', 34.88, -1.32, ['Maghnia', 'Remchi', 'Ghazaouet', 'Mansourah']),
+    ('Batna', 35.56, 6.17, ['Barika', 'Arris', 'Merouana', 'Tazoult']),
+    ('Chlef', 36.17, 1.33, ['Ténès', 'Oued Fodda', 'Boukadir', 'Chettia']),
+    ('Mostaganem', 35.93, 0.09, ['Hassi Mamèche', 'Aïn Tédelès', 'Sidi Ali', 'Mazagran']),
+    ('Tipaza', 36.59, 2.45, ['Koléa', 'Cherchell', 'Hadjout', 'Bou Ismaïl']),
+    ('Boumerdès', 36.77, 3.48, ['Bordj Menaïel', 'Dellys', 'Thénia', 'Khemis El Khechna']),
+    ('Skikda', 36.88, 6.91, ['Collo', 'El Harrouch', 'Azzaba', 'Ramdane Djamel']),
+    ('Jijel', 36.82, 5.77, ['Taher', 'El Milia', 'Chekfa', 'El Aouana']),
+    ('Bouira', 36.38, 3.90, ['Lakhdaria', 'Sour El Ghozlane', "M'Chedallah", 'Aïn Bessem']),
+    ('Mascara', 35.40, 0.14, ['Sig', 'Mohammadia', 'Tighennif', 'Ghriss']),
+    ('Sidi Bel Abbès', 35.19, -0.63, ['Telagh', 'Sfisef', 'Ben Badis', 'Tessala'])
+]
+
+LOCALITES = [
+    'Cité {n} Logements', 'Quartier {n}', 'Lotissement {n}', 'Cité El Amel', 'Cité des Martyrs',
+    'Centre-ville', 'Zone industrielle', 'Douar {n}', 'Rue {n}', 'Boulevard du 1er Novembre',
+    "Cité de l'Indépendance", 'Hai El Nasr', 'Cité 5 Juillet', 'Village agricole {n}'
+]
+
+# (title, nature_cause) pairs
+INCIDENT_CAUSES = [
+    ('Obstruction du collecteur', 'Obstruction du collecteur principal par des dépôts de graisses'),
+    ('Rupture de conduite', 'Rupture de conduite suite à des travaux de voirie'),
+    ('Débordement de regard', "Débordement d'un regard de visite après de fortes pluies"),
+    ('Panne de pompe', 'Panne de la pompe de relevage'),
+    ('Infiltration', "Infiltration d'eaux pluviales dans le réseau séparatif"),
+    ('Coupure électrique', "Coupure d'alimentation électrique de la station"),
+    ('Affaissement de chaussée', 'Affaissement de la chaussée au droit de la canalisation'),
+    ('Rejet non conforme', 'Rejet industriel non conforme dans le réseau'),
+    ('Colmatage du dégrilleur', 'Colmatage du dégrilleur en entrée de station'),
+    ('Branchement illicite', 'Branchement illicite sur le collecteur'),
+    ('Intrusion de racines', 'Intrusion de racines dans la conduite'),
+    ('Défaillance de télégestion', 'Défaillance du système de télégestion')
+]
+
+IMPACTS = [
+    'Écoulement des eaux usées sur la voie publique',
+    'Nuisances olfactives pour les riverains',
+    'Inondation de caves et de rez-de-chaussée',
+    "Arrêt temporaire du traitement à la station d'épuration",
+    'Rejet direct dans le milieu naturel',
+    'Risque sanitaire pour la population',
+    'Perturbation de la circulation routière',
+    'Réduction de la capacité de relevage'
+]
+
+MESURES = [
+    'Curage hydrodynamique du tronçon concerné',
+    'Remplacement de la conduite endommagée',
+    'Mise en place d\'une pompe de secours',
+    'Intervention de l\'équipe d\'astreinte et sécurisation du site',
+    'Désinfection de la zone touchée',
+    'Inspection télévisée du réseau',
+    'Réparation du tableau électrique',
+    'Information des autorités locales'
+]
+
+RESOLUTION_NOTES = [
+    'Réseau remis en service après curage.',
+    'Conduite remplacée sur {n} mètres, essais concluants.',
+    'Pompe réparée et remise en service.',
+    'Alimentation électrique rétablie par le fournisseur.',
+    'Branchement illicite supprimé, procès-verbal dressé.',
+    'Situation normalisée, surveillance renforcée pendant une semaine.'
+]
+
+STRUCTURE_TYPES = (["Conduits", "Réseaux", "Station de relevage", "Station d'épuration"], [45, 30, 15, 10])
+GRAVITES = (['Faible', 'Moyenne', 'Élevée', 'Critique'], [40, 33, 19, 8])
+STATUSES = (['Résolu', 'En cours'], [65, 35])
+
+# Share of incidents located with a drawn shape, and the share of each shape type
+SHAPE_RATE = 0.7
+SHAPE_TYPES = (['Polygon', 'Rectangle', 'Circle'], [50, 20, 30])
+
+INFRASTRUCTURE_TYPES = (["Station d'épuration", 'Station de relevage', 'Station de pompage'], [30, 50, 20])
+ETATS = (['Opérationnel', 'En Maintenance', 'Hors Service'], [80, 14, 6])
+EPURATION_TYPES = ['Boues activées', 'Lagunage naturel', 'Lagunage aéré', 'Filtres plantés', 'Disques biologiques']
+
+# Distinct PDF documents shared (as blobs) by the infrastructure files
+SYNTHETIC_DOCUMENTS = ['Fiche technique', "Plan d'ensemble", 'Rapport de visite', 'Schéma hydraulique', 'Bilan annuel']
+
+class SyntheticDataError(RuntimeError):
+    """Raised when the database already holds synthetic data"""
+
+def _pick(rng, choices):
+    values, weights = choices
+    return rng.choices(values, weights)[0]
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+def _insert(conn, model, rows, batch_size, progress=None, total=None):
+    """executemany INSERT of rows (a list or generator of dicts) in batches, committed per batch"""
+    table = model.__table__
+    statement = insert(table)
+    batch = []
+    written = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.execute(statement, batch)
+            conn.commit()
+            written += len(batch)
+            batch = []
+            if progress:
+                progress(table.name, written, total)
+    if batch:
+        conn.execute(statement, batch)
+        conn.commit()
+        written += len(batch)
+        if progress:
+            progress(table.name, written, total)
+    return written
+
+def _shape(rng, lat, lng):
+    """A drawn shape in the format saved by the incident map (GeoJSON [lng, lat] coordinates)"""
+    shape_type = _pick(rng, SHAPE_TYPES)
+    if shape_type == 'Circle':
+        return {'type': 'Circle', 'coordinates': [round(lng, 6), round(lat, 6)]}
+    if shape_type == 'Rectangle':
+        d_lat, d_lng = rng.uniform(0.0005, 0.003), rng.uniform(0.0005, 0.003)
+        corners = [(lng, lat), (lng + d_lng, lat), (lng + d_lng, lat + d_lat), (lng, lat + d_lat), (lng, lat)]
+    else:
+        points = rng.randint(4, 7)
+        radius = rng.uniform(0.0005, 0.003)
+        corners = []
+        for k in range(points):
+            angle = 2 * math.pi * k / points + rng.uniform(-0.3, 0.3)
+            distance = radius * rng.uniform(0.6, 1.0)
+            corners.append((lng + distance * math.cos(angle), lat + distance * math.sin(angle)))
+        corners.append(corners[0])
+    return {'type': shape_type, 'coordinates': [[[round(x, 6), round(y, 6)] for x, y in corners]]}
+
+def _pdf_document(title, number):
+    """A small valid one-page PDF"""
+    text = f'{title} {number} - document de test'.encode('latin-1')
+    stream = b'BT /F1 18 Tf 72 760 Td (' + text + b') Tj ET'
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    ]
+    body = b'%PDF-1.4\n'
+    offsets = []
+    for index, content in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f'{index} 0 obj\n'.encode() + content + b'\nendobj\n'
+    xref = len(body)
+    body += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    body += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    body += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return body
+
+def _write_documents():
+    """
+    Store the synthetic PDFs in the blob store of the current app (its
+    UPLOAD_DIR), return (sha256, stored path, size) per document
+    """
+    documents = []
+    for number, title in enumerate(SYNTHETIC_DOCUMENTS, start=1):
+        content = _pdf_document(title, number)
+        sha256 = hashlib.sha256(content).hexdigest()
+        directory = get_blob_dir(sha256)
+        os.makedirs(directory, exist_ok=True)
+        disk_path = os.path.join(directory, f'{sha256}.pdf')
+        if not os.path.exists(disk_path):
+            with open(disk_path, 'wb') as output:
+                output.write(content)
+        documents.append((title, sha256, to_stored_path(disk_path), len(content)))
+    return documents
+
+def generate_dataset(zones=10, units_per_zone=8, centers_per_unit=3, users_per_unit=5,
+                     incidents=100000, infrastructures=500, files_per_infrastructure=2,
+                     seed=DEFAULT_SEED, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Bulk insert a synthetic dataset.
+
+    Each zone gets a zone director, each unit a unit director and
+    users_per_unit users; incidents are spread over all units and their users.
+    Every generated account uses the password SYNTHETIC_PASSWORD.
+
+    Args:
+        zones, units_per_zone, centers_per_unit, users_per_unit: Organisation size
+        incidents: Incidents created
+        infrastructures: Infrastructures created
+        files_per_infrastructure: PDF files attached to each infrastructure
+        seed: Random seed, the same seed gives the same data
+        batch_size: Rows per executemany round trip
+        progress: Optional callable(table_name, rows_written, rows_total)
+
+    Returns:
+        dict: Rows created per table and 'elapsed_seconds'
+
+    Raises:
+        SyntheticDataError: If synthetic users are already present
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    counts = {}
+
+    with db.engine.connect().execution_options(**{SKIP_OPTION: True}) as conn:
+        if conn.execute(select(User.id).where(User.username.like(f'{USERNAME_PREFIX}%')).limit(1)).first():
+            raise SyntheticDataError('La base contient déjà des données synthétiques')
+
+        sqlite = conn.dialect.name == 'sqlite'
+        if sqlite:
+            # Commits without fsync: a crash during generation only loses generated rows
+            previous_synchronous = conn.exec_driver_sql('PRAGMA synchronous').scalar()
+            conn.exec_driver_sql('PRAGMA synchronous = OFF')
+        try:
+            # Organisation
+            zone_rows, unit_rows, center_rows, user_rows = [], [], [], []
+            unit_places = {}
+            next_zone, next_unit = _next_id(conn, Zone), _next_id(conn, Unit)
+            next_center, next_user = _next_id(conn, Center), _next_id(conn, User)
+            password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+            created = REFERENCE_DATE - timedelta(days=DATE_SPAN_DAYS)
+
+            for z in range(zones):
+                wilaya, lat, lng, communes = WILAYAS[z % len(WILAYAS)]
+                suffix = f' {z // len(WILAYAS) + 1}' if z >= len(WILAYAS) else ''
+                zone_id = next_zone + z
+                zone_rows.append({
+                    'id': zone_id, 'name': f'Zone {wilaya}{suffix}', 'code': f'{CODE_PREFIX}Z{zone_id}',
+                    'description': f'Zone de {wilaya}', 'address': f'{wilaya}, Algérie',
+                    'created_at': created, 'updated_at': created
+                })
+                user_rows.append({
+                    'id': next_user, 'username': f'{USERNAME_PREFIX}zone_{zone_id}', 'nickname': f'Directeur {wilaya}{suffix}',
+                    'password_hash': password_hash, 'role': UserRole.EMPLOYEUR_ZONE, 'is_active': True,
+                    'unit_id': None, 'zone_id': zone_id, 'created_at': created, 'updated_at': created
+                })
+                next_user += 1
+
+                for u in range(units_per_zone):
+                    commune = communes[u % len(communes)]
+                    unit_suffix = f' {u // len(communes) + 1}' if u >= len(communes) else ''
+                    unit_id = next_unit
+                    next_unit += 1
+                    unit_lat, unit_lng = lat + rng.uniform(-0.25, 0.25), lng + rng.uniform(-0.25, 0.25)
+                    unit_rows.append({
+                        'id': unit_id, 'name': f'Unité {commune}{unit_suffix}', 'code': f'{CODE_PREFIX}U{unit_id}',
+                        'description': f'Unité de {commune} ({wilaya})', 'address': f'{commune}, {wilaya}',
+                        'zone_id': zone_id, 'created_at': created, 'updated_at': created
+                    })
+                    centers = []
+                    for c in range(centers_per_unit):
+                        centers.append(next_center)
+                        center_rows.append({
+                            'id': next_center, 'name': f'Centre {commune}{unit_suffix} {c + 1}',
+                            'code': f'{CODE_PREFIX}C{next_center}', 'address': f'{commune}, {wilaya}',
+                            'unit_id': unit_id, 'created_at': created, 'updated_at': created
+                        })
+                        next_center += 1
+                    users = []
+                    for k in range(users_per_unit + 1):
+                        role = UserRole.EMPLOYEUR_UNITE if k == 0 else UserRole.UTILISATEUR
+                        users.append(next_user)
+                        user_rows.append({
+                            'id': next_user, 'username': f'{USERNAME_PREFIX}{unit_id}_{k}',
+                            'nickname': f"{'Chef' if k == 0 else 'Agent'} {commune}{unit_suffix} {k}",
+                            'password_hash': password_hash, 'role': role, 'is_active': True,
+                            'unit_id': unit_id, 'zone_id': zone_id, 'created_at': created, 'updated_at': created
+                        })
+                        next_user += 1
+                    unit_places[unit_id] = (wilaya, commune, unit_lat, unit_lng, centers, users)
+
+            # Users first: zones and units reference their directors through nullable columns only
+            counts['users'] = _insert(conn, User, user_rows, batch_size, progress, len(user_rows))
+            counts['zones'] = _insert(conn, Zone, zone_rows, batch_size, progress, len(zone_rows))
+            counts['units'] = _insert(conn, Unit, unit_rows, batch_size, progress, len(unit_rows))
+            counts['centers'] = _insert(conn, Center, center_rows, batch_size, progress, len(center_rows))
+
+            counts['incidents'] = _insert(
+                conn, Incident, _incident_rows(rng, incidents, unit_places, _next_id(conn, Incident)),
+                batch_size, progress, incidents
+            ) if unit_places else 0
+
+            file_counts = _insert_infrastructures(
+                conn, rng, infrastructures, files_per_infrastructure, unit_places, batch_size, progress
+            )
+            counts.update(file_counts)
+        finally:
+            if sqlite:
+                conn.rollback()
+                conn.exec_driver_sql(f'PRAGMA synchronous = {int(previous_synchronous)}')
+
+    counts['elapsed_seconds'] = round(time.perf_counter() - started, 1)
+    return counts
+
+def _incident_rows(rng, count, unit_places, first_id):
+    """Generate the incident rows one at a time (a million rows are never all in memory)"""
+    units = list(unit_places.items())
+    span = DATE_SPAN_DAYS * 86400
+    for n in range(count):
+        unit_id, (wilaya, commune, unit_lat, unit_lng, centers, users) = units[rng.randrange(len(units))]
+        date_incident = REFERENCE_DATE - timedelta(seconds=rng.randrange(span))
+        status = _pick(rng, STATUSES)
+        gravite = _pick(rng, GRAVITES)
+        title, nature = rng.choice(INCIDENT_CAUSES)
+        localite = rng.choice(LOCALITES).format(n=rng.randint(1, 500))
+
+        lat, lng = unit_lat + rng.uniform(-0.05, 0.05), unit_lng + rng.uniform(-0.05, 0.05)
+        shapes = [_shape(rng, lat, lng)] if rng.random() < SHAPE_RATE else None
+        if shapes and shapes[0]['type'] == 'Circle':
+            lat, lng = shapes[0]['coordinates'][1], shapes[0]['coordinates'][0]
+        elif shapes:
+            lng, lat = shapes[0]['coordinates'][0][0]
+        elif rng.random() < 0.5:
+            lat = lng = None
+
+        # Critical incidents are handled faster
+        resolution_hours = rng.expovariate(1 / (12 if gravite == 'Critique' else 72))
+        resolved = status == 'Résolu'
+        date_resolution = date_incident + timedelta(hours=resolution_hours) if resolved else None
+
+        yield {
+            'id': first_id + n,
+            'title': f'{title} - {localite}',
+            'wilaya': wilaya,
+            'commune': commune,
+            'localite': localite,
+            'structure_type': _pick(rng, STRUCTURE_TYPES),
+            'nature_cause': nature,
+            'date_incident': date_incident,
+            'mesures_prises': '. '.join(rng.sample(MESURES, rng.randint(1, 3))),
+            'impact': rng.choice(IMPACTS),
+            'gravite': gravite,
+            'status': status,
+            'date_resolution': date_resolution,
+            'resolution_notes': rng.choice(RESOLUTION_NOTES).format(n=rng.randint(2, 120)) if resolved else None,
+            'user_id': rng.choice(users),
+            'unit_id': unit_id,
+            'center_id': rng.choice(centers) if centers and rng.random() < 0.8 else None,
+            'drawn_shapes': shapes,
+            'latitude': round(lat, 6) if lat is not None else None,
+            'longitude': round(lng, 6) if lng is not None else None,
+            'is_valid': rng.random() < 0.7,
+            'created_at': date_incident,
+            'updated_at': date_resolution or date_incident
+        }
+
+def _insert_infrastructures(conn, rng, count, files_per_infrastructure, unit_places, batch_size, progress):
+    if not count:
+        return {'infrastructures': 0, 'infrastructure_files': 0}
+
+    places = list(unit_places.values()) or [(w, c[0], lat, lng, [], []) for w, lat, lng, c in WILAYAS]
+    first_id = _next_id(conn, Infrastructure)
+    created = REFERENCE_DATE - timedelta(days=DATE_SPAN_DAYS)
+    infrastructure_rows = []
+    for n in range(count):
+        wilaya, commune = places[rng.randrange(len(places))][:2]
+        infrastructure_type = _pick(rng, INFRASTRUCTURE_TYPES)
+        infrastructure_rows.append({
+            'id': first_id + n,
+            'nom': f'{infrastructure_type} {commune} {first_id + n}',
+            'type': infrastructure_type,
+            'localisation': f'{commune}, {wilaya}',
+            'capacite': float(rng.choice([500, 1000, 2500, 5000, 10000, 25000, 50000, 100000])),
+            'etat': _pick(rng, ETATS),
+            'epuration_type': rng.choice(EPURATION_TYPES) if infrastructure_type == "Station d'épuration" else None,
+            'created_at': created,
+            'updated_at': created
+        })
+    counts = {'infrastructures': _insert(conn, Infrastructure, infrastructure_rows, batch_size, progress, count)}
+
+    file_rows = []
+    references = {}
+    documents = _write_documents() if files_per_infrastructure else []
+    for row in infrastructure_rows:
+        for title, sha256, filepath, size in rng.sample(documents, min(files_per_infrastructure, len(documents))):
+            references[sha256] = references.get(sha256, 0) + 1
+            file_rows.append({
+                'infrastructure_id': row['id'],
+                'filename': f"{title.lower().replace(' ', '_').replace(chr(39), '_')}_{row['id']}.pdf",
+                'filepath': filepath,
+                'file_type': 'pdf',
+                'mime_type': 'application/pdf',
+                'file_size': size,
+                'created_at': created,
+                'updated_at': created
+            })
+    counts['infrastructure_files'] = _insert(conn, InfrastructureFile, file_rows, batch_size, progress, len(file_rows))
+
+    # One blob per document, counting the references of earlier runs
+    blobs = FileBlob.__table__
+    for title, sha256, filepath, size in documents:
+        if not references.get(sha256):
+            continue
+        existing = conn.execute(select(blobs.c.id).where(blobs.c.sha256 == sha256)).scalar()
+        if existing:
+            conn.execute(blobs.update().where(blobs.c.id == existing)
+                         .values(ref_count=blobs.c.ref_count + references[sha256]))
+        else:
+            conn.execute(insert(blobs), [{
+                'sha256': sha256, 'filepath': filepath, 'mime_type': 'application/pdf', 'file_size': size,
+                'ref_count': references[sha256], 'created_at': created, 'updated_at': created
+            }])
+    conn.commit()
+    return counts
@@ -0,0 +1,93 @@
+"""
+Streaming upload handling.
+
+Werkzeug hands every multipart file part to a stream returned by
+Request._get_file_stream. The request class below returns a spooled
+temporary file that hashes the bytes and enforces a per-file size cap as
+they are written, so an oversize upload is rejected while it is being read
+and memory per upload stays bounded by SPOOL_MAX_MEMORY.
+"""
+
+import hashlib
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Bytes kept in memory before a file part rolls over to a temporary file on disk
+SPOOL_MAX_MEMORY = 512 * 1024
+
+# Default per-file cap, overridden by the UPLOAD_MAX_FILE_SIZE config key
+DEFAULT_MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+
+def format_size_limit(size):
+    """
+    Format a size cap for error messages: in Mo from 1 MiB, in Ko below.
+
+    Returns:
+        str: e.g. '10 Mo', '2,5 Mo' or '512 Ko'
+    """
+    if size >= 1024 * 1024:
+        value, unit = size / (1024 * 1024), 'Mo'
+    else:
+        value, unit = size / 1024, 'Ko'
+    return f"{value:.1f}".rstrip('0').rstrip('.').replace('.', ',') + f' {unit}'
+
+class HashingSpooledFile:
+    """
+    Spooled temporary file computing the SHA-256 and size of what is written.
+
+    Writing more than max_size bytes raises RequestEntityTooLarge, which
+    aborts the multipart parsing of the request.
+    """
+
+    def __init__(self, max_size=None, filename=None):
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        self._digest = hashlib.sha256()
+        self.max_size = max_size
+        self.filename = filename
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            name = f'Fichier {self.filename}' if self.filename else 'Fichier'
+            raise RequestEntityTooLarge(
+                f'{name} trop volumineux. Limite de {format_size_limit(self.max_size)}.'
+            )
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        """Hex digest of all the bytes written so far"""
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        # read, seek, tell, close... are served by the spooled file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+class StreamingUploadRequest(Request):
+    """Request class streaming file uploads through HashingSpooledFile."""
+
+    #: Per-request override of the per-file cap, set it before reading request.files
+    max_file_size_override = None
+
+    @property
+    def max_file_size(self):
+        """Per-file upload cap in bytes"""
+        if self.max_file_size_override is not None:
+            return self.max_file_size_override
+        if current_app:
+            return current_app.config.get('UPLOAD_MAX_FILE_SIZE', DEFAULT_MAX_FILE_SIZE)
+        return DEFAULT_MAX_FILE_SIZE
+
+    @max_file_size.setter
+    def max_file_size(self, value):
+        self.max_file_size_override = value
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile(max_size=self.max_file_size, filename=filename)
@@ -1,34 +1,28 @@
 """
 Water quality assessment module for evaluating treated wastewater reuse in agriculture.
 Based on official Algerian standards and regulations.
+
+Every threshold, microbiological grade and crop category comes from one
+declarative rule set (DEFAULT_RULE_SET, or the active WaterQualityRuleSet
+version stored in the database). A rule set is compiled once into a flat
+tuple of (parameter index, comparison, bound, message) checks: the single
+assessment, the batch assessment (utils.water_quality_batch) and the norms
+section of the PDF report are all generated from it, so adding a parameter
+or changing a limit needs no new code.
 """
 
+import json
+import operator
 import os
 import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
 
-# Water quality assessment constants
-WATER_QUALITY_THRESHOLDS = {
-    'microbiological': {
-        'coliform_fecal': {'A': 100, 'B': 1000},
-        'nematodes': {'A': 0.1, 'B': 1.0}
-    },
-    'physical': {
-        'ph': {'min': 6.5, 'max': 8.5},
-        'mes': {'max': 30},
-        'ce': {'max': 3}
-    },
-    'chemical': {
-        'dbo5': {'max': 30},
-        'dco': {'max': 90},
-        'chlorure': {'max': 10}
-    },
-    'toxic': {
-        'cadmium': {'max': 0.05},
-        'mercury': {'max': 0.002},
-        'arsenic': {'max': 0.5},
-        'lead': {'max': 0.05}
-    }
-}
+from flask import current_app, has_app_context
+
+from .metrics import WATER_QUALITY_MEMO_REQUESTS
 
 CROP_CATEGORIES = {
     'category1': {
@@ -179,97 +173,416 @@ RATING_CLASSIFICATIONS = {
     }
 }
 
-def assess_microbiological_quality(coliform_fecal: float, nematodes: float) -> str:
+# Classification of the grades of a rule set, best first, when no limit fails:
+# any other grade, or a failed limit, is 'low'
+GRADE_RATINGS = ('high', 'medium')
+
+# Parameters in form order: the index of a parameter in the compiled checks
+PARAMETERS = tuple(
+    param_id for group in PARAMETER_METADATA.values() for param_id in group['parameters']
+)
+
+# Comparisons a rule can use: the value passes when OPERATORS[op](value, bound) is true.
+# They also apply element-wise to NumPy arrays (utils.water_quality_batch).
+OPERATORS = {
+    '<=': operator.le,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '>': operator.gt
+}
+
+# Declarative rule table.
+# - grades: microbiological grades from best to worst; a sample gets the first grade
+#   whose 'grade' rules all pass (a grade without rules always passes). The position
+#   of the grade gives the classification (GRADE_RATINGS), whatever its name
+# - rules: 'grade' rules rate the microbiological quality, 'limit' rules are the
+#   physico-chemical limits (any failed limit makes the physico rating 'FAIL');
+#   message may use {value}, {name} and {unit}
+# - crops: a crop is allowed when the sample grade is at least 'micro' and, when
+#   'physico' is 'OK', no limit fails
+DEFAULT_RULE_SET = {
+    'grades': ['A', 'B', 'C'],
+    'rules': [
+        {'kind': 'grade', 'grade': 'A', 'parameter': 'coliform_fecal', 'op': '<=', 'bound': 100},
+        {'kind': 'grade', 'grade': 'A', 'parameter': 'nematodes', 'op': '<=', 'bound': 0.1},
+        {'kind': 'grade', 'grade': 'B', 'parameter': 'coliform_fecal', 'op': '<=', 'bound': 1000},
+        {'kind': 'grade', 'grade': 'B', 'parameter': 'nematodes', 'op': '<=', 'bound': 1.0},
+        {'kind': 'limit', 'parameter': 'ph', 'op': '>=', 'bound': 6.5, 'message': 'pH hors plage ({value})'},
+        {'kind': 'limit', 'parameter': 'ph', 'op': '<=', 'bound': 8.5, 'message': 'pH hors plage ({value})'},
+        {'kind': 'limit', 'parameter': 'mes', 'op': '<=', 'bound': 30},
+        {'kind': 'limit', 'parameter': 'ce', 'op': '<=', 'bound': 3, 'message': 'CE trop élevée ({value} dS/m)'},
+        {'kind': 'limit', 'parameter': 'dbo5', 'op': '<=', 'bound': 30},
+        {'kind': 'limit', 'parameter': 'dco', 'op': '<=', 'bound': 90},
+        {'kind': 'limit', 'parameter': 'chlorure', 'op': '<=', 'bound': 10},
+        {'kind': 'limit', 'parameter': 'cadmium', 'op': '<=', 'bound': 0.05},
+        {'kind': 'limit', 'parameter': 'mercury', 'op': '<=', 'bound': 0.002},
+        {'kind': 'limit', 'parameter': 'arsenic', 'op': '<=', 'bound': 0.5},
+        {'kind': 'limit', 'parameter': 'lead', 'op': '<=', 'bound': 0.05}
+    ],
+    'crops': [
+        {
+            'name': category['name'],
+            'micro': category['requirements']['micro'],
+            'physico': category['requirements']['physico'],
+            'restrictions': category['restrictions']
+        }
+        for category in CROP_CATEGORIES.values()
+    ]
+}
+
+# Default violation messages, per comparison direction
+DEFAULT_MESSAGES = {
+    '<=': '{name} trop élevé ({value} {unit})',
+    '<': '{name} trop élevé ({value} {unit})',
+    '>=': '{name} trop faible ({value} {unit})',
+    '>': '{name} trop faible ({value} {unit})'
+}
+
+# Checks per rule set, the batch assessment keeps them in a 64 bit mask
+MAX_CHECKS = 64
+
+class WaterQualityRuleError(ValueError):
+    """Raised when a rule set is invalid"""
+
+def _parameter_info(param_id):
+    for group in PARAMETER_METADATA.values():
+        if param_id in group['parameters']:
+            return group['parameters'][param_id]
+    return None
+
+class CompiledRules:
     """
-    Assess microbiological quality rating based on coliform and nematode levels.
-    
-    Args:
-        coliform_fecal: Fecal coliform count in CFU/100ml
-        nematodes: Nematode count in œufs/L
-        
-    Returns:
-        str: Quality rating ('A', 'B', or 'C')
+    A rule set compiled for evaluation.
+
+    checks is a flat tuple of (parameter index, comparison, bound, message);
+    evaluate() runs them in one loop and returns the mask of the failed checks
+    (bit i for checks[i]). Everything that only depends on the (grade, physico)
+    pair, i.e. the allowed crops, the restrictions and the classification, is
+    computed here once: outcomes[grade index * 2 + (1 if a limit fails else 0)],
+    also found by (micro rating, physico rating) in outcome_by_ratings.
     """
-    if (coliform_fecal <= WATER_QUALITY_THRESHOLDS['microbiological']['coliform_fecal']['A'] and 
-        nematodes <= WATER_QUALITY_THRESHOLDS['microbiological']['nematodes']['A']):
-        return 'A'
-    elif (coliform_fecal <= WATER_QUALITY_THRESHOLDS['microbiological']['coliform_fecal']['B'] and 
-          nematodes <= WATER_QUALITY_THRESHOLDS['microbiological']['nematodes']['B']):
-        return 'B'
-    return 'C'
-
-def check_physical_parameters(ph: float, mes: float, ce: float) -> list:
+
+    def __init__(self, rule_set, version=0):
+        grades = rule_set.get('grades') or []
+        rules = rule_set.get('rules') or []
+        if not grades:
+            raise WaterQualityRuleError('Aucune classe microbiologique définie')
+        if len(rules) > MAX_CHECKS:
+            raise WaterQualityRuleError(f'Trop de règles ({len(rules)}, maximum {MAX_CHECKS})')
+
+        checks = []
+        grade_masks = [0] * len(grades)
+        limit_mask = 0
+        limit_masks = {}
+        for bit, rule in enumerate(rules):
+            param_id = rule.get('parameter')
+            if param_id not in PARAMETERS:
+                raise WaterQualityRuleError(f"Paramètre inconnu dans la règle {bit + 1}: '{param_id}'")
+            op = rule.get('op')
+            if op not in OPERATORS:
+                raise WaterQualityRuleError(f"Opérateur inconnu dans la règle {bit + 1}: '{op}'")
+            bound = rule.get('bound')
+            if isinstance(bound, bool) or not isinstance(bound, (int, float)):
+                raise WaterQualityRuleError(f'Seuil invalide dans la règle {bit + 1}: {bound!r}')
+
+            info = _parameter_info(param_id)
+            message = (rule.get('message') or DEFAULT_MESSAGES[op]).replace(
+                '{name}', info['name']).replace('{unit}', info['unit'])
+            checks.append((PARAMETERS.index(param_id), OPERATORS[op], bound, message.replace(' )', ')')))
+
+            if rule.get('kind') == 'grade':
+                if rule.get('grade') not in grades:
+                    raise WaterQualityRuleError(f"Classe inconnue dans la règle {bit + 1}: '{rule.get('grade')}'")
+                grade_masks[grades.index(rule['grade'])] |= 1 << bit
+            elif rule.get('kind') == 'limit':
+                limit_mask |= 1 << bit
+                limit_masks[param_id] = limit_masks.get(param_id, 0) | 1 << bit
+            else:
+                raise WaterQualityRuleError(f"Type inconnu dans la règle {bit + 1}: '{rule.get('kind')}'")
+
+        crops = []
+        for crop in rule_set.get('crops') or []:
+            if crop.get('micro') not in grades:
+                raise WaterQualityRuleError(f"Classe inconnue pour la culture '{crop.get('name')}': '{crop.get('micro')}'")
+            crops.append((crop['name'], grades.index(crop['micro']), crop.get('physico') == 'OK', crop.get('restrictions') or []))
+
+        outcomes = []
+        for grade_index, grade in enumerate(grades):
+            for physico_rating in ('OK', 'FAIL'):
+                allowed_crops, restrictions = [], set()
+                for name, max_grade, needs_physico, crop_restrictions in crops:
+                    if grade_index <= max_grade and (not needs_physico or physico_rating == 'OK'):
+                        allowed_crops.append(name)
+                        restrictions.update(crop_restrictions)
+                if physico_rating == 'OK' and grade_index < len(GRADE_RATINGS):
+                    rating = GRADE_RATINGS[grade_index]
+                else:
+                    rating = 'low'
+                outcomes.append({
+                    'micro_rating': grade,
+                    'physico_rating': physico_rating,
+                    'rating': rating,
+                    'rating_info': RATING_CLASSIFICATIONS[rating],
+                    'allowed_crops': allowed_crops,
+                    'restrictions': sorted(restrictions)
+                })
+
+        self.version = version
+        self.rule_set = rule_set
+        self.grades = tuple(grades)
+        self.checks = tuple(checks)
+        self.grade_masks = tuple(grade_masks)
+        self.limit_mask = limit_mask
+        self.limit_masks = limit_masks
+        self.outcomes = tuple(outcomes)
+        self.outcome_by_ratings = {(outcome['micro_rating'], outcome['physico_rating']): outcome for outcome in outcomes}
+
+    def evaluate(self, values):
+        """Mask of the failed checks for values, a sequence in PARAMETERS order"""
+        failed = 0
+        bit = 1
+        for param_index, compare, bound, _ in self.checks:
+            if not compare(values[param_index], bound):
+                failed |= bit
+            bit <<= 1
+        return failed
+
+    def outcome_index(self, failed):
+        """Index in outcomes of a failed-checks mask"""
+        grade_index = len(self.grades) - 1
+        for index, mask in enumerate(self.grade_masks):
+            if not failed & mask:
+                grade_index = index
+                break
+        return grade_index * 2 + (1 if failed & self.limit_mask else 0)
+
+    def violations(self, values, failed):
+        """Violation messages of the failed limits, each message once"""
+        messages = []
+        failed &= self.limit_mask
+        bit = 0
+        while failed:
+            if failed & 1:
+                param_index, _, _, message = self.checks[bit]
+                message = message.format(value=values[param_index])
+                if message not in messages:
+                    messages.append(message)
+            failed >>= 1
+            bit += 1
+        return messages
+
+# Compiled rule sets per version (0 is DEFAULT_RULE_SET); versions are never modified once saved
+_compiled_rules = {}
+_compiled_lock = threading.Lock()
+
+# Seconds the active version of an application is reused before the table is read
+# again: a version saved by another process applies after at most this delay
+RULES_CHECK_INTERVAL = float(os.getenv('WATER_QUALITY_RULES_CHECK_INTERVAL', 10))
+
+# Application -> (active compiled rules, monotonic time they were read)
+_active_rules = weakref.WeakKeyDictionary()
+
+def compile_rules(rule_set, version=0):
     """
-    Check physical parameters against thresholds.
-    
-    Args:
-        ph: pH value
-        mes: MES in mg/L
-        ce: CE in dS/m
-        
-    Returns:
-        list: List of violation messages
+    Compile a rule set, once per version.
+
+    Raises:
+        WaterQualityRuleError: If the rule set is invalid
     """
-    violations = []
-    
-    if not (WATER_QUALITY_THRESHOLDS['physical']['ph']['min'] <= ph <= WATER_QUALITY_THRESHOLDS['physical']['ph']['max']):
-        violations.append(f"pH hors plage ({ph})")
-    if mes > WATER_QUALITY_THRESHOLDS['physical']['mes']['max']:
-        violations.append(f"MES trop élevé ({mes} mg/L)")
-    if ce > WATER_QUALITY_THRESHOLDS['physical']['ce']['max']:
-        violations.append(f"CE trop élevée ({ce} dS/m)")
-        
-    return violations
+    compiled = _compiled_rules.get(version)
+    if compiled is None:
+        compiled = CompiledRules(rule_set, version)
+        with _compiled_lock:
+            _compiled_rules[version] = compiled
+    return compiled
 
-def check_chemical_parameters(dbo5: float, dco: float, chlorure: float) -> list:
+def get_rules(version=None):
     """
-    Check chemical parameters against thresholds.
-    
-    Args:
-        dbo5: DBO5 in mg/L
-        dco: DCO in mg/L
-        chlorure: Chlorure in meq/L
-        
+    Get the compiled rules of a version, or of the active version when None.
+
+    The rule sets are read from the water_quality_rule_sets table; without an
+    application context, or when no version is active, DEFAULT_RULE_SET applies.
+    The active version is read at most every RULES_CHECK_INTERVAL seconds.
+    """
+    if version == 0 or version in _compiled_rules:
+        return compile_rules(DEFAULT_RULE_SET) if version == 0 else _compiled_rules[version]
+
+    if not has_app_context():
+        return compile_rules(DEFAULT_RULE_SET)
+
+    app = current_app._get_current_object()
+    if version is None:
+        active = _active_rules.get(app)
+        if active is not None and time.monotonic() - active[1] < RULES_CHECK_INTERVAL:
+            return active[0]
+        rules = _read_rules(None)
+        _active_rules[app] = (rules, time.monotonic())
+        return rules
+    return _read_rules(version)
+
+def _read_rules(version):
+
+    from sqlalchemy import select
+    from sqlalchemy.exc import SQLAlchemyError
+    from models import db, WaterQualityRuleSet
+
+    statement = select(WaterQualityRuleSet.version, WaterQualityRuleSet.rules)
+    if version is None:
+        statement = statement.where(WaterQualityRuleSet.is_active.is_(True))
+    else:
+        statement = statement.where(WaterQualityRuleSet.version == version)
+    try:
+        row = db.session.execute(statement.order_by(WaterQualityRuleSet.version.desc()).limit(1)).first()
+    except SQLAlchemyError:
+        # Tables not created yet
+        db.session.rollback()
+        row = None
+    if row is None:
+        return compile_rules(DEFAULT_RULE_SET)
+    return _compiled_rules.get(row.version) or compile_rules(json.loads(row.rules), row.version)
+
+def save_rule_set(rule_set, comment=None, user_id=None):
+    """
+    Store a rule set as a new version and make it the active one.
+
     Returns:
-        list: List of violation messages
+        WaterQualityRuleSet: The saved version
+
+    Raises:
+        WaterQualityRuleError: If the rule set is invalid (nothing is saved)
     """
-    violations = []
-    
-    if dbo5 > WATER_QUALITY_THRESHOLDS['chemical']['dbo5']['max']:
-        violations.append(f"DBO5 trop élevé ({dbo5} mg/L)")
-    if dco > WATER_QUALITY_THRESHOLDS['chemical']['dco']['max']:
-        violations.append(f"DCO trop élevé ({dco} mg/L)")
-    if chlorure > WATER_QUALITY_THRESHOLDS['chemical']['chlorure']['max']:
-        violations.append(f"Chlorure trop élevé ({chlorure} meq/L)")
-        
-    return violations
+    from sqlalchemy import func
+    from models import db, WaterQualityRuleSet
 
-def check_toxic_elements(cadmium: float, mercury: float, arsenic: float, lead: float) -> list:
+    # Validate before anything is written
+    CompiledRules(rule_set)
+
+    version = (db.session.query(func.max(WaterQualityRuleSet.version)).scalar() or 0) + 1
+    WaterQualityRuleSet.query.filter_by(is_active=True).update({'is_active': False})
+    saved = WaterQualityRuleSet(
+        version=version,
+        rules=json.dumps(rule_set, ensure_ascii=False),
+        comment=comment,
+        created_by=user_id,
+        is_active=True
+    )
+    db.session.add(saved)
+    db.session.commit()
+    _active_rules.pop(current_app._get_current_object(), None)
+    return saved
+
+def reset_rule_sets():
+    """Deactivate every saved version, DEFAULT_RULE_SET applies again"""
+    from models import db, WaterQualityRuleSet
+
+    WaterQualityRuleSet.query.filter_by(is_active=True).update({'is_active': False})
+    db.session.commit()
+    _active_rules.pop(current_app._get_current_object(), None)
+
+# Evaluations kept by the assessment memo of each process
+MEMO_SIZE = int(os.getenv('WATER_QUALITY_MEMO_SIZE', 4096))
+
+class AssessmentMemo:
     """
-    Check toxic element levels against thresholds.
-    
-    Args:
-        cadmium: Cadmium in mg/L
-        mercury: Mercury in mg/L
-        arsenic: Arsenic in mg/L
-        lead: Lead in mg/L
-        
+    Bounded LRU memo of evaluated samples.
+
+    Maps (rules version, canonical values) to (outcome index, violations):
+    the result of a sample only depends on its values and on the rules
+    version, which is never modified once saved. Lookups are thread-safe and
+    counted in ona_water_quality_memo_requests_total.
+    """
+
+    def __init__(self, maxsize=MEMO_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = WATER_QUALITY_MEMO_REQUESTS.labels(result='hit')
+        self._misses = WATER_QUALITY_MEMO_REQUESTS.labels(result='miss')
+
+    def get(self, key):
+        # Marking the entry as recently used reorders the OrderedDict, under the same lock as put()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self._misses.inc()
+            return None
+        self._hits.inc()
+        return entry
+
+    def put(self, key, entry):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Hits and misses since the metrics were reset, current and maximum size"""
+        return {'hits': self._hits.value, 'misses': self._misses.value, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+assessment_memo = AssessmentMemo()
+
+def canonical_values(data):
+    """
+    Values of a sample in PARAMETERS order, as floats, so that 7, '7' and 7.0
+    share a memo entry.
+
+    Raises:
+        KeyError: If a parameter is missing
+        ValueError: If a value is not a number
+    """
+    return tuple(map(float, map(data.__getitem__, PARAMETERS)))
+
+def _format_bound(bound, unit):
+    return f"{bound:g} {unit}".strip()
+
+def describe_norms(rules):
+    """
+    Norms of a rule set as text, for the PDF report.
+
     Returns:
-        list: List of violation messages
+        list: (group title, list of lines), in PARAMETER_METADATA order
     """
-    violations = []
-    elements = {
-        'cadmium': cadmium,
-        'mercury': mercury,
-        'arsenic': arsenic,
-        'lead': lead
-    }
-    
-    for element, value in elements.items():
-        if value > WATER_QUALITY_THRESHOLDS['toxic'][element]['max']:
-            violations.append(f"{element.capitalize()} trop élevé ({value} mg/L)")
-            
-    return violations
+    sections = []
+    for group in PARAMETER_METADATA.values():
+        lines = []
+        for param_id, info in group['parameters'].items():
+            param_index = PARAMETERS.index(param_id)
+            grade_parts, lower, upper = [], None, None
+            for bit, (index, compare, bound, _) in enumerate(rules.checks):
+                if index != param_index:
+                    continue
+                op = next(symbol for symbol, function in OPERATORS.items() if function is compare)
+                grades = [grade for grade, mask in zip(rules.grades, rules.grade_masks) if mask >> bit & 1]
+                if grades:
+                    limit = 'maximum' if op in ('<=', '<') else 'minimum'
+                    grade_parts.append(f"{limit} {_format_bound(bound, info['unit'])} (qualité {grades[0]})")
+                elif op in ('<=', '<'):
+                    upper = (op, bound)
+                else:
+                    lower = (op, bound)
+            if grade_parts:
+                text = ', '.join(grade_parts)
+                lines.append(f"{info['name']} : {text[0].upper()}{text[1:]}")
+            if lower and upper:
+                lines.append(f"{info['name']} : Entre {lower[1]:g} et {_format_bound(upper[1], info['unit'])}")
+            elif upper:
+                word = 'Maximum' if upper[0] == '<=' else 'Inférieur à'
+                lines.append(f"{info['name']} : {word} {_format_bound(upper[1], info['unit'])}")
+            elif lower:
+                word = 'Minimum' if lower[0] == '>=' else 'Supérieur à'
+                lines.append(f"{info['name']} : {word} {_format_bound(lower[1], info['unit'])}")
+        if lines:
+            sections.append((group['title'], lines))
+    return sections
 
 def determine_allowed_crops(micro_rating: str, physico_rating: str) -> tuple:
     """
@@ -282,16 +595,8 @@ def determine_allowed_crops(micro_rating: str, physico_rating: str) -> tuple:
     Returns:
         tuple: (list of allowed crops, set of restrictions)
     """
-    allowed_crops = []
-    restrictions = set()
-
-    for category in CROP_CATEGORIES.values():
-        if (category['requirements']['micro'] >= micro_rating and 
-            (category['requirements']['physico'] == 'OK' and physico_rating == 'OK')):
-            allowed_crops.append(category['name'])
-            restrictions.update(category['restrictions'])
-            
-    return allowed_crops, restrictions
+    outcome = get_rules().outcome_by_ratings[(micro_rating, physico_rating)]
+    return list(outcome['allowed_crops']), set(outcome['restrictions'])
 
 def get_parameter_metadata():
     """
@@ -307,18 +612,14 @@ def get_rating_classification(micro_rating: str, physico_rating: str) -> dict:
     Get the rating classification based on microbiological and physico-chemical ratings.
     
     Args:
-        micro_rating: Microbiological rating ('A', 'B', or 'C')
+        micro_rating: Microbiological rating, a grade of the active rules ('A', 'B', or 'C' by default)
         physico_rating: Physico-chemical rating ('OK' or 'FAIL')
         
     Returns:
         dict: Rating classification including title, description, icon, and color
     """
-    if micro_rating == 'A' and physico_rating == 'OK':
-        return RATING_CLASSIFICATIONS['high']
-    elif micro_rating in ['A', 'B'] and physico_rating == 'OK':
-        return RATING_CLASSIFICATIONS['medium']
-    else:
-        return RATING_CLASSIFICATIONS['low']
+    outcome = get_rules().outcome_by_ratings.get((micro_rating, physico_rating))
+    return outcome['rating_info'] if outcome else RATING_CLASSIFICATIONS['low']
 
 def get_parameter_with_unit(param_type: str, param_name: str, value: float) -> str:
     """
@@ -345,29 +646,30 @@ def assess_water_quality(data: dict) -> dict:
     Returns:
         dict: Assessment results including rating, allowed crops, restrictions, and violations
     """
-    # Assess microbiological quality
-    micro_rating = assess_microbiological_quality(data['coliform_fecal'], data['nematodes'])
-    
-    # Check all parameters for violations
-    violations = []
-    violations.extend(check_physical_parameters(data['ph'], data['mes'], data['ce']))
-    violations.extend(check_chemical_parameters(data['dbo5'], data['dco'], data['chlorure']))
-    violations.extend(check_toxic_elements(data['cadmium'], data['mercury'], data['arsenic'], data['lead']))
+    rules = get_rules()
+    values = canonical_values(data)
     
-    physico_rating = 'OK' if not violations else 'FAIL'
-    
-    # Determine allowed crops and restrictions
-    allowed_crops, restrictions = determine_allowed_crops(micro_rating, physico_rating)
-    
-    # Get rating classification
-    rating_info = get_rating_classification(micro_rating, physico_rating)
+    # Identical samples are evaluated once per rules version
+    key = (rules.version, values)
+    entry = assessment_memo.get(key)
+    if entry is None:
+        # Run every check of the rule set at once
+        failed = rules.evaluate(values)
+        entry = (rules.outcome_index(failed), tuple(rules.violations(values, failed)))
+        assessment_memo.put(key, entry)
+    outcome_index, violations = entry
+    outcome = rules.outcomes[outcome_index]
+    rating_info = outcome['rating_info']
     
     return {
         'general_rating': f"{rating_info['title']} - {rating_info['description']}",
         'rating_info': rating_info,
-        'allowed_crops': allowed_crops,
-        'restrictions': list(restrictions),
-        'violations': violations,
+        'micro_rating': outcome['micro_rating'],
+        'physico_rating': outcome['physico_rating'],
+        'allowed_crops': list(outcome['allowed_crops']),
+        'restrictions': list(outcome['restrictions']),
+        'violations': list(violations),
+        'rules_version': rules.version,
         'parameters': data
     }
 
@@ -384,4 +686,17 @@ def generate_pdf_report(result_data, output_path=None):
     from utils.pdf_generator import generate_water_quality_pdf
     return generate_water_quality_pdf(result_data, output_path)
 
-# ... rest of the code remains the same ...
+def render_pdf_report(result_data):
+    """
+    Render the PDF report for the water quality assessment in memory.
+    
+    Args:
+        result_data: Dictionary containing water quality assessment results
+    Returns:
+        bytes: The PDF document
+    """
+    from utils.pdf_generator import render_water_quality_pdf
+    return render_water_quality_pdf(result_data)
+
+# The default rules (and their outcome table) are compiled on import
+compile_rules(DEFAULT_RULE_SET)
@@ -0,0 +1,384 @@
+"""
+Batch water quality assessment of laboratory result files (CSV or XLSX).
+
+The samples of a file are loaded into one NumPy float64 array per parameter,
+then every check of the compiled rule set (utils.water_quality.get_rules) is
+evaluated with a single vectorised comparison over all the samples, setting
+one bit of a per-sample 64 bit mask of failed checks:
+
+- the microbiological grade is the first grade none of whose checks failed
+- any failed limit check makes the physico rating 'FAIL'
+- the allowed crops and the rating classification only depend on the
+  (grade, physico rating) pair: they are read from the outcomes of the
+  compiled rules, indexed per sample
+
+The results are the same as assess_water_quality for each sample.
+"""
+
+import csv
+import io
+import os
+import unicodedata
+
+import numpy as np
+
+from utils.water_quality import PARAMETERS, PARAMETER_METADATA, RATING_CLASSIFICATIONS, get_rules
+
+SUPPORTED_FORMATS = {
+    '.csv': 'csv',
+    '.xlsx': 'xlsx'
+}
+
+# Samples per file, the raw cells are held in memory while the columns are built
+MAX_SAMPLES = 200000
+
+# Per-row errors kept in the report, the remaining ones are only counted
+MAX_REPORTED_ERRORS = 1000
+
+PARAMETER_NAMES = {
+    param_id: param['name']
+    for group in PARAMETER_METADATA.values() for param_id, param in group['parameters'].items()
+}
+
+# Optional columns copied to the results to identify the samples
+LABEL_COLUMNS = ('reference', 'date')
+
+def _header_key(text):
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii')
+    # Units are often written in the header: 'MES (mg/L)'
+    text = text.split('(')[0].strip().lower()
+    return '_'.join(text.replace('-', ' ').replace("'", ' ').split())
+
+# Header spellings accepted for each column: the parameter id, its displayed name, and a few usual ones
+HEADER_ALIASES = {
+    **{param_id: param_id for param_id in PARAMETERS},
+    **{_header_key(name): param_id for param_id, name in PARAMETER_NAMES.items()},
+    'coliformes': 'coliform_fecal',
+    'cf': 'coliform_fecal',
+    'conductivite': 'ce',
+    'chlorures': 'chlorure',
+    'reference': 'reference',
+    'ref': 'reference',
+    'echantillon': 'reference',
+    'sample': 'reference',
+    'code': 'reference',
+    'date': 'date',
+    'date_prelevement': 'date',
+    'date_de_prelevement': 'date',
+    'sampled_at': 'date'
+}
+
+class BatchFormatError(ValueError):
+    """Raised when the file format is unsupported or its structure unreadable"""
+
+def detect_format(filename):
+    """
+    Get the batch file format from a file name.
+
+    Raises:
+        BatchFormatError: If the extension is not supported
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in SUPPORTED_FORMATS:
+        raise BatchFormatError(
+            f"Format non supporté: '{extension or filename}'. "
+            f"Formats acceptés: {', '.join(sorted(SUPPORTED_FORMATS))}"
+        )
+    return SUPPORTED_FORMATS[extension]
+
+def _read_csv(stream):
+    """(headers, rows, line numbers) of a CSV stream, the delimiter (',', ';' or tab) is sniffed"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        headers = next(reader, [])
+        rows, lines = [], []
+        for row in reader:
+            if any(row):
+                rows.append(row)
+                lines.append(reader.line_num)
+                if len(rows) > MAX_SAMPLES:
+                    break
+        return headers, rows, lines
+    except UnicodeDecodeError as e:
+        raise BatchFormatError(f"Fichier CSV illisible (encodage UTF-8 attendu): {e}")
+    finally:
+        # Leave the underlying stream open for the caller
+        text.detach()
+
+def _read_xlsx(stream):
+    """(headers, rows, line numbers) of the first sheet of a workbook, read in read-only mode"""
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise BatchFormatError(f'Classeur XLSX illisible: {e}')
+    try:
+        sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = list(next(sheet_rows, ()))
+        rows, lines = [], []
+        for line_number, row in enumerate(sheet_rows, start=2):
+            if any(cell not in (None, '') for cell in row):
+                rows.append(row)
+                lines.append(line_number)
+                if len(rows) > MAX_SAMPLES:
+                    break
+        return headers, rows, lines
+    finally:
+        workbook.close()
+
+READERS = {
+    'csv': _read_csv,
+    'xlsx': _read_xlsx
+}
+
+def _to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace('\u00a0', '').replace(' ', '').replace(',', '.')
+    return float(text) if text else np.nan
+
+def _float_column(cells):
+    """
+    Convert the cells of one column to float64.
+
+    Returns:
+        tuple: (array with NaN where a cell is empty or unreadable, {index: raw cell} of the unreadable cells)
+    """
+    try:
+        # Fast path: numbers (XLSX) or plain decimal strings
+        return np.asarray(cells, dtype=np.float64), {}
+    except (ValueError, TypeError):
+        pass
+    values = np.empty(len(cells), dtype=np.float64)
+    unreadable = {}
+    for index, cell in enumerate(cells):
+        if cell is None:
+            values[index] = np.nan
+            continue
+        try:
+            values[index] = _to_float(cell)
+        except ValueError:
+            values[index] = np.nan
+            unreadable[index] = cell
+    return values, unreadable
+
+def load_samples(stream, file_format):
+    """
+    Load the samples of a laboratory result file into column arrays.
+
+    The first row holds the headers: one column per parameter (its id, such as
+    'dbo5', or its displayed name, such as 'DBO5 (mg/L)'), plus the optional
+    'reference' and 'date' columns. Samples with a missing, unreadable or
+    negative value are reported and left out of the arrays.
+
+    Args:
+        stream: Binary file stream
+        file_format: 'csv' or 'xlsx'
+
+    Returns:
+        dict: 'columns' ({parameter: float64 array}), 'lines' (file line of each sample),
+              'labels' ({'reference'/'date': list of str}), 'rows' (samples read),
+              'error_count' and 'errors' (list of {'line', 'errors'})
+
+    Raises:
+        BatchFormatError: If the file cannot be read, lacks parameter columns or has too many rows
+    """
+    headers, rows, lines = READERS[file_format](stream)
+    if len(rows) > MAX_SAMPLES:
+        raise BatchFormatError(f'Trop d\'échantillons dans le fichier (maximum {MAX_SAMPLES})')
+
+    positions = {}
+    for position, header in enumerate(headers):
+        key = HEADER_ALIASES.get(_header_key(header))
+        if key and key not in positions:
+            positions[key] = position
+    missing = [PARAMETER_NAMES[param_id] for param_id in PARAMETERS if param_id not in positions]
+    if missing:
+        raise BatchFormatError(f"Colonnes manquantes: {', '.join(missing)}")
+
+    width = max(positions.values()) + 1
+    # Short rows (trailing empty cells dropped by the writer) are padded
+    rows = [row if len(row) >= width else tuple(row) + (None,) * (width - len(row)) for row in rows]
+    cells = list(zip(*rows)) if rows else [()] * width
+
+    columns = {}
+    invalid = np.zeros(len(rows), dtype=bool)
+    row_errors = {}
+    for param_id in PARAMETERS:
+        values, unreadable = _float_column(cells[positions[param_id]])
+        name = PARAMETER_NAMES[param_id]
+        bad = ~np.isfinite(values) | (values < 0)
+        if bad.any():
+            for index in np.flatnonzero(bad).tolist():
+                if index in unreadable:
+                    message = f"Valeur invalide pour {name}: '{unreadable[index]}'"
+                elif np.isfinite(values[index]):
+                    message = f'Valeur négative pour {name}'
+                else:
+                    message = f'Valeur manquante: {name}'
+                row_errors.setdefault(index, []).append(message)
+            invalid |= bad
+        columns[param_id] = values
+
+    valid = ~invalid
+    lines = np.asarray(lines, dtype=np.int64)
+    labels = {}
+    for label in LABEL_COLUMNS:
+        if label in positions:
+            labels[label] = [
+                '' if cell is None else str(cell).strip()
+                for cell, keep in zip(cells[positions[label]], valid) if keep
+            ]
+
+    return {
+        'columns': {param_id: values[valid] for param_id, values in columns.items()},
+        'lines': lines[valid],
+        'labels': labels,
+        'rows': len(rows),
+        'error_count': len(row_errors),
+        'errors': [
+            {'line': int(lines[index]), 'errors': messages}
+            for index, messages in sorted(row_errors.items())[:MAX_REPORTED_ERRORS]
+        ]
+    }
+
+def assess_batch(columns, rules=None):
+    """
+    Assess every sample of the column arrays at once.
+
+    Args:
+        columns: {parameter: float64 array}, all of the same length
+        rules: Compiled rules, the active ones by default
+
+    Returns:
+        dict: 'rules' and per-sample arrays: 'failed' (bit i set when rules.checks[i]
+              fails), 'grade' (index in rules.grades) and 'outcome' (index in rules.outcomes)
+    """
+    rules = rules or get_rules()
+    count = len(next(iter(columns.values())))
+
+    failed = np.zeros(count, dtype=np.uint64)
+    for bit, (param_index, compare, bound, _) in enumerate(rules.checks):
+        # NaN fails every comparison, as in the single assessment
+        passed = compare(columns[PARAMETERS[param_index]], bound)
+        failed |= (~passed).astype(np.uint64) << np.uint64(bit)
+
+    # Worst grade by default, then each better grade whose checks all passed, best last
+    grade = np.full(count, len(rules.grades) - 1, dtype=np.uint8)
+    for index in reversed(range(len(rules.grades))):
+        grade[(failed & np.uint64(rules.grade_masks[index])) == 0] = index
+
+    limit_failed = (failed & np.uint64(rules.limit_mask)) != 0
+    outcome = grade * 2 + limit_failed
+    return {'rules': rules, 'failed': failed, 'grade': grade, 'outcome': outcome.astype(np.uint8)}
+
+def summarize_batch(samples, assessment):
+    """
+    Aggregate the assessment of a batch.
+
+    Returns:
+        dict: Counts per micro rating, physico rating and classification, compliance rate,
+              violations per parameter, samples allowing each crop and min/mean/max per parameter
+    """
+    rules = assessment['rules']
+    columns = samples['columns']
+    count = len(assessment['outcome'])
+    outcome_counts = np.bincount(assessment['outcome'], minlength=len(rules.outcomes))
+    grade_counts = np.bincount(assessment['grade'], minlength=len(rules.grades))
+    physico_ok = int(outcome_counts[0::2].sum())
+
+    ratings = {key: 0 for key in RATING_CLASSIFICATIONS}
+    crops = {}
+    for outcome, outcome_count in zip(rules.outcomes, outcome_counts.tolist()):
+        ratings[outcome['rating']] += outcome_count
+        for crop in outcome['allowed_crops']:
+            crops[crop] = crops.get(crop, 0) + outcome_count
+
+    violations = {
+        param_id: int(np.count_nonzero(assessment['failed'] & np.uint64(mask)))
+        for param_id, mask in rules.limit_masks.items()
+    }
+
+    statistics = {}
+    for param_id in PARAMETERS:
+        values = columns[param_id]
+        statistics[param_id] = {
+            'name': PARAMETER_NAMES[param_id],
+            'min': float(values.min()) if count else None,
+            'mean': round(float(values.mean()), 4) if count else None,
+            'max': float(values.max()) if count else None
+        }
+
+    return {
+        'rows': samples['rows'],
+        'assessed': count,
+        'invalid': samples['error_count'],
+        'rules_version': rules.version,
+        'micro_ratings': dict(zip(rules.grades, grade_counts.tolist())),
+        'physico_ratings': {'OK': physico_ok, 'FAIL': count - physico_ok},
+        'ratings': {
+            key: {'title': RATING_CLASSIFICATIONS[key]['title'], 'count': value}
+            for key, value in ratings.items()
+        },
+        'compliance_rate': round(physico_ok / count, 4) if count else None,
+        'violations': violations,
+        'allowed_crops': crops,
+        'parameters': statistics
+    }
+
+RESULT_COLUMNS = (
+    ('line',) + LABEL_COLUMNS + PARAMETERS
+    + ('micro_rating', 'physico_rating', 'rating', 'allowed_crops', 'restrictions', 'violations')
+)
+
+def iter_results(samples, assessment, start=0, stop=None):
+    """
+    Yield the per-sample results as dicts (keys of RESULT_COLUMNS).
+
+    Only the yielded samples are converted back to Python objects, so a page
+    of a large batch costs the same as a small batch.
+    """
+    rules = assessment['rules']
+    stop = len(assessment['outcome']) if stop is None else min(stop, len(assessment['outcome']))
+    columns = [samples['columns'][param_id][start:stop].tolist() for param_id in PARAMETERS]
+    masks = assessment['failed'][start:stop].tolist()
+    outcomes = assessment['outcome'][start:stop].tolist()
+    lines = samples['lines'][start:stop].tolist()
+    labels = {label: samples['labels'].get(label, [])[start:stop] for label in LABEL_COLUMNS}
+
+    for offset in range(stop - start):
+        values = [column[offset] for column in columns]
+        outcome = rules.outcomes[outcomes[offset]]
+        yield {
+            'line': lines[offset],
+            **{label: (column[offset] if column else None) for label, column in labels.items()},
+            **dict(zip(PARAMETERS, values)),
+            'micro_rating': outcome['micro_rating'],
+            'physico_rating': outcome['physico_rating'],
+            'rating': outcome['rating'],
+            'allowed_crops': outcome['allowed_crops'],
+            'restrictions': outcome['restrictions'],
+            'violations': rules.violations(values, masks[offset]) if masks[offset] else []
+        }
+
+def assess_file(stream, file_format):
+    """
+    Load and assess a laboratory result file.
+
+    Returns:
+        tuple: (samples as returned by load_samples, assessment arrays, summary dict)
+
+    Raises:
+        BatchFormatError: If the file cannot be read
+    """
+    samples = load_samples(stream, file_format)
+    assessment = assess_batch(samples['columns'])
+    return samples, assessment, summarize_batch(samples, assessment)
@@ -0,0 +1,390 @@
+"""
+Storage of water quality samples and their assessments, and trend queries.
+
+An assessment is computed once, when the sample is entered or uploaded, and
+stored with the rules version it used: results pages and PDF reports load it
+by id. Trend queries read the samples of one infrastructure (STEP) over a
+date range through the (infrastructure_id, sampled_at) index and reduce them
+to at most `points` values per series, so a chart over ten years costs the
+same payload as one over a month.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, cast, func, insert, select
+
+from models import db, Infrastructure, WaterQualitySample, WaterQualityAssessment
+from utils.water_quality import PARAMETERS, PARAMETER_METADATA, RATING_CLASSIFICATIONS
+
+# Infrastructure type of the treatment plants where samples are taken
+STEP_TYPE = "Station d'épuration"
+
+# Points returned per series
+DEFAULT_SERIES_POINTS = 200
+MAX_SERIES_POINTS = 2000
+
+# Rolling compliance window, in days
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 3660
+
+# Range of a trend query when no start is given
+DEFAULT_RANGE_DAYS = 365
+
+# Samples inserted per statement by store_batch
+STORE_CHUNK_SIZE = 2000
+
+# Accepted sampling dates (forms, query strings and laboratory files)
+DATE_FORMATS = (
+    '%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S',
+    '%d/%m/%Y', '%d/%m/%Y %H:%M', '%d-%m-%Y'
+)
+
+PARAMETER_INFO = {
+    param_id: info
+    for group in PARAMETER_METADATA.values()
+    for param_id, info in group['parameters'].items()
+}
+
+class WaterQualityStoreError(ValueError):
+    """Raised when a sample or a trend query is invalid"""
+
+def parse_sample_date(text):
+    """
+    Parse a sampling date in one of DATE_FORMATS.
+
+    Returns:
+        datetime: The parsed date, None when text is empty or not a date
+    """
+    text = (text or '').strip()
+    if not text:
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+def get_steps():
+    """
+    Get the treatment plants samples can be linked to.
+
+    Returns:
+        list: (id, name) tuples ordered by name
+    """
+    rows = db.session.execute(
+        select(Infrastructure.id, Infrastructure.nom)
+        .where(Infrastructure.type == STEP_TYPE)
+        .order_by(Infrastructure.nom)
+    ).all()
+    return [tuple(row) for row in rows]
+
+def _assessment_values(result, rules_version):
+    return {
+        'rules_version': rules_version,
+        'micro_rating': result['micro_rating'],
+        'physico_rating': result['physico_rating'],
+        'rating': result['rating'],
+        'allowed_crops': list(result['allowed_crops']),
+        'restrictions': list(result['restrictions']),
+        'violations': list(result['violations'])
+    }
+
+def record_assessment(result, infrastructure_id=None, sampled_at=None, reference=None, user_id=None):
+    """
+    Store a sample and its assessment.
+
+    Args:
+        result: Dictionary returned by assess_water_quality
+        infrastructure_id: Optional STEP where the sample was taken
+        sampled_at: Sampling date, now by default
+        reference: Optional laboratory reference
+        user_id: Optional author
+
+    Returns:
+        WaterQualityAssessment: The committed assessment
+    """
+    rating = next(key for key, info in RATING_CLASSIFICATIONS.items() if info is result['rating_info'])
+    sample = WaterQualitySample(
+        infrastructure_id=infrastructure_id,
+        sampled_at=sampled_at or datetime.now(),
+        reference=reference or None,
+        created_by=user_id,
+        **{param_id: float(result['parameters'][param_id]) for param_id in PARAMETERS}
+    )
+    sample.assessment = WaterQualityAssessment(**_assessment_values(dict(result, rating=rating), result['rules_version']))
+    db.session.add(sample)
+    db.session.commit()
+    return sample.assessment
+
+def store_batch(results, rules_version, infrastructure_id=None, user_id=None):
+    """
+    Store the samples of a batch and their assessments, a chunk of rows per statement.
+
+    Args:
+        results: Iterable of result dicts (keys of water_quality_batch.RESULT_COLUMNS)
+        rules_version: Version of the rules the batch was assessed with
+        infrastructure_id: Optional STEP of the samples
+        user_id: Optional author
+
+    Returns:
+        dict: 'stored' (samples stored) and 'undated' (samples without a readable
+              date, stored with the upload date)
+    """
+    now = datetime.now()
+    counts = {'stored': 0, 'undated': 0}
+    next_id = None
+
+    def flush(chunk):
+        nonlocal next_id
+        if next_id is None:
+            # The first insert takes SQLite's write lock until the commit, so
+            # the following samples can get the next ids without RETURNING
+            # (which SQLite can only return in order one row at a time)
+            sample, assessment = chunk.pop(0)
+            next_id = db.session.execute(insert(WaterQualitySample).returning(WaterQualitySample.id), sample).scalar_one()
+            db.session.execute(insert(WaterQualityAssessment), [dict(assessment, sample_id=next_id, created_at=now)])
+            next_id += 1
+            counts['stored'] += 1
+        if not chunk:
+            return
+        db.session.execute(insert(WaterQualitySample), [
+            dict(sample, id=next_id + offset) for offset, (sample, _) in enumerate(chunk)
+        ])
+        db.session.execute(insert(WaterQualityAssessment), [
+            dict(assessment, sample_id=next_id + offset, created_at=now)
+            for offset, (_, assessment) in enumerate(chunk)
+        ])
+        next_id += len(chunk)
+        counts['stored'] += len(chunk)
+
+    chunk = []
+    for result in results:
+        sampled_at = parse_sample_date(result.get('date'))
+        if sampled_at is None:
+            counts['undated'] += 1
+        chunk.append(({
+            'infrastructure_id': infrastructure_id,
+            'sampled_at': sampled_at or now,
+            'reference': (result.get('reference') or None),
+            'created_by': user_id,
+            'created_at': now,
+            **{param_id: result[param_id] for param_id in PARAMETERS}
+        }, _assessment_values(result, rules_version)))
+        if len(chunk) >= STORE_CHUNK_SIZE:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    db.session.commit()
+    return counts
+
+def assessment_result(assessment):
+    """
+    Build the result dictionary of a stored assessment, with the keys of
+    assess_water_quality plus the sample information.
+
+    Returns:
+        dict: Result for the results page and the PDF report
+    """
+    sample = assessment.sample
+    rating_info = RATING_CLASSIFICATIONS[assessment.rating]
+    return {
+        'general_rating': f"{rating_info['title']} - {rating_info['description']}",
+        'rating_info': rating_info,
+        'micro_rating': assessment.micro_rating,
+        'physico_rating': assessment.physico_rating,
+        'allowed_crops': list(assessment.allowed_crops),
+        'restrictions': list(assessment.restrictions),
+        'violations': list(assessment.violations),
+        'rules_version': assessment.rules_version,
+        'parameters': {param_id: getattr(sample, param_id) for param_id in PARAMETERS},
+        'assessment_id': assessment.id,
+        'reference': sample.reference,
+        'sampled_at': sample.sampled_at,
+        'infrastructure_id': sample.infrastructure_id,
+        'infrastructure_name': sample.infrastructure.nom if sample.infrastructure else None
+    }
+
+def parse_trend_range(args):
+    """
+    Read the start, end and points of a trend query from request arguments.
+
+    Returns:
+        tuple: (start, end, points), the last DEFAULT_RANGE_DAYS days by default
+
+    Raises:
+        WaterQualityStoreError: If a date or the number of points is invalid
+    """
+    end = parse_sample_date(args.get('end')) if args.get('end') else datetime.now()
+    if end is None:
+        raise WaterQualityStoreError(f"Date de fin invalide: '{args.get('end')}'")
+    if args.get('end') and len(args['end'].strip()) <= 10:
+        # A day given as the end includes that whole day
+        end += timedelta(days=1)
+    start = parse_sample_date(args.get('start')) if args.get('start') else end - timedelta(days=DEFAULT_RANGE_DAYS)
+    if start is None:
+        raise WaterQualityStoreError(f"Date de début invalide: '{args.get('start')}'")
+    if start >= end:
+        raise WaterQualityStoreError('La date de début doit précéder la date de fin')
+    try:
+        points = int(args.get('points', DEFAULT_SERIES_POINTS))
+    except ValueError:
+        raise WaterQualityStoreError(f"Nombre de points invalide: '{args.get('points')}'")
+    if not 1 <= points <= MAX_SERIES_POINTS:
+        raise WaterQualityStoreError(f'Le nombre de points doit être entre 1 et {MAX_SERIES_POINTS}')
+    return start, end, points
+
+def parameter_series(infrastructure_id, start, end, parameters=None, points=DEFAULT_SERIES_POINTS):
+    """
+    Per-parameter series of the samples of an infrastructure in [start, end).
+
+    When there are more samples than points, the range is cut into `points`
+    equal buckets and the database returns the min, mean and max of each bucket
+    with samples, so peaks stay visible once downsampled. Otherwise every sample
+    is a point.
+
+    Args:
+        infrastructure_id: ID of the infrastructure
+        start, end: Range of sampling dates
+        parameters: Parameter ids, all of them by default
+        points: Maximum number of points per series
+
+    Returns:
+        dict: 'samples', 'bucket_seconds' (None when not downsampled), 'timestamps',
+              'counts' (samples per point) and 'series' ({parameter: name, unit, min, mean, max})
+
+    Raises:
+        WaterQualityStoreError: If a parameter is unknown
+    """
+    parameters = list(parameters or PARAMETERS)
+    unknown = [param_id for param_id in parameters if param_id not in PARAMETER_INFO]
+    if unknown:
+        raise WaterQualityStoreError(f"Paramètres inconnus: {', '.join(unknown)}")
+
+    in_range = (
+        WaterQualitySample.infrastructure_id == infrastructure_id,
+        WaterQualitySample.sampled_at >= start,
+        WaterQualitySample.sampled_at < end
+    )
+    # Answered from the (infrastructure_id, sampled_at) index alone
+    sample_count = db.session.execute(select(func.count()).where(*in_range)).scalar()
+
+    columns = [getattr(WaterQualitySample, param_id) for param_id in parameters]
+    timestamps, counts = [], []
+    values = {param_id: {'min': [], 'mean': [], 'max': []} for param_id in parameters}
+    if sample_count <= points:
+        bucket_seconds = None
+        rows = db.session.execute(
+            select(WaterQualitySample.sampled_at, *columns).where(*in_range).order_by(WaterQualitySample.sampled_at)
+        ).all()
+        for row in rows:
+            timestamps.append(row[0].isoformat())
+            counts.append(1)
+            for param_id, value in zip(parameters, row[1:]):
+                for key in ('min', 'mean', 'max'):
+                    values[param_id][key].append(value)
+    else:
+        # Aggregated by the database, one row per bucket with samples
+        bucket_seconds = (end - start).total_seconds() / points
+        bucket = func.min(
+            cast((func.julianday(WaterQualitySample.sampled_at) - func.julianday(start)) * 86400 / bucket_seconds, Integer),
+            points - 1
+        ).label('bucket')
+        aggregates = []
+        for column in columns:
+            aggregates += [func.min(column), func.avg(column), func.max(column)]
+        rows = db.session.execute(
+            select(bucket, func.count(), *aggregates).where(*in_range).group_by(bucket).order_by(bucket)
+        ).all()
+        for row in rows:
+            timestamps.append((start + timedelta(seconds=row[0] * bucket_seconds)).isoformat())
+            counts.append(row[1])
+            for position, param_id in enumerate(parameters):
+                minimum, mean, maximum = row[2 + position * 3:5 + position * 3]
+                values[param_id]['min'].append(minimum)
+                values[param_id]['mean'].append(round(mean, 6))
+                values[param_id]['max'].append(maximum)
+
+    return {
+        'samples': sample_count,
+        'bucket_seconds': bucket_seconds,
+        'timestamps': timestamps,
+        'counts': counts,
+        'series': {
+            param_id: {
+                'name': PARAMETER_INFO[param_id]['name'],
+                'unit': PARAMETER_INFO[param_id]['unit'],
+                **values[param_id]
+            }
+            for param_id in parameters
+        }
+    }
+
+def compliance_series(infrastructure_id, start, end, window_days=DEFAULT_WINDOW_DAYS, points=DEFAULT_SERIES_POINTS):
+    """
+    Rolling compliance rates of the samples of an infrastructure.
+
+    `points` dates are spread evenly over (start, end]; at each date the rates
+    cover the samples of the previous `window_days` days. A sample complies
+    when no physico-chemical or toxic limit fails (physico rating 'OK'). The
+    samples are read once in date order and the window slides over them.
+
+    Returns:
+        dict: 'window_days', 'samples', 'timestamps', 'counts' (samples in each
+              window), 'compliance_rate' and the rate of each micro rating, None
+              where a window has no sample
+
+    Raises:
+        WaterQualityStoreError: If the window is out of range
+    """
+    if not 0 < window_days <= MAX_WINDOW_DAYS:
+        raise WaterQualityStoreError(f'La fenêtre doit être entre 1 et {MAX_WINDOW_DAYS} jours')
+    window = timedelta(days=window_days)
+
+    rows = db.session.execute(
+        select(WaterQualitySample.sampled_at, WaterQualityAssessment.physico_rating, WaterQualityAssessment.micro_rating)
+        .join(WaterQualityAssessment, WaterQualityAssessment.sample_id == WaterQualitySample.id)
+        .where(
+            WaterQualitySample.infrastructure_id == infrastructure_id,
+            WaterQualitySample.sampled_at >= start - window,
+            WaterQualitySample.sampled_at < end
+        )
+        .order_by(WaterQualitySample.sampled_at)
+    ).all()
+
+    grades = sorted({row.micro_rating for row in rows})
+    step = (end - start) / points
+    timestamps, counts, compliance = [], [], []
+    micro_rates = {grade: [] for grade in grades}
+
+    # Running counts of the samples inside the window [first, last)
+    first = last = 0
+    compliant = 0
+    grade_counts = dict.fromkeys(grades, 0)
+    for index in range(1, points + 1):
+        point = start + step * index
+        while last < len(rows) and rows[last].sampled_at < point:
+            compliant += rows[last].physico_rating == 'OK'
+            grade_counts[rows[last].micro_rating] += 1
+            last += 1
+        while first < last and rows[first].sampled_at < point - window:
+            compliant -= rows[first].physico_rating == 'OK'
+            grade_counts[rows[first].micro_rating] -= 1
+            first += 1
+
+        count = last - first
+        timestamps.append(point.isoformat())
+        counts.append(count)
+        compliance.append(round(compliant / count, 4) if count else None)
+        for grade in grades:
+            micro_rates[grade].append(round(grade_counts[grade] / count, 4) if count else None)
+
+    return {
+        'window_days': window_days,
+        'samples': sum(1 for row in rows if row.sampled_at >= start),
+        'timestamps': timestamps,
+        'counts': counts,
+        'compliance_rate': compliance,
+        'micro_ratings': micro_rates
+    }